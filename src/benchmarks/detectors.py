@@ -0,0 +1,126 @@
+"""
+Compare detector backends on bundled sample set, single process, e.g.:
+
+    $ python -m benchmarks.detectors --backends haar dnn --repeat 20 --output-format jpeg
+"""
+import argparse
+import os
+import time
+from typing import Dict, List
+
+from face_consumer.backends import DetectorParams, get_detector_backend_cls
+from face_consumer.engine import detect_faces, detector_engine
+from face_utils import constants
+from face_utils.images import OutputEncoding, resolve_output_encoding
+
+
+SAMPLE_DATA_DIR = os.path.join(os.path.dirname(__file__), "..", "tests", "data")
+# filename -> faces on image
+SAMPLE_SET = {
+    "face.png": 1,
+    "no_face.png": 0,
+}
+
+
+def _load_sample_set(data_dir: str) -> Dict[str, bytes]:
+    sample_contents = {}
+    for filename in SAMPLE_SET:
+        with open(os.path.join(data_dir, filename), "rb") as file:
+            sample_contents[filename] = file.read()
+
+    return sample_contents
+
+
+def benchmark_backend(
+    backend_type: constants.DetectorBackendType,
+    params: DetectorParams,
+    sample_contents: Dict[str, bytes],
+    repeat: int,
+    batch_size: int,
+    encoding: OutputEncoding,
+) -> Dict:
+    backend = get_detector_backend_cls(backend_type=backend_type)(params=params)
+    filenames = list(sample_contents.keys()) * repeat
+    contents = [sample_contents[filename] for filename in filenames]
+
+    results = []
+    start = time.perf_counter()
+    for batch_start in range(0, len(contents), batch_size):
+        results.extend(
+            detect_faces(
+                backend=backend,
+                origin_contents=contents[batch_start : batch_start + batch_size],
+                encoding=encoding,
+                params=params,
+            )
+        )
+    duration = time.perf_counter() - start
+
+    # without boxes ground truth count matched faces up to expected count
+    expected, found, extra = 0, 0, 0
+    for filename, result in zip(filenames, results):
+        detected = len(result.faces_coordinates)
+        expected += SAMPLE_SET[filename]
+        found += min(detected, SAMPLE_SET[filename])
+        extra += max(detected - SAMPLE_SET[filename], 0)
+
+    return {
+        "backend": backend_type.value,
+        "images": len(contents),
+        "images_per_sec": len(contents) / duration,
+        "recall": found / expected if expected else 1.0,
+        "extra_faces": extra,
+    }
+
+
+def main(args: List[str] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--backends",
+        nargs="+",
+        default=[backend_type.value for backend_type in constants.DetectorBackendType],
+    )
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--data-dir", default=SAMPLE_DATA_DIR)
+    parser.add_argument(
+        "--output-format",
+        default=None,
+        choices=[output_format.value for output_format in constants.ImageOutputFormat],
+    )
+    parser.add_argument("--quality", type=int, default=None)
+    parsed_args = parser.parse_args(args)
+
+    # encoding of annotated images is part of measured time
+    encoding = resolve_output_encoding(
+        origin_filename=next(iter(SAMPLE_SET)),
+        output_format=parsed_args.output_format,
+        quality=parsed_args.quality,
+    )
+
+    sample_contents = _load_sample_set(data_dir=parsed_args.data_dir)
+    print(f"{'backend':<10}{'images':>8}{'img/s':>10}{'recall':>8}{'extra':>7}")
+    for backend_name in parsed_args.backends:
+        backend_type = constants.DetectorBackendType(backend_name)
+        try:
+            stats = benchmark_backend(
+                backend_type=backend_type,
+                params=detector_engine.params,
+                sample_contents=sample_contents,
+                repeat=parsed_args.repeat,
+                batch_size=parsed_args.batch_size,
+                encoding=encoding,
+            )
+        except ValueError as exc:
+            print(f"{backend_name:<10} skipped: {exc}")
+            continue
+
+        print(
+            f"{stats['backend']:<10}{stats['images']:>8}"
+            f"{stats['images_per_sec']:>10.1f}{stats['recall']:>8.2f}"
+            f"{stats['extra_faces']:>7}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,262 @@
+"""
+End-to-end throughput of POST /image -> process stream -> run_consumers ->
+GET /jobs/{id}, in one process against fakeredis and sqlite stand-ins, e.g.:
+
+    $ python -m benchmarks.e2e --jobs 200 --concurrency 16 --data-dir ./images
+
+Backend app and consumers share one event loop, detector workers are real
+processes. Numbers are for comparing revisions on the same machine, not for
+sizing the fleet against postgres and redis.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+from typing import Dict, List, Tuple
+
+
+SAMPLE_DATA_DIR = os.path.join(os.path.dirname(__file__), "..", "tests", "data")
+IMAGE_CONTENT_TYPES = {
+    ".png": "image/png",
+    ".jpg": "image/jpeg",
+    ".jpeg": "image/jpeg",
+    ".webp": "image/webp",
+}
+JOB_WAIT_SECONDS = 30
+
+
+def _setup_env(work_dir: str, result_cache: bool) -> None:
+    # settings and redis pools are created on import of face_* modules
+    env = {
+        "POSTGRES_DB": "unused",
+        "POSTGRES_HOST": "unused",
+        "POSTGRES_PORT": "0",
+        "POSTGRES_USER": "unused",
+        "POSTGRES_PASSWORD": "unused",
+        "REDIS_HOST": "unused",
+        "REDIS_PORT": "0",
+        "STATIC_DIR": "localhost/static",
+        "DIR_BUCKET_FILES_DIR": os.path.join(work_dir, "files"),
+        "DATABASE_URL": f"sqlite://{os.path.join(work_dir, 'db.sqlite3')}",
+        "CONSUMER_METRICS_PORT": "0",
+        # identical uploads would be finished by backend without consumers
+        "RESULT_CACHE_TTL": "3600" if result_cache else "0",
+    }
+    os.environ.update(env)
+
+    import fakeredis
+    from fakeredis.aioredis import FakeConnection
+    from redis.asyncio import ConnectionPool
+
+    import face_utils.db
+
+    redis_server = fakeredis.FakeServer()
+    face_utils.db.get_redis_pool = lambda: ConnectionPool(
+        connection_class=FakeConnection, server=redis_server
+    )
+
+
+def _load_corpus(data_dir: str) -> List[Tuple[str, bytes, str]]:
+    corpus = []
+    for filename in sorted(os.listdir(data_dir)):
+        content_type = IMAGE_CONTENT_TYPES.get(os.path.splitext(filename)[1].lower())
+        if content_type is None:
+            continue
+
+        with open(os.path.join(data_dir, filename), "rb") as file:
+            corpus.append((filename, file.read(), content_type))
+
+    if not corpus:
+        raise ValueError(f"no images in {data_dir}")
+
+    return corpus
+
+
+async def _run_job(
+    client, image: Tuple[str, bytes, str], params: Dict
+) -> Tuple[float, str]:
+    from face_utils import constants
+
+    start = time.perf_counter()
+    response = await client.post("/image", files={"file": image}, params=params)
+    response.raise_for_status()
+    job_id = response.json()["id"]
+
+    while True:
+        response = await client.get(
+            f"/jobs/{job_id}", params={"wait": JOB_WAIT_SECONDS}
+        )
+        response.raise_for_status()
+        state = response.json()["state"]
+        if state != constants.ImageFaceJobState.PENDING.value:
+            return time.perf_counter() - start, state
+
+
+async def _run_jobs(
+    client,
+    corpus: List[Tuple[str, bytes, str]],
+    jobs: int,
+    concurrency: int,
+    params: Dict,
+) -> List[Tuple[float, str]]:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run_limited(job_i: int) -> Tuple[float, str]:
+        async with semaphore:
+            return await _run_job(
+                client=client, image=corpus[job_i % len(corpus)], params=params
+            )
+
+    return await asyncio.gather(*(run_limited(job_i) for job_i in range(jobs)))
+
+
+def _get_stage_stats() -> Dict[str, Tuple[int, float]]:
+    from face_utils.metrics import STAGE_DURATION
+
+    sums, counts = {}, {}
+    for metric in STAGE_DURATION.collect():
+        for sample in metric.samples:
+            stage = sample.labels.get("stage")
+            if sample.name.endswith("_sum"):
+                sums[stage] = sample.value
+            elif sample.name.endswith("_count"):
+                counts[stage] = int(sample.value)
+
+    return {stage: (count, sums.get(stage, 0.0)) for stage, count in counts.items()}
+
+
+def _diff_stage_stats(
+    before: Dict[str, Tuple[int, float]], after: Dict[str, Tuple[int, float]]
+) -> Dict[str, Tuple[int, float]]:
+    stage_stats = {}
+    for stage, (count, total) in after.items():
+        before_count, before_total = before.get(stage, (0, 0.0))
+        if count > before_count:
+            stage_stats[stage] = (count - before_count, total - before_total)
+
+    return stage_stats
+
+
+def _print_report(
+    results: List[Tuple[float, str]],
+    duration: float,
+    stage_stats: Dict[str, Tuple[int, float]],
+) -> None:
+    latencies = sorted(latency for latency, _ in results)
+    percentiles = statistics.quantiles(latencies, n=100, method="inclusive")
+    states = {}
+    for _, state in results:
+        states[state] = states.get(state, 0) + 1
+    # worker stage is observed per image, detector tasks carry batches
+    detected_count = stage_stats.get("detect", (0, 0.0))[0]
+
+    print(f"jobs          {len(results)} {states}")
+    print(f"duration      {duration:.2f}s")
+    print(f"jobs/s        {len(results) / duration:.1f}")
+    print(f"consumer img/s {detected_count / duration:.1f}")
+    print(
+        f"latency ms    p50 {percentiles[49] * 1000:.1f}"
+        f"  p95 {percentiles[94] * 1000:.1f}"
+        f"  p99 {percentiles[98] * 1000:.1f}"
+        f"  max {latencies[-1] * 1000:.1f}"
+    )
+    print(f"{'stage':<20}{'count':>8}{'mean ms':>10}{'total s':>10}")
+    for stage, (count, total) in sorted(
+        stage_stats.items(), key=lambda item: item[1][1], reverse=True
+    ):
+        print(f"{stage:<20}{count:>8}{total / count * 1000:>10.2f}{total:>10.2f}")
+
+
+async def run_benchmark(
+    corpus: List[Tuple[str, bytes, str]],
+    jobs: int,
+    warmup: int,
+    concurrency: int,
+    params: Dict,
+) -> None:
+    import httpx
+
+    from face_backend.main import app
+    from face_consumer.consumer import run_consumers
+
+    async with app.router.lifespan_context(app):
+        consumers_task = asyncio.create_task(run_consumers())
+        try:
+            async with httpx.AsyncClient(
+                transport=httpx.ASGITransport(app=app),
+                base_url="http://benchmark",
+                timeout=JOB_WAIT_SECONDS * 2,
+            ) as client:
+                # detector pool start and first db/stream round trips
+                await _run_jobs(
+                    client=client,
+                    corpus=corpus,
+                    jobs=warmup,
+                    concurrency=concurrency,
+                    params=params,
+                )
+
+                stage_stats = _get_stage_stats()
+                start = time.perf_counter()
+                results = await _run_jobs(
+                    client=client,
+                    corpus=corpus,
+                    jobs=jobs,
+                    concurrency=concurrency,
+                    params=params,
+                )
+                duration = time.perf_counter() - start
+        finally:
+            consumers_task.cancel()
+            await asyncio.gather(consumers_task, return_exceptions=True)
+
+    _print_report(
+        results=results,
+        duration=duration,
+        stage_stats=_diff_stage_stats(before=stage_stats, after=_get_stage_stats()),
+    )
+
+
+def main(args: List[str] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--jobs", type=int, default=100)
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--data-dir", default=SAMPLE_DATA_DIR)
+    parser.add_argument("--output-format", default=None)
+    parser.add_argument("--output", default=None, help="image or coordinates")
+    parser.add_argument("--priority", default=None, help="interactive or bulk")
+    parser.add_argument(
+        "--result-cache",
+        action="store_true",
+        help="reuse results of identical uploads, measures cache path",
+    )
+    parsed_args = parser.parse_args(args)
+
+    params = {
+        name: value
+        for name, value in (
+            ("output_format", parsed_args.output_format),
+            ("output", parsed_args.output),
+            ("priority", parsed_args.priority),
+        )
+        if value is not None
+    }
+
+    with tempfile.TemporaryDirectory(prefix="face_benchmark_") as work_dir:
+        _setup_env(work_dir=work_dir, result_cache=parsed_args.result_cache)
+        asyncio.run(
+            run_benchmark(
+                corpus=_load_corpus(data_dir=parsed_args.data_dir),
+                jobs=parsed_args.jobs,
+                warmup=parsed_args.warmup,
+                concurrency=parsed_args.concurrency,
+                params=params,
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+Compare upload write throughput of DirBucketStorage.save_file against
+previous 1 KiB aiofiles loop, in temporary directory, e.g.:
+
+    $ python -m benchmarks.storage --size-mb 10 --files 20 --chunk-size-kb 1024
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+import uuid
+from typing import Awaitable, Callable, Dict, List
+
+import aiofiles
+from fastapi import UploadFile
+
+from face_utils.storage import DirBucketStorage
+
+
+BUCKET_NAME = "benchmark"
+
+
+async def _legacy_save_file(
+    storage: DirBucketStorage, file: UploadFile, bucket_name: str
+) -> str:
+    # save_file before large chunk writes, kept here as baseline
+    save_path = storage._get_save_path(bucket_name=bucket_name)
+    filename = f"{uuid.uuid4()}.png"
+    if not os.path.exists(save_path):
+        os.makedirs(save_path, exist_ok=True)
+
+    async with aiofiles.open(f"{save_path}/{filename}", "wb") as out_file:
+        while content := await file.read(1024):
+            await out_file.write(content)
+
+    return filename
+
+
+def _build_upload_files(content: bytes, files_count: int) -> List[UploadFile]:
+    upload_files = []
+    for _ in range(files_count):
+        file = tempfile.SpooledTemporaryFile(max_size=1024 * 1024)
+        file.write(content)
+        file.seek(0)
+        upload_files.append(UploadFile(file=file, filename="upload.png"))
+
+    return upload_files
+
+
+async def benchmark_save(
+    name: str,
+    save: Callable[[UploadFile], Awaitable[str]],
+    content: bytes,
+    files_count: int,
+) -> Dict:
+    upload_files = _build_upload_files(content=content, files_count=files_count)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(save(upload_file) for upload_file in upload_files))
+    duration = time.perf_counter() - start
+
+    for upload_file in upload_files:
+        await upload_file.close()
+
+    return {
+        "name": name,
+        "files": files_count,
+        "mb_per_sec": len(content) * files_count / duration / 1024 / 1024,
+        "files_per_sec": files_count / duration,
+    }
+
+
+async def run(size_mb: float, files_count: int, chunk_size: int, fsync: bool) -> None:
+    content = os.urandom(int(size_mb * 1024 * 1024))
+    with tempfile.TemporaryDirectory() as storage_dir:
+        storage = DirBucketStorage(chunk_size=chunk_size, fsync=fsync)
+        storage.STORAGE_DIR = storage_dir
+        storage.create_buckets(bucket_names=(BUCKET_NAME,))
+
+        cases = (
+            (
+                "legacy",
+                lambda file: _legacy_save_file(
+                    storage=storage, file=file, bucket_name=BUCKET_NAME
+                ),
+            ),
+            (
+                "save_file",
+                lambda file: storage.save_file(file=file, bucket_name=BUCKET_NAME),
+            ),
+        )
+        print(f"{'writer':<12}{'files':>7}{'MB/s':>10}{'files/s':>10}")
+        for name, save in cases:
+            stats = await benchmark_save(
+                name=name, save=save, content=content, files_count=files_count
+            )
+            print(
+                f"{stats['name']:<12}{stats['files']:>7}"
+                f"{stats['mb_per_sec']:>10.1f}{stats['files_per_sec']:>10.1f}"
+            )
+
+
+def main(args: List[str] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--size-mb", type=float, default=10)
+    parser.add_argument("--files", type=int, default=20)
+    parser.add_argument("--chunk-size-kb", type=int, default=1024)
+    parser.add_argument("--fsync", action="store_true")
+    parsed_args = parser.parse_args(args)
+
+    asyncio.run(
+        run(
+            size_mb=parsed_args.size_mb,
+            files_count=parsed_args.files,
+            chunk_size=parsed_args.chunk_size_kb * 1024,
+            fsync=parsed_args.fsync,
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+import asyncio
+import logging
+import math
+import time
+from typing import Dict, Optional
+
+import redis.asyncio as redis
+
+from face_backend.pool import APP_REDIS_POOL
+from face_utils import constants
+from face_utils.exceptions import OverloadException, RateLimitException
+from face_utils.metrics import ADMISSION_REJECTED_TOTAL
+from face_utils.settings import SETTINGS
+from face_utils.streams import (
+    RedisStreamWorker,
+    get_group_backlog,
+    get_job_stream_names,
+)
+
+
+logger = logging.getLogger(__name__)
+
+
+# refill by elapsed time and take cost in one round trip, atomic across backends
+TOKEN_BUCKET_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local now_ms = tonumber(ARGV[3])
+local cost = tonumber(ARGV[4])
+
+local bucket = redis.call("HMGET", KEYS[1], "tokens", "ts")
+local tokens = tonumber(bucket[1]) or burst
+local ts = tonumber(bucket[2]) or now_ms
+tokens = math.min(burst, tokens + math.max(now_ms - ts, 0) * rate / 1000)
+
+-- batch bigger than burst needs full bucket and leaves it in debt, long run rate holds
+local required = math.min(cost, burst)
+local retry_after_ms = 0
+if tokens >= required then
+    tokens = tokens - cost
+else
+    retry_after_ms = math.ceil((required - tokens) * 1000 / rate)
+end
+
+redis.call("HSET", KEYS[1], "tokens", tostring(tokens), "ts", now_ms)
+-- key lives until bucket is full again, expired debt would be forgiven
+redis.call("PEXPIRE", KEYS[1], math.ceil((burst - tokens) * 1000 / rate) + 1000)
+return retry_after_ms
+"""
+
+
+class StreamBacklogMonitor:
+    # cached group backlog, stale value is refreshed in background, uploads never wait
+
+    def __init__(
+        self, stream_worker: RedisStreamWorker, refresh_interval: float
+    ) -> None:
+        self._stream_worker = stream_worker
+        self._refresh_interval = refresh_interval
+        self._backlog: Optional[int] = None
+        self._refreshed_at: Optional[float] = None
+        self._refresh_task: Optional[asyncio.Task] = None
+
+    async def _refresh(self) -> None:
+        try:
+            stream_stats = await self._stream_worker.get_stream_stats()
+            self._backlog = get_group_backlog(
+                stream_stats=stream_stats, group_name=self._stream_worker.group_name
+            )
+        except Exception:  # type: ignore
+            # keep last value, admission must not fail uploads on stats error
+            logger.exception(
+                "stream %s backlog refresh error", self._stream_worker.stream_name
+            )
+        finally:
+            self._refreshed_at = time.monotonic()
+
+    def get_backlog(self) -> Optional[int]:
+        is_stale = (
+            self._refreshed_at is None
+            or time.monotonic() - self._refreshed_at > self._refresh_interval
+        )
+        if is_stale and (self._refresh_task is None or self._refresh_task.done()):
+            self._refresh_task = asyncio.create_task(self._refresh())
+
+        return self._backlog
+
+
+class RedisTokenBucket:
+    KEY_PREFIX = "rate_limit"
+
+    def __init__(self, conn: redis.Redis, rate: float, burst: int) -> None:
+        self._conn = conn
+        self._rate = rate
+        self._burst = burst
+        self._script = conn.register_script(TOKEN_BUCKET_SCRIPT)
+
+    async def acquire(self, key: str, cost: int = 1) -> float:
+        # seconds to wait before retry, 0 - acquired
+        if not self.is_enabled:
+            return 0
+
+        retry_after_ms = await self._script(
+            keys=[f"{self.KEY_PREFIX}:{key}"],
+            args=[self._rate, self._burst, int(time.time() * 1000), cost],
+        )
+
+        return int(retry_after_ms) / 1000
+
+    @property
+    def is_enabled(self) -> bool:
+        return self._rate > 0
+
+
+class AdmissionController:
+    def __init__(
+        self,
+        backlog_monitors: Dict[constants.JobPriority, StreamBacklogMonitor],
+        rate_limiter: RedisTokenBucket,
+        max_backlog: int,
+        retry_after: int,
+    ) -> None:
+        # per lane, full bulk lane does not reject interactive uploads
+        self._backlog_monitors = backlog_monitors
+        self._rate_limiter = rate_limiter
+        self._max_backlog = max_backlog
+        self._retry_after = retry_after
+
+    async def admit(
+        self,
+        client_id: Optional[str],
+        cost: int = 1,
+        priority: constants.JobPriority = constants.JobPriority.INTERACTIVE,
+    ) -> None:
+        if self._max_backlog:
+            backlog = self._backlog_monitors[priority].get_backlog()
+            if backlog is not None and backlog >= self._max_backlog:
+                ADMISSION_REJECTED_TOTAL.labels(reason="overload").inc()
+                raise OverloadException(
+                    msg="too many pending jobs, retry later",
+                    retry_after=self._retry_after,
+                )
+
+        if client_id is None:
+            return
+
+        retry_after = await self._rate_limiter.acquire(key=client_id, cost=cost)
+        if retry_after:
+            ADMISSION_REJECTED_TOTAL.labels(reason="rate_limit").inc()
+            raise RateLimitException(
+                msg="rate limit exceeded", retry_after=math.ceil(retry_after)
+            )
+
+
+admission_controller = AdmissionController(
+    backlog_monitors={
+        priority: StreamBacklogMonitor(
+            stream_worker=RedisStreamWorker(
+                conn=redis.Redis.from_pool(APP_REDIS_POOL),
+                stream_name=stream_name,
+                group_name=SETTINGS.stream_group_name,
+            ),
+            refresh_interval=SETTINGS.admission_backlog_refresh_interval,
+        )
+        for priority, stream_name in get_job_stream_names().items()
+    },
+    rate_limiter=RedisTokenBucket(
+        conn=redis.Redis.from_pool(APP_REDIS_POOL),
+        rate=SETTINGS.rate_limit_per_second,
+        burst=SETTINGS.rate_limit_burst,
+    ),
+    max_backlog=SETTINGS.admission_max_backlog,
+    retry_after=SETTINGS.admission_retry_after,
+)
@@ -0,0 +1,75 @@
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from face_utils import constants
+from face_utils.entites import ImageFaceJobEntity
+from face_utils.settings import SETTINGS
+
+
+class JobEntityCache:
+    # lru of jobs, pending ones are dropped on hub event and expire after short ttl
+
+    def __init__(self, max_size: int, pending_ttl: float) -> None:
+        self._max_size = max_size
+        self._pending_ttl = pending_ttl
+        # job_id -> (entity, expires_at monotonic, None - never)
+        self._entries: "OrderedDict[str, Tuple[ImageFaceJobEntity, Optional[float]]]" = (
+            OrderedDict()
+        )
+        self._hits = 0
+        self._misses = 0
+
+    def get(self, job_id: str) -> Optional[ImageFaceJobEntity]:
+        entry = self._entries.get(job_id)
+        if entry is None:
+            self._misses += 1
+            return None
+
+        image_face_job, expires_at = entry
+        if expires_at is not None and expires_at < time.monotonic():
+            del self._entries[job_id]
+            self._misses += 1
+            return None
+
+        self._entries.move_to_end(job_id)
+        self._hits += 1
+        return image_face_job
+
+    def put(self, image_face_job: ImageFaceJobEntity) -> None:
+        if self._max_size <= 0:
+            return
+
+        expires_at = None
+        if image_face_job.state == constants.ImageFaceJobState.PENDING:
+            expires_at = time.monotonic() + self._pending_ttl
+
+        job_id = str(image_face_job.id)
+        self._entries[job_id] = (image_face_job, expires_at)
+        self._entries.move_to_end(job_id)
+        while len(self._entries) > self._max_size:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, job_id: str) -> None:
+        self._entries.pop(job_id, None)
+
+    def handle_job_event(self, data: Dict) -> None:
+        job_id = data.get("job_id")
+        if job_id:
+            self.invalidate(job_id=job_id)
+
+    @property
+    def stats(self) -> Dict:
+        lookups = self._hits + self._misses
+        return {
+            "size": len(self._entries),
+            "max_size": self._max_size,
+            "hits": self._hits,
+            "misses": self._misses,
+            "hit_ratio": self._hits / lookups if lookups else 0.0,
+        }
+
+
+job_entity_cache = JobEntityCache(
+    max_size=SETTINGS.job_cache_max_size, pending_ttl=SETTINGS.job_cache_pending_ttl
+)
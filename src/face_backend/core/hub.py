@@ -0,0 +1,240 @@
+import asyncio
+import logging
+from collections import defaultdict
+from typing import Callable, Dict, Iterable, List, Optional, Set
+
+import redis.asyncio as redis
+
+from face_backend.pool import APP_REDIS_POOL
+from face_utils.settings import SETTINGS
+from face_utils.streams import RedisStreamHandler, get_stream_trim_policy
+
+
+logger = logging.getLogger(__name__)
+
+
+class Subscription:
+    def __init__(self, buffer_size: int) -> None:
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=buffer_size)
+        self._is_dropped = False
+        self._is_filtered = False
+        self.job_ids: Set[str] = set()
+        self.tags: Set[str] = set()
+
+    def push(self, data: Dict) -> bool:
+        if self._is_dropped:
+            return False
+
+        try:
+            self._queue.put_nowait(data)
+        except asyncio.QueueFull:
+            self.drop()
+            return False
+
+        return True
+
+    def drop(self) -> None:
+        # slow consumer - free buffered msgs and wake up reader with None
+        self._is_dropped = True
+        while not self._queue.empty():
+            self._queue.get_nowait()
+        self._queue.put_nowait(None)
+
+    async def get(self) -> Optional[Dict]:
+        return await self._queue.get()
+
+    def set_filtered(self) -> None:
+        self._is_filtered = True
+
+    @property
+    def is_dropped(self) -> bool:
+        return self._is_dropped
+
+    @property
+    def is_filtered(self) -> bool:
+        # not filtered subscriptions receive every msg from stream
+        return self._is_filtered
+
+
+class StreamBroadcastHub:
+    def __init__(
+        self,
+        stream_handler: RedisStreamHandler,
+        read_count: int,
+        block_ms: int,
+        buffer_size: int,
+    ) -> None:
+        self._stream_handler = stream_handler
+        self._read_count = read_count
+        self._block_ms = block_ms
+        self._buffer_size = buffer_size
+        self._subscriptions: Set[Subscription] = set()
+        self._job_subscriptions: Dict[str, Set[Subscription]] = defaultdict(set)
+        self._tag_subscriptions: Dict[str, Set[Subscription]] = defaultdict(set)
+        self._listeners: List[Callable[[Dict], None]] = []
+        self._task: Optional[asyncio.Task] = None
+        self._lock = asyncio.Lock()
+
+    def _get_receivers(self, data: Dict) -> Set[Subscription]:
+        receivers = {
+            subscription
+            for subscription in self._subscriptions
+            if not subscription.is_filtered
+        }
+        receivers.update(self._job_subscriptions.get(data.get("job_id"), ()))
+        receivers.update(self._tag_subscriptions.get(data.get("client_tag"), ()))
+
+        return receivers
+
+    def _broadcast(self, data: Dict) -> None:
+        # listeners first, woken subscribers already see their effects
+        for listener in self._listeners:
+            listener(data)
+
+        for subscription in self._get_receivers(data=data):
+            if not subscription.push(data):
+                logger.warning("dropping slow ws subscriber")
+                self.unsubscribe(subscription=subscription)
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                msgs = await self._stream_handler.read_batch(
+                    count=self._read_count, block=self._block_ms
+                )
+            except asyncio.CancelledError:
+                raise
+            except Exception:  # type: ignore
+                logger.exception("ws hub stream read error")
+                await asyncio.sleep(1)
+                continue
+
+            for _, data in msgs:
+                self._broadcast(data=data)
+
+    async def start(self) -> None:
+        async with self._lock:
+            if self._task is not None and not self._task.done():
+                return
+
+            await self._stream_handler.seek_to_latest()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+        for subscription in list(self._subscriptions):
+            subscription.drop()
+            self.unsubscribe(subscription=subscription)
+
+    def reset(self) -> None:
+        # forget reader and subscriptions left in closed event loop, nothing to cancel
+        self._task = None
+        self._lock = asyncio.Lock()
+        self._subscriptions.clear()
+        self._job_subscriptions.clear()
+        self._tag_subscriptions.clear()
+
+    async def subscribe(
+        self, job_ids: Iterable[str] = (), tags: Iterable[str] = ()
+    ) -> Subscription:
+        await self.start()
+
+        subscription = Subscription(buffer_size=self._buffer_size)
+        self._subscriptions.add(subscription)
+        if job_ids or tags:
+            self.follow(subscription=subscription, job_ids=job_ids, tags=tags)
+
+        return subscription
+
+    @staticmethod
+    def _discard_from_index(
+        index: Dict[str, Set[Subscription]],
+        keys: Iterable[str],
+        subscription: Subscription,
+    ) -> None:
+        for key in keys:
+            subscriptions = index.get(key)
+            if subscriptions is None:
+                continue
+
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                del index[key]
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        self._subscriptions.discard(subscription)
+        self.unfollow(subscription=subscription, job_ids=subscription.job_ids)
+        self.unfollow(subscription=subscription, tags=subscription.tags)
+
+    def follow(
+        self,
+        subscription: Subscription,
+        job_ids: Iterable[str] = (),
+        tags: Iterable[str] = (),
+    ) -> None:
+        subscription.set_filtered()
+        for job_id in job_ids:
+            subscription.job_ids.add(job_id)
+            self._job_subscriptions[job_id].add(subscription)
+        for tag in tags:
+            subscription.tags.add(tag)
+            self._tag_subscriptions[tag].add(subscription)
+
+    def unfollow(
+        self,
+        subscription: Subscription,
+        job_ids: Iterable[str] = (),
+        tags: Iterable[str] = (),
+    ) -> None:
+        job_ids, tags = set(job_ids), set(tags)
+        subscription.job_ids.difference_update(job_ids)
+        subscription.tags.difference_update(tags)
+        self._discard_from_index(
+            index=self._job_subscriptions, keys=job_ids, subscription=subscription
+        )
+        self._discard_from_index(
+            index=self._tag_subscriptions, keys=tags, subscription=subscription
+        )
+
+    def add_listener(self, listener: Callable[[Dict], None]) -> None:
+        # sync callback for every stream msg, kept on reset
+        self._listeners.append(listener)
+
+    async def publish_many(self, data_list: List[Dict]) -> None:
+        # delivered to every backend instance through stream, not only local subscribers
+        if not data_list:
+            return
+
+        await self._stream_handler.write_many(data_list=data_list)
+
+    async def latest(self) -> Optional[Dict]:
+        latest = await self._stream_handler.read_latest()
+        if not latest:
+            return None
+
+        return latest[1]
+
+    @property
+    def subscriptions_count(self) -> int:
+        return len(self._subscriptions)
+
+
+ws_broadcast_hub = StreamBroadcastHub(
+    stream_handler=RedisStreamHandler(
+        conn=redis.Redis.from_pool(APP_REDIS_POOL),
+        stream_name=SETTINGS.ws_stream_name,
+        trim_policy=get_stream_trim_policy(max_len=SETTINGS.ws_stream_max_len),
+    ),
+    read_count=SETTINGS.ws_hub_read_count,
+    block_ms=SETTINGS.ws_hub_block_ms,
+    buffer_size=SETTINGS.ws_subscriber_buffer_size,
+)
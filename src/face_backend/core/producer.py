@@ -1,39 +1,68 @@
-from typing import Optional, Dict
+from typing import Optional, Dict, List
 
 import redis.asyncio as redis
 
 from face_backend.pool import APP_REDIS_POOL
+from face_utils import constants
 from face_utils.entites import ImageFaceJobEntity
 from face_utils.settings import SETTINGS
-from face_utils.streams import RedisStreamWorker
+from face_utils.streams import (
+    RedisStreamWorker,
+    StreamTrimPolicy,
+    get_job_stream_names,
+)
 
 
 PRODUCER_GROUP_NAME = "producer_group"
 
 
 class ImageFaceJobProducer:
-    def __init__(self, stream_worker: RedisStreamWorker) -> None:
-        self._stream_worker = stream_worker
+    def __init__(
+        self, stream_workers: Dict[constants.JobPriority, RedisStreamWorker]
+    ) -> None:
+        # one stream per priority lane
+        self._stream_workers = stream_workers
         self._job: Optional[ImageFaceJobEntity] = None
 
-    def _serialize_image_face_job(self) -> Dict:
-        return {"id": str(self.image_face_job.as_dict["id"])}
+    @staticmethod
+    def _serialize_image_face_job(image_face_job: ImageFaceJobEntity) -> Dict:
+        return {"id": str(image_face_job.id)}
+
+    def _get_stream_worker(
+        self, image_face_job: ImageFaceJobEntity
+    ) -> RedisStreamWorker:
+        priority = image_face_job.priority or constants.JobPriority.INTERACTIVE
+        return self._stream_workers[constants.JobPriority(priority)]
 
     async def produce(self, image_face_job: ImageFaceJobEntity) -> None:
         self._job = image_face_job
-        await self._stream_worker.push_to_stream(
-            data=self._serialize_image_face_job(),
+        await self._get_stream_worker(image_face_job=image_face_job).push_to_stream(
+            data=self._serialize_image_face_job(image_face_job=image_face_job),
         )
 
+    async def produce_many(self, image_face_jobs: List[ImageFaceJobEntity]) -> None:
+        lane_data_lists: Dict[RedisStreamWorker, List[Dict]] = {}
+        for image_face_job in image_face_jobs:
+            lane_data_lists.setdefault(
+                self._get_stream_worker(image_face_job=image_face_job), []
+            ).append(self._serialize_image_face_job(image_face_job=image_face_job))
+
+        for stream_worker, data_list in lane_data_lists.items():
+            await stream_worker.push_many_to_stream(data_list=data_list)
+
     @property
     def image_face_job(self) -> ImageFaceJobEntity:
         return self._job
 
 
 image_face_job_producer = ImageFaceJobProducer(
-    stream_worker=RedisStreamWorker(
-        group_name=PRODUCER_GROUP_NAME,
-        conn=redis.Redis.from_pool(APP_REDIS_POOL),
-        stream_name=SETTINGS.job_stream_name,
-    )
+    stream_workers={
+        priority: RedisStreamWorker(
+            group_name=PRODUCER_GROUP_NAME,
+            conn=redis.Redis.from_pool(APP_REDIS_POOL),
+            stream_name=stream_name,
+            trim_policy=StreamTrimPolicy(max_len=SETTINGS.job_stream_max_len),
+        )
+        for priority, stream_name in get_job_stream_names().items()
+    }
 )
@@ -0,0 +1,141 @@
+import mimetypes
+import os
+import re
+from typing import Optional, Tuple
+
+import anyio
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response
+from starlette.types import Receive, Scope, Send
+
+
+# processed files are never rewritten, new render always gets new filename
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+RANGE_REGEX = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def get_file_etag(filename: str) -> str:
+    return f'"{filename}"'
+
+
+def is_etag_matched(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+
+    # weak comparison, as required for If-None-Match
+    return etag in (
+        tag.strip().removeprefix("W/") for tag in if_none_match.split(",")
+    )
+
+
+def parse_range(range_header: str, size: int) -> Optional[Tuple[int, int]]:
+    # single range only, multi range gets whole file - allowed by RFC 9110
+    match = RANGE_REGEX.match(range_header.strip())
+    if not match:
+        return None
+
+    start, end = match.groups()
+    if not start and not end:
+        return None
+    if not start:
+        # suffix range, last n bytes
+        suffix_len = int(end)
+        if suffix_len == 0 or size == 0:
+            raise ValueError("unsatisfiable range")
+        return max(size - suffix_len, 0), size - 1
+
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start >= size or start > end:
+        raise ValueError("unsatisfiable range")
+
+    return start, end
+
+
+class ProcessedFileResponse(FileResponse):
+    # strong etag, immutable cache and single range, whole file is streamed by starlette
+
+    def __init__(
+        self,
+        path: str,
+        stat_result: os.stat_result,
+        etag: str,
+        request_headers: Headers,
+    ) -> None:
+        super().__init__(
+            path=path,
+            stat_result=stat_result,
+            media_type=mimetypes.guess_type(path)[0] or "application/octet-stream",
+            headers={
+                "etag": etag,
+                "cache-control": IMMUTABLE_CACHE_CONTROL,
+                "accept-ranges": "bytes",
+            },
+        )
+        self._range: Optional[Tuple[int, int]] = None
+
+        range_header = request_headers.get("range")
+        if_range = request_headers.get("if-range")
+        if not range_header or (if_range is not None and if_range != etag):
+            return
+
+        try:
+            self._range = parse_range(range_header=range_header, size=stat_result.st_size)
+        except ValueError:
+            self.status_code = 416
+            self.headers["content-range"] = f"bytes */{stat_result.st_size}"
+            self.headers["content-length"] = "0"
+            return
+
+        if self._range is not None:
+            start, end = self._range
+            self.status_code = 206
+            self.headers["content-range"] = f"bytes {start}-{end}/{stat_result.st_size}"
+            self.headers["content-length"] = str(end - start + 1)
+
+    async def _send_range(self, send: Send, start: int, end: int) -> None:
+        async with await anyio.open_file(self.path, mode="rb") as file:
+            await file.seek(start)
+            remaining = end - start + 1
+            while remaining > 0:
+                chunk = await file.read(min(self.chunk_size, remaining))
+                remaining -= len(chunk)
+                await send(
+                    {
+                        "type": "http.response.body",
+                        "body": chunk,
+                        "more_body": remaining > 0 and bool(chunk),
+                    }
+                )
+                if not chunk:
+                    return
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if self.status_code == 200:
+            await super().__call__(scope, receive, send)
+            return
+
+        await send(
+            {
+                "type": "http.response.start",
+                "status": self.status_code,
+                "headers": self.raw_headers,
+            }
+        )
+        if self.status_code == 206 and scope["method"].upper() != "HEAD":
+            await self._send_range(send=send, start=self._range[0], end=self._range[1])
+        else:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+        if self.background is not None:
+            await self.background()
+
+
+def get_not_modified_response(etag: str) -> Response:
+    return Response(
+        status_code=304,
+        headers={"etag": etag, "cache-control": IMMUTABLE_CACHE_CONTROL},
+    )
+
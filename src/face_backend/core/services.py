@@ -1,13 +1,36 @@
+import asyncio
 import datetime
+import os
 import re
 import uuid
+from typing import Dict, List, Optional, Tuple, Union
 
+import redis.asyncio as redis
 from fastapi import UploadFile
 
+from face_backend.core.admission import AdmissionController, admission_controller
+from face_backend.core.cache import JobEntityCache, job_entity_cache
+from face_backend.core.hub import StreamBroadcastHub, ws_broadcast_hub
 from face_backend.core.producer import ImageFaceJobProducer, image_face_job_producer
+from face_backend.pool import APP_REDIS_POOL
 from face_utils import constants
-from face_utils.entites import ImageFaceJobEntity
+from face_utils.cache import (
+    DetectionResultCache,
+    get_detector_fingerprint,
+    get_job_result_key,
+)
+from face_utils.entites import DetectionResultEntity, ImageFaceJobEntity
+from face_utils.events import serialize_job_event
 from face_utils.exceptions import JobException, ValidationException
+from face_utils.images import (
+    OutputEncoding,
+    get_job_faces,
+    get_job_output_encoding,
+    is_job_rendered_by_detector,
+    render_faces,
+    resolve_output_encoding,
+)
+from face_utils.metrics import JOBS_TOTAL, observe_stage
 from face_utils.repositories import (
     ImageFaceJobRepository,
     image_face_job_repository,
@@ -24,10 +47,20 @@ class ImageFaceJobService:
         job_producer: ImageFaceJobProducer,
         file_storage: DirBucketStorage,
         job_repository: ImageFaceJobRepository,
+        job_events_hub: StreamBroadcastHub,
+        result_cache: DetectionResultCache,
+        job_cache: JobEntityCache,
+        admission: AdmissionController,
     ) -> None:
         self._job_producer = job_producer
         self._file_storage = file_storage
         self._job_repository = job_repository
+        self._job_events_hub = job_events_hub
+        self._result_cache = result_cache
+        self._job_cache = job_cache
+        self._admission = admission
+        self._render_tasks: Dict[str, asyncio.Future] = {}
+        self._job_events_hub.add_listener(listener=self._job_cache.handle_job_event)
 
     def _validate_file(self, file: UploadFile) -> None:
         if not re.match(self.ACCEPTED_MIME_TYPE_REGEX, file.content_type):
@@ -35,8 +68,55 @@ class ImageFaceJobService:
                 msg="invalid file, not a image, or invalid content_type"
             )
 
-    async def get_job_processed_image(self, job_id: str) -> UploadFile:
-        face_job = await self._job_repository.get(obj_id=job_id)
+    @staticmethod
+    def _get_job_key(job_id: Union[str, uuid.UUID]) -> Optional[str]:
+        # canonical id of cache entries and job events
+        try:
+            return str(uuid.UUID(str(job_id)))
+        except ValueError:
+            return None
+
+    async def _get_job(self, job_id: Union[str, uuid.UUID]) -> ImageFaceJobEntity:
+        cache_key = self._get_job_key(job_id=job_id)
+        if cache_key is None:
+            # invalid id, repository raises proper error
+            return await self._job_repository.get(obj_id=job_id)
+
+        face_job = self._job_cache.get(job_id=cache_key)
+        if face_job is None:
+            face_job = await self._job_repository.get(obj_id=job_id)
+            self._job_cache.put(image_face_job=face_job)
+
+        return face_job
+
+    async def get_job(
+        self, job_id: Union[str, uuid.UUID], wait: float = 0
+    ) -> ImageFaceJobEntity:
+        job_key = self._get_job_key(job_id=job_id)
+        if not wait or job_key is None:
+            return await self._get_job(job_id=job_id)
+
+        # subscribe before read, finish event can not slip between read and wait
+        subscription = await self._job_events_hub.subscribe(job_ids=[job_key])
+        try:
+            face_job = await self._get_job(job_id=job_id)
+            if face_job.state != constants.ImageFaceJobState.PENDING:
+                return face_job
+
+            try:
+                await asyncio.wait_for(subscription.get(), timeout=wait)
+            except asyncio.TimeoutError:
+                return face_job
+        finally:
+            self._job_events_hub.unsubscribe(subscription=subscription)
+
+        return await self._get_job(job_id=job_id)
+
+    async def get_faces_stats(self, client_tag: Optional[str] = None) -> Dict:
+        return await self._job_repository.get_faces_stats(client_tag=client_tag)
+
+    async def get_job_processed_filename(self, job_id: str) -> str:
+        face_job = await self._get_job(job_id=job_id)
         if not face_job:
             raise JobException(msg="invalid job_id", is_critical=True)
 
@@ -46,23 +126,101 @@ class ImageFaceJobService:
         if face_job.state == constants.ImageFaceJobState.ERROR:
             raise JobException(msg="job error")
 
+        if not face_job.processed_filename and face_job.is_face_detected:
+            if not is_job_rendered_by_detector(image_face_job=face_job):
+                return await self._render_job_processed_image(face_job=face_job)
+
         if not face_job.processed_filename:
             raise JobException(msg="processed file not exist", is_critical=True)
 
-        return await self._file_storage.retrieve_file(
-            filename=face_job.processed_filename,
+        return face_job.processed_filename
+
+    def _render_processed_image(self, face_job: ImageFaceJobEntity) -> str:
+        encoding = get_job_output_encoding(image_face_job=face_job)
+        origin_content = self._file_storage.open_mmap(
+            filename=face_job.origin_filename,
+            bucket_name=SETTINGS.origin_images_bucket_name,
+        )
+        buffer = render_faces(
+            origin_content=origin_content,
+            faces=get_job_faces(image_face_job=face_job),
+            encoding=encoding,
+        )
+
+        return self._file_storage.write_bytes_sync(
+            data=buffer,
+            file_kind=encoding.extension,
             bucket_name=SETTINGS.processed_images_bucket_name,
         )
 
-    async def create_job_for_file(self, file: UploadFile) -> ImageFaceJobEntity:
-        self._validate_file(file=file)
+    async def _render_and_save_processed_image(
+        self, face_job: ImageFaceJobEntity
+    ) -> str:
+        try:
+            with observe_stage(stage="lazy_render"):
+                processed_filename = await asyncio.to_thread(
+                    self._render_processed_image, face_job
+                )
+        except ValueError as exc:
+            raise JobException(msg=str(exc), is_critical=True) from exc
 
-        origin_filename = await dir_bucket_storage.save_file(
-            file=file,
-            bucket_name=SETTINGS.origin_images_bucket_name,
+        face_job.processed_filename = processed_filename
+        # other backend instance may render same job, first stored file wins
+        is_updated = await self._job_repository.update(
+            obj=face_job,
+            update_fields=["processed_filename"],
+            expected_null_fields=["processed_filename"],
+        )
+        if not is_updated:
+            await self._file_storage.remove_file(
+                filename=processed_filename,
+                bucket_name=SETTINGS.processed_images_bucket_name,
+            )
+            face_job = await self._job_repository.get(obj_id=face_job.id)
+            self._job_cache.put(image_face_job=face_job)
+            return face_job.processed_filename
+
+        self._job_cache.put(image_face_job=face_job)
+        # invalidates cached entity without processed file on other instances
+        await self._job_events_hub.publish_many(
+            data_list=[serialize_job_event(image_face_job=face_job)]
         )
 
-        job = ImageFaceJobEntity(
+        return processed_filename
+
+    async def _render_job_processed_image(self, face_job: ImageFaceJobEntity) -> str:
+        # coordinates only job, concurrent first requests share one render
+        job_id = str(face_job.id)
+        render_task = self._render_tasks.get(job_id)
+        if render_task is None:
+            render_task = asyncio.ensure_future(
+                self._render_and_save_processed_image(face_job=face_job)
+            )
+            self._render_tasks[job_id] = render_task
+            render_task.add_done_callback(
+                lambda _: self._render_tasks.pop(job_id, None)
+            )
+
+        return await asyncio.shield(render_task)
+
+    async def get_processed_image_file(
+        self, processed_filename: str
+    ) -> Tuple[str, os.stat_result]:
+        return await self._file_storage.stat_file(
+            filename=processed_filename,
+            bucket_name=SETTINGS.processed_images_bucket_name,
+        )
+
+    @staticmethod
+    def _build_job(
+        origin_filename: str,
+        content_hash: str,
+        client_tag: Optional[str],
+        output_encoding: OutputEncoding,
+        output_mode: constants.JobOutputMode,
+        priority: constants.JobPriority,
+    ) -> ImageFaceJobEntity:
+        return ImageFaceJobEntity(
             id=uuid.uuid4(),
             is_face_detected=False,
             processed_filename=None,
@@ -70,17 +228,190 @@ class ImageFaceJobService:
             created_at=datetime.datetime.now(),
             modified_at=datetime.datetime.now(),
             state=constants.ImageFaceJobState.PENDING,
+            client_tag=client_tag,
+            content_hash=content_hash,
+            output_format=output_encoding.output_format,
+            output_quality=output_encoding.quality,
+            output_mode=output_mode,
+            priority=priority,
         )
 
-        await self._job_repository.save(obj=job)
+    @staticmethod
+    def _apply_cached_result(
+        job: ImageFaceJobEntity, result: DetectionResultEntity
+    ) -> None:
+        job.state = constants.ImageFaceJobState.FINISHED
+        job.is_face_detected = result.is_face_detected
+        job.coordinates = result.coordinates
+        job.processed_filename = result.processed_filename
 
-        await self._job_producer.produce(image_face_job=job)
+    @staticmethod
+    def _get_output_encodings(
+        files: List[UploadFile],
+        output_format: Optional[constants.ImageOutputFormat],
+        quality: Optional[int],
+    ) -> List[OutputEncoding]:
+        # resolved on upload, job keeps encoding even if deployment default changes
+        try:
+            return [
+                resolve_output_encoding(
+                    origin_filename=file.filename,
+                    output_format=output_format,
+                    quality=quality,
+                )
+                for file in files
+            ]
+        except ValueError as exc:
+            raise ValidationException(msg=str(exc)) from exc
 
-        return job
+    async def _create_jobs(
+        self,
+        origin_files: List[Tuple[str, str]],
+        output_encodings: List[OutputEncoding],
+        output_mode: constants.JobOutputMode,
+        priority: constants.JobPriority,
+        client_tag: Optional[str],
+    ) -> List[ImageFaceJobEntity]:
+        jobs = [
+            self._build_job(
+                origin_filename=origin_filename,
+                content_hash=content_hash,
+                client_tag=client_tag,
+                output_encoding=output_encoding,
+                output_mode=output_mode,
+                priority=priority,
+            )
+            for (origin_filename, content_hash), output_encoding in zip(
+                origin_files, output_encodings
+            )
+        ]
+
+        # resubmitted content is finished right away, never reaches process stream
+        result_keys = {job.id: get_job_result_key(image_face_job=job) for job in jobs}
+        with observe_stage(stage="result_cache_read"):
+            cached_results = await self._result_cache.get_many(
+                result_keys=result_keys.values()
+            )
+        for job in jobs:
+            if result_keys[job.id] in cached_results:
+                self._apply_cached_result(
+                    job=job, result=cached_results[result_keys[job.id]]
+                )
+                # consumer counts the rest, fleet sum stays exact
+                JOBS_TOTAL.labels(
+                    state=constants.ImageFaceJobState.FINISHED.value
+                ).inc()
+
+        with observe_stage(stage="job_save"):
+            await self._job_repository.bulk_save(objs=jobs)
+
+        pending_jobs = [
+            job for job in jobs if job.state == constants.ImageFaceJobState.PENDING
+        ]
+        for job in jobs:
+            self._job_cache.put(image_face_job=job)
+        if pending_jobs:
+            with observe_stage(stage="job_produce"):
+                await self._job_producer.produce_many(image_face_jobs=pending_jobs)
+
+        await self._job_events_hub.publish_many(
+            data_list=[
+                serialize_job_event(image_face_job=job)
+                for job in jobs
+                if job.state != constants.ImageFaceJobState.PENDING
+            ]
+        )
+
+        return jobs
+
+    async def create_job_for_file(
+        self,
+        file: UploadFile,
+        client_tag: Optional[str] = None,
+        output_format: Optional[constants.ImageOutputFormat] = None,
+        quality: Optional[int] = None,
+        output_mode: constants.JobOutputMode = constants.JobOutputMode.IMAGE,
+        priority: constants.JobPriority = constants.JobPriority.INTERACTIVE,
+        client_id: Optional[str] = None,
+    ) -> ImageFaceJobEntity:
+        self._validate_file(file=file)
+        output_encodings = self._get_output_encodings(
+            files=[file], output_format=output_format, quality=quality
+        )
+        # rejected before upload touches disk or stream
+        await self._admission.admit(client_id=client_id, priority=priority)
+
+        with observe_stage(stage="origin_save"):
+            origin_file = await self._file_storage.save_file_by_content(
+                file=file,
+                bucket_name=SETTINGS.origin_images_bucket_name,
+            )
+
+        jobs = await self._create_jobs(
+            origin_files=[origin_file],
+            output_encodings=output_encodings,
+            output_mode=output_mode,
+            priority=priority,
+            client_tag=client_tag,
+        )
+
+        return jobs[0]
+
+    async def create_jobs_for_files(
+        self,
+        files: List[UploadFile],
+        client_tag: Optional[str] = None,
+        output_format: Optional[constants.ImageOutputFormat] = None,
+        quality: Optional[int] = None,
+        output_mode: constants.JobOutputMode = constants.JobOutputMode.IMAGE,
+        priority: constants.JobPriority = constants.JobPriority.INTERACTIVE,
+        client_id: Optional[str] = None,
+    ) -> List[ImageFaceJobEntity]:
+        if not files or len(files) > SETTINGS.max_batch_files:
+            raise ValidationException(
+                msg=f"invalid files count, max {SETTINGS.max_batch_files} per batch"
+            )
+
+        # validate whole batch first, do not leave orphan files on invalid one
+        for file in files:
+            self._validate_file(file=file)
+            self._file_storage.validate_filename(filename=file.filename)
+        output_encodings = self._get_output_encodings(
+            files=files, output_format=output_format, quality=quality
+        )
+        await self._admission.admit(
+            client_id=client_id, cost=len(files), priority=priority
+        )
+
+        with observe_stage(stage="origin_save"):
+            origin_files = await asyncio.gather(
+                *(
+                    self._file_storage.save_file_by_content(
+                        file=file, bucket_name=SETTINGS.origin_images_bucket_name
+                    )
+                    for file in files
+                )
+            )
+
+        return await self._create_jobs(
+            origin_files=origin_files,
+            output_encodings=output_encodings,
+            output_mode=output_mode,
+            priority=priority,
+            client_tag=client_tag,
+        )
 
 
 image_face_job_service = ImageFaceJobService(
     file_storage=dir_bucket_storage,
     job_producer=image_face_job_producer,
     job_repository=image_face_job_repository,
+    job_events_hub=ws_broadcast_hub,
+    result_cache=DetectionResultCache(
+        conn=redis.Redis.from_pool(APP_REDIS_POOL),
+        ttl=SETTINGS.result_cache_ttl,
+        fingerprint=get_detector_fingerprint(),
+    ),
+    job_cache=job_entity_cache,
+    admission=admission_controller,
 )
@@ -1,31 +1,47 @@
 from contextlib import asynccontextmanager
-from typing import Dict
+from typing import Dict, List, Optional
 
-from fastapi import FastAPI, Request, UploadFile
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, Query, Request, UploadFile
+from fastapi.responses import JSONResponse, Response
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
 from starlette.routing import WebSocketRoute
-from tortoise import Tortoise, connections
+from tortoise import connections
 
+from face_backend.core.cache import job_entity_cache
+from face_backend.core.hub import ws_broadcast_hub
 from face_backend.core.services import image_face_job_service
-from face_backend.views.jobs.schemas import CreateFaceJobSchema
+from face_backend.views.jobs.schemas import CreateFaceJobSchema, FacesStatsSchema
 from face_backend.views.jobs.views import jobs_router
 from face_backend.views.jobs.ws import FaceJobEcho
-from face_utils.db import TORTOISE_CONFIG
+from face_utils import constants
+from face_utils.db import init
 from face_utils.exceptions import (
+    AdmissionException,
     JobException,
+    OverloadException,
+    RateLimitException,
     RepositoryException,
     StorageException,
     ValidationException,
 )
+from face_utils.settings import SETTINGS
+from face_utils.storage import dir_bucket_storage
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    await Tortoise.init(config=TORTOISE_CONFIG)
-    await Tortoise.generate_schemas()
+    await init(generate_schemas=True)
+    dir_bucket_storage.create_buckets(
+        bucket_names=(
+            SETTINGS.origin_images_bucket_name,
+            SETTINGS.processed_images_bucket_name,
+        )
+    )
+    await ws_broadcast_hub.start()
 
     yield
 
+    await ws_broadcast_hub.stop()
     await connections.close_all()
 
 
@@ -92,13 +108,100 @@ async def handle_repository_exception(
     )
 
 
+def _get_admission_response(status_code: int, exc: AdmissionException) -> JSONResponse:
+    return JSONResponse(
+        status_code=status_code,
+        content={
+            "reason": exc.msg,
+        },
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+
+@app.exception_handler(RateLimitException)
+async def handle_rate_limit_exception(
+    request: Request,  # type: ignore
+    exc: RateLimitException,
+):
+    return _get_admission_response(status_code=429, exc=exc)
+
+
+@app.exception_handler(OverloadException)
+async def handle_overload_exception(
+    request: Request,  # type: ignore
+    exc: OverloadException,
+):
+    return _get_admission_response(status_code=503, exc=exc)
+
+
+def _get_client_id(request: Request) -> Optional[str]:
+    # behind nginx, uvicorn --forwarded-allow-ips resolves X-Forwarded-For into client
+    return request.client.host if request.client else None
+
+
 @app.post("/image", status_code=201, response_model=CreateFaceJobSchema)
-async def create_face_job(file: UploadFile) -> Dict:
-    face_job = await image_face_job_service.create_job_for_file(file=file)
+async def create_face_job(
+    request: Request,
+    file: UploadFile,
+    tag: Optional[str] = Query(default=None, max_length=64),
+    output_format: Optional[constants.ImageOutputFormat] = Query(default=None),
+    quality: Optional[int] = Query(default=None, ge=0, le=100),
+    output: constants.JobOutputMode = Query(default=constants.JobOutputMode.IMAGE),
+    priority: constants.JobPriority = Query(default=constants.JobPriority.INTERACTIVE),
+) -> Dict:
+    face_job = await image_face_job_service.create_job_for_file(
+        file=file,
+        client_tag=tag,
+        output_format=output_format,
+        quality=quality,
+        output_mode=output,
+        priority=priority,
+        client_id=_get_client_id(request=request),
+    )
 
     return face_job.as_dict
 
 
+@app.post("/images", status_code=201, response_model=List[CreateFaceJobSchema])
+async def create_face_jobs(
+    request: Request,
+    files: List[UploadFile],
+    tag: Optional[str] = Query(default=None, max_length=64),
+    output_format: Optional[constants.ImageOutputFormat] = Query(default=None),
+    quality: Optional[int] = Query(default=None, ge=0, le=100),
+    output: constants.JobOutputMode = Query(default=constants.JobOutputMode.IMAGE),
+    priority: constants.JobPriority = Query(default=constants.JobPriority.INTERACTIVE),
+) -> List[Dict]:
+    face_jobs = await image_face_job_service.create_jobs_for_files(
+        files=files,
+        client_tag=tag,
+        output_format=output_format,
+        quality=quality,
+        output_mode=output,
+        priority=priority,
+        client_id=_get_client_id(request=request),
+    )
+
+    return [face_job.as_dict for face_job in face_jobs]
+
+
+@app.get("/stats/faces", response_model=FacesStatsSchema)
+async def faces_stats(
+    tag: Optional[str] = Query(default=None, max_length=64),
+) -> Dict:
+    return await image_face_job_service.get_faces_stats(client_tag=tag)
+
+
+@app.get("/stats/job-cache")
+def job_cache_stats() -> Dict:
+    return job_entity_cache.stats
+
+
+@app.get("/metrics", include_in_schema=False)
+def metrics() -> Response:
+    return Response(content=generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+
 @app.get("/health")
 def health_check():
     return {"status": "ok"}
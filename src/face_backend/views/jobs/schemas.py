@@ -1,14 +1,25 @@
 import datetime
 import uuid
-from typing import Optional
+from typing import List, Literal, Optional
+
+from pydantic import field_validator
 
 from face_backend.core.schemas import AppSchema
 from face_utils import constants
+from face_utils.images import to_face_boxes
 
 
 class CreateFaceJobSchema(AppSchema):
     id: uuid.UUID
     created_at: datetime.datetime
+    client_tag: Optional[str] = None
+
+
+class FaceBoxSchema(AppSchema):
+    x: int
+    y: int
+    width: int
+    height: int
 
 
 class DetailedFaceJobSchema(AppSchema):
@@ -16,6 +27,36 @@ class DetailedFaceJobSchema(AppSchema):
     created_at: datetime.datetime
     modified_at: datetime.datetime
     state: constants.ImageFaceJobState
-    coordinates: Optional[str] = None
+    coordinates: Optional[List[FaceBoxSchema]] = None
     is_face_detected: Optional[bool] = False
     processed_filename: Optional[str] = None
+    client_tag: Optional[str] = None
+    output_format: Optional[constants.ImageOutputFormat] = None
+    output_quality: Optional[int] = None
+    output_mode: Optional[constants.JobOutputMode] = None
+    priority: Optional[constants.JobPriority] = None
+
+    @field_validator("coordinates", mode="before")
+    @classmethod
+    def validate_coordinates(cls, value):
+        # stored as [x, y, width, height] lists
+        if value and isinstance(value[0], (list, tuple)):
+            return to_face_boxes(faces=value)
+        return value
+
+
+class FacesStatsSchema(AppSchema):
+    jobs_with_faces: int
+    faces: int
+    avg_faces_per_job: Optional[float] = None
+    max_faces_per_job: Optional[int] = None
+    avg_box_width: Optional[float] = None
+    avg_box_height: Optional[float] = None
+    avg_box_area: Optional[float] = None
+    max_box_area: Optional[int] = None
+
+
+class FaceJobSubscriptionSchema(AppSchema):
+    action: Literal["subscribe", "unsubscribe"]
+    job_ids: List[uuid.UUID] = []
+    tags: List[str] = []
@@ -1,10 +1,16 @@
 from typing import Dict
 
-from fastapi import APIRouter, UploadFile, Response
+from fastapi import APIRouter, Query, Request, Response
 
+from face_backend.core.responses import (
+    ProcessedFileResponse,
+    get_file_etag,
+    get_not_modified_response,
+    is_etag_matched,
+)
 from face_backend.core.services import image_face_job_service
 from face_backend.views.jobs.schemas import CreateFaceJobSchema, DetailedFaceJobSchema
-from face_utils.repositories import image_face_job_repository
+from face_utils.settings import SETTINGS
 
 
 jobs_router = APIRouter(prefix="/jobs")
@@ -13,14 +19,30 @@ jobs_router = APIRouter(prefix="/jobs")
 @jobs_router.get(
     "/{face_job_id}", status_code=200, response_model=DetailedFaceJobSchema
 )
-async def get_face_job(face_job_id: str) -> Response:
-    return await image_face_job_repository.get(obj_id=face_job_id)
+async def get_face_job(
+    face_job_id: str,
+    wait: int = Query(default=0, ge=0, le=SETTINGS.job_wait_max_seconds),
+) -> Response:
+    return await image_face_job_service.get_job(job_id=face_job_id, wait=wait)
 
 
 @jobs_router.get("/{face_job_id}/processed-image", status_code=200)
-async def get_face_job_processed_image(face_job_id: str) -> Response:
-    processed_image = await image_face_job_service.get_job_processed_image(
+async def get_face_job_processed_image(face_job_id: str, request: Request) -> Response:
+    processed_filename = await image_face_job_service.get_job_processed_filename(
         job_id=face_job_id
     )
 
-    return Response(content=processed_image.file, media_type="image/png")
+    # filename is unique per rendered file, client copy is valid without storage access
+    etag = get_file_etag(filename=processed_filename)
+    if is_etag_matched(if_none_match=request.headers.get("if-none-match"), etag=etag):
+        return get_not_modified_response(etag=etag)
+
+    file_path, stat_result = await image_face_job_service.get_processed_image_file(
+        processed_filename=processed_filename
+    )
+    return ProcessedFileResponse(
+        path=file_path,
+        stat_result=stat_result,
+        etag=etag,
+        request_headers=request.headers,
+    )
@@ -2,55 +2,99 @@ import asyncio
 import uuid
 from typing import Any
 
-import redis.asyncio as redis
+from pydantic import ValidationError
+from starlette import status
 from starlette.endpoints import WebSocketEndpoint
 from starlette.websockets import WebSocket
 
-from face_backend.pool import APP_REDIS_POOL
-from face_utils.settings import SETTINGS
-from face_utils.streams import RedisStreamHandler
+from face_backend.core.hub import StreamBroadcastHub, ws_broadcast_hub
+from face_backend.views.jobs.schemas import FaceJobSubscriptionSchema
+from face_utils import constants
+from face_utils.events import serialize_job_event
+from face_utils.exceptions import RepositoryException
+from face_utils.repositories import image_face_job_repository
 
 
 class FaceJobEcho(WebSocketEndpoint):
     encoding = "json"
+    hub: StreamBroadcastHub = ws_broadcast_hub
 
     def __init__(self, *args, **kwargs) -> None:
         self._task = None
-        self._ws_stream_handler = None
+        self._subscription = None
         self._connection_id = str(uuid.uuid4())
 
         super().__init__(*args, **kwargs)
 
-    async def _handle_stream_data(self, websocket: WebSocket) -> None:
-        data = await self._ws_stream_handler.iter_read()
-        if data:
-            await websocket.send_json({"connection_id": self._connection_id, **data})
+    async def _send_data(self, websocket: WebSocket, data: dict) -> None:
+        await websocket.send_json({"connection_id": self._connection_id, **data})
 
-    async def _handle_websocket(
-        self,
-        websocket: WebSocket,
+    async def _send_finished_jobs(self, websocket: WebSocket, job_ids: list) -> None:
+        # job could finish before subscribe, its event is already gone from hub
+        try:
+            face_jobs = await image_face_job_repository.get_many(obj_ids=job_ids)
+        except RepositoryException:
+            return
+
+        for face_job in face_jobs:
+            if face_job.state != constants.ImageFaceJobState.PENDING:
+                await self._send_data(
+                    websocket=websocket,
+                    data=serialize_job_event(image_face_job=face_job),
+                )
+
+    async def _handle_subscription(
+        self, websocket: WebSocket, subscription_data: FaceJobSubscriptionSchema
     ) -> None:
-        while True:
-            await self._handle_stream_data(websocket=websocket)
-            await asyncio.sleep(1)
+        job_ids = [str(job_id) for job_id in subscription_data.job_ids]
+        if subscription_data.action == "unsubscribe":
+            self.hub.unfollow(
+                subscription=self._subscription,
+                job_ids=job_ids,
+                tags=subscription_data.tags,
+            )
+            return
 
-    async def send_updates(self, websocket: WebSocket):
-        self._ws_stream_handler = RedisStreamHandler(
-            conn=redis.Redis.from_pool(APP_REDIS_POOL),
-            stream_name=SETTINGS.ws_stream_name,
+        self.hub.follow(
+            subscription=self._subscription,
+            job_ids=job_ids,
+            tags=subscription_data.tags,
         )
+        await self._send_finished_jobs(websocket=websocket, job_ids=job_ids)
 
-        try:
-            await self._handle_websocket(websocket=websocket)
-        except asyncio.CancelledError:
-            await self._ws_stream_handler.destroy()
+    async def send_updates(self, websocket: WebSocket):
+        while True:
+            data = await self._subscription.get()
+            if data is None:
+                # dropped by hub as slow consumer, client should reconnect
+                await websocket.close(code=status.WS_1013_TRY_AGAIN_LATER)
+                return
+
+            await self._send_data(websocket=websocket, data=data)
 
     async def on_connect(self, websocket: WebSocket):
         await websocket.accept()
+        self._subscription = await self.hub.subscribe()
         self._task = asyncio.create_task(self.send_updates(websocket))
 
     async def on_receive(self, websocket: WebSocket, data: Any) -> None:
-        await self._handle_stream_data(websocket=websocket)
+        try:
+            subscription_data = FaceJobSubscriptionSchema.model_validate(data)
+        except ValidationError:
+            subscription_data = None
+
+        if subscription_data:
+            await self._handle_subscription(
+                websocket=websocket, subscription_data=subscription_data
+            )
+            return
+
+        latest_data = await self.hub.latest()
+        if latest_data:
+            await self._send_data(websocket=websocket, data=latest_data)
 
     async def on_disconnect(self, websocket, close_code):
-        self._task.cancel()
+        if self._task:
+            self._task.cancel()
+        if self._subscription:
+            self.hub.unsubscribe(subscription=self._subscription)
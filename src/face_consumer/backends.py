@@ -0,0 +1,132 @@
+import os
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Type
+
+import cv2
+import numpy as np
+
+from face_utils import constants
+
+
+@dataclass(frozen=True)
+class DetectorParams:
+    # max side of image used for detection, 0 - detect on full resolution
+    max_dimension: int = 1280
+    scale_factor: float = 1.1
+    min_neighbors: int = 5
+    # in origin image pixels
+    min_size: int = 30
+    dnn_model_path: Optional[str] = None
+    dnn_config_path: Optional[str] = None
+    dnn_confidence: float = 0.5
+    dnn_input_size: int = 300
+
+
+class DetectorBackend:
+    # color backends get BGR working images, others single channel gray
+    REQUIRES_COLOR = False
+
+    def __init__(self, params: DetectorParams) -> None:
+        self._params = params
+
+    @classmethod
+    def validate(cls, params: DetectorParams) -> None:
+        pass
+
+    def detect(self, img: np.ndarray, min_size: int) -> List[List[int]]:
+        raise NotImplementedError
+
+    def detect_batch(
+        self, imgs: List[np.ndarray], min_sizes: List[int]
+    ) -> List[List[List[int]]]:
+        return [
+            self.detect(img=img, min_size=min_size)
+            for img, min_size in zip(imgs, min_sizes)
+        ]
+
+
+class HaarDetectorBackend(DetectorBackend):
+    def __init__(self, params: DetectorParams) -> None:
+        super().__init__(params=params)
+        self._classifier = cv2.CascadeClassifier(
+            cv2.data.haarcascades + "haarcascade_frontalface_default.xml"
+        )
+
+    def detect(self, img: np.ndarray, min_size: int) -> List[List[int]]:
+        faces = self._classifier.detectMultiScale(
+            img,
+            scaleFactor=self._params.scale_factor,
+            minNeighbors=self._params.min_neighbors,
+            minSize=(min_size, min_size),
+        )
+        return [f.tolist() for f in faces]
+
+
+class DnnDetectorBackend(DetectorBackend):
+    # cv2.dnn SSD face model on CPU, rows are [img_i, class, conf, x1, y1, x2, y2]
+
+    REQUIRES_COLOR = True
+    MEAN = (104.0, 177.0, 123.0)
+
+    def __init__(self, params: DetectorParams) -> None:
+        super().__init__(params=params)
+        self.validate(params=params)
+        self._net = cv2.dnn.readNet(params.dnn_model_path, params.dnn_config_path or "")
+        self._net.setPreferableBackend(cv2.dnn.DNN_BACKEND_OPENCV)
+        self._net.setPreferableTarget(cv2.dnn.DNN_TARGET_CPU)
+
+    @classmethod
+    def validate(cls, params: DetectorParams) -> None:
+        if not params.dnn_model_path or not os.path.exists(params.dnn_model_path):
+            raise ValueError("dnn detector model file does not exists")
+        if params.dnn_config_path and not os.path.exists(params.dnn_config_path):
+            raise ValueError("dnn detector config file does not exists")
+
+    def _get_face(
+        self, detection: np.ndarray, img: np.ndarray, min_size: int
+    ) -> Optional[List[int]]:
+        height, width = img.shape[:2]
+        x_1, y_1, x_2, y_2 = detection[3:7] * np.array([width, height, width, height])
+        x_1, y_1 = max(int(x_1), 0), max(int(y_1), 0)
+        x_2, y_2 = min(int(x_2), width), min(int(y_2), height)
+        if x_2 - x_1 < min_size or y_2 - y_1 < min_size:
+            return None
+
+        return [x_1, y_1, x_2 - x_1, y_2 - y_1]
+
+    def detect(self, img: np.ndarray, min_size: int) -> List[List[int]]:
+        return self.detect_batch(imgs=[img], min_sizes=[min_size])[0]
+
+    def detect_batch(
+        self, imgs: List[np.ndarray], min_sizes: List[int]
+    ) -> List[List[List[int]]]:
+        input_size = (self._params.dnn_input_size, self._params.dnn_input_size)
+        blob = cv2.dnn.blobFromImages(imgs, 1.0, input_size, self.MEAN)
+        self._net.setInput(blob)
+        detections = self._net.forward()
+
+        faces = [[] for _ in imgs]
+        for detection in detections.reshape(-1, 7):
+            img_i, confidence = int(detection[0]), float(detection[2])
+            if img_i < 0 or confidence < self._params.dnn_confidence:
+                continue
+
+            face = self._get_face(
+                detection=detection, img=imgs[img_i], min_size=min_sizes[img_i]
+            )
+            if face:
+                faces[img_i].append(face)
+
+        return faces
+
+
+DETECTOR_BACKENDS: Dict[constants.DetectorBackendType, Type[DetectorBackend]] = {
+    constants.DetectorBackendType.HAAR: HaarDetectorBackend,
+    constants.DetectorBackendType.DNN: DnnDetectorBackend,
+}
+
+
+def get_detector_backend_cls(
+    backend_type: constants.DetectorBackendType,
+) -> Type[DetectorBackend]:
+    return DETECTOR_BACKENDS[constants.DetectorBackendType(backend_type)]
@@ -1,150 +1,539 @@
 import asyncio
-from typing import Optional, List
+import logging
+import uuid
+from typing import Callable, Optional, List, Dict, Tuple
 
-from fastapi import UploadFile
+from prometheus_client import start_http_server
 from redis.asyncio import Redis
 
 from face_consumer.detector import FaceDetector
+from face_consumer.engine import detector_engine
+from face_consumer.lanes import LaneScheduler, get_lane_scheduler
 from face_consumer.pool import CONSUMER_REDIS_POOL
+from face_consumer.scaler import (
+    ConsumerScaler,
+    UsageSampler,
+    get_cpu_load_getter,
+)
 from face_utils import constants
+from face_utils.cache import (
+    DetectionResultCache,
+    get_detector_fingerprint,
+    get_job_result_key,
+)
 from face_utils.db import init
-from face_utils.entites import ImageFaceJobEntity
+from face_utils.entites import DetectionResultEntity, ImageFaceJobEntity
+from face_utils.events import serialize_job_event
 from face_utils.exceptions import DetectorException
-from face_utils.exceptions import RepositoryException
+from face_utils.metrics import (
+    ERRORS_TOTAL,
+    JOB_FAILURES_TOTAL,
+    JOBS_TOTAL,
+    LANE_MSGS_TOTAL,
+    observe_stage,
+    set_stream_stats,
+)
 from face_utils.repositories import image_face_job_repository
 from face_utils.settings import SETTINGS
 from face_utils.storage import dir_bucket_storage
-from face_utils.streams import RedisStreamWorker, RedisStreamHandler
+from face_utils.streams import (
+    RedisStreamHandler,
+    RedisStreamTrimmer,
+    RedisStreamWorker,
+    StreamTrimPolicy,
+    get_job_stream_names,
+    get_stream_trim_policy,
+    read_batch_from_workers,
+)
 
 
-CONSUMERS_PER_CONTAINER = 3
+logger = logging.getLogger(__name__)
 
 
 class ImageFaceJobProducer:
+    FINISHED_JOB_UPDATE_FIELDS = (
+        "state",
+        "is_face_detected",
+        "coordinates",
+        "processed_filename",
+    )
+
     def __init__(
-        self, stream_worker: RedisStreamWorker, ws_stream_handler: RedisStreamHandler
+        self,
+        stream_workers: Dict[constants.JobPriority, RedisStreamWorker],
+        lane_scheduler: LaneScheduler,
+        ws_stream_handler: RedisStreamHandler,
+        dead_letter_stream_handler: RedisStreamHandler,
+        result_cache: DetectionResultCache,
     ) -> None:
-        self._stream_worker = stream_worker
-
-        self._stream_data: Optional[dict] = {}
+        # one worker per priority lane, all with same consumer name
+        self._stream_workers = stream_workers
+        self._lane_scheduler = lane_scheduler
         self._ws_stream_handler = ws_stream_handler
-        self._image_face_job_id: Optional[str] = None
-        self._image_face_job: Optional[ImageFaceJobEntity] = None
-
-    async def _handle_ws_notification(self) -> None:
-        await self._ws_stream_handler.write(
-            data={
-                "job_id": str(self._image_face_job.id),
-                "processed_url": f"{SETTINGS.static_dir}/{self._image_face_job.processed_filename}",
-            }
-        )
+        self._dead_letter_stream_handler = dead_letter_stream_handler
+        self._result_cache = result_cache
+        self._stopped = asyncio.Event()
 
-    async def _handle_error_face_job(self):
-        self._image_face_job.state = constants.ImageFaceJobState.ERROR
-        await image_face_job_repository.update(obj=self._image_face_job)
-
-    async def _handle_finished_face_job(
-        self, process_image: Optional[UploadFile], faces_coordinates: Optional[List]
+    async def _handle_ws_notifications(
+        self, image_face_jobs: List[ImageFaceJobEntity]
     ) -> None:
-        if process_image:
-            self._image_face_job.is_face_detected = True
-            self._image_face_job.coordinates = faces_coordinates
-            process_filename = await dir_bucket_storage.save_file(
-                file=process_image, bucket_name=SETTINGS.processed_images_bucket_name
+        # every terminal state is pushed, clients wait for it instead of polling
+        with observe_stage(stage="ws_notify"):
+            await self._ws_stream_handler.write_many(
+                data_list=[
+                    serialize_job_event(image_face_job=image_face_job)
+                    for image_face_job in image_face_jobs
+                ]
             )
-            self._image_face_job.processed_filename = process_filename
 
-        self._image_face_job.state = constants.ImageFaceJobState.FINISHED
-        await image_face_job_repository.update(obj=self._image_face_job)
+    @staticmethod
+    def _handle_error_face_job(image_face_job: ImageFaceJobEntity) -> None:
+        image_face_job.state = constants.ImageFaceJobState.ERROR
+
+    @staticmethod
+    def _handle_finished_face_job(
+        image_face_job: ImageFaceJobEntity,
+        processed_filename: Optional[str],
+        faces_coordinates: Optional[List],
+    ) -> None:
+        # processed image is already written to bucket by detector worker,
+        # coordinates only jobs have faces without it
+        if faces_coordinates:
+            image_face_job.is_face_detected = True
+            image_face_job.coordinates = faces_coordinates
+            image_face_job.processed_filename = processed_filename
+
+        image_face_job.state = constants.ImageFaceJobState.FINISHED
+
+    async def _handle_image_face_jobs(
+        self, image_face_jobs: Dict[str, ImageFaceJobEntity]
+    ) -> Dict[str, BaseException]:
+        # only mutates jobs, whole batch is persisted with one bulk update
+        detector = FaceDetector(face_jobs=list(image_face_jobs.values()))
+        await detector.process()
+
+        # detector errors finish own job only, other errors leave it for retry
+        failures = {}
+        for (job_id, image_face_job), result in zip(
+            image_face_jobs.items(), detector.results
+        ):
+            if isinstance(result, DetectorException):
+                self._handle_error_face_job(image_face_job=image_face_job)
+            elif isinstance(result, BaseException):
+                failures[job_id] = result
+            else:
+                self._handle_finished_face_job(
+                    image_face_job=image_face_job,
+                    processed_filename=result.processed_filename,
+                    faces_coordinates=result.faces_coordinates,
+                )
 
-    async def _handle_image_face_job(self) -> None:
-        # TODO - make all calls transactional in future
-        detector = FaceDetector(face_job=self._image_face_job)
+        return failures
+
+    async def _cache_results(self, image_face_jobs: List[ImageFaceJobEntity]) -> None:
+        # errors are not cached, resubmitted content gets another try
+        results = {}
+        for image_face_job in image_face_jobs:
+            if (
+                image_face_job.content_hash
+                and image_face_job.state == constants.ImageFaceJobState.FINISHED
+            ):
+                results[get_job_result_key(image_face_job=image_face_job)] = (
+                    DetectionResultEntity(
+                        is_face_detected=bool(image_face_job.is_face_detected),
+                        coordinates=image_face_job.coordinates,
+                        processed_filename=image_face_job.processed_filename,
+                    )
+                )
+
+        with observe_stage(stage="result_cache_write"):
+            await self._result_cache.set_many(results=results)
+
+    @staticmethod
+    def _get_job_id(stream_data: Optional[Dict]) -> Optional[str]:
         try:
-            await detector.process()
-        except DetectorException:
-            await self._handle_error_face_job()
-            return
-
-        await self._handle_finished_face_job(
-            process_image=detector.processed_img,
-            faces_coordinates=detector.faces_coordinates,
+            return str(uuid.UUID(stream_data.get("id")))
+        except (TypeError, ValueError, AttributeError):
+            # ignore invalid msg, change if needed
+            return None
+
+    async def _get_image_face_jobs(
+        self, job_ids: List[str]
+    ) -> Dict[str, ImageFaceJobEntity]:
+        # db errors propagate, batch stays unacked and is retried by reclaim
+        with observe_stage(stage="job_load"):
+            image_face_jobs = await image_face_job_repository.get_many(
+                obj_ids=job_ids
+            )
+
+        return {
+            str(image_face_job.id): image_face_job for image_face_job in image_face_jobs
+        }
+
+    async def _handle_dead_letter_msgs(
+        self,
+        stream_worker: RedisStreamWorker,
+        stream_msgs: List[Tuple[str, Optional[Dict]]],
+        delivery_counts: Dict[str, int],
+    ) -> None:
+        job_ids = [self._get_job_id(stream_data) for _, stream_data in stream_msgs]
+        image_face_jobs = await self._get_image_face_jobs(
+            job_ids=[job_id for job_id in job_ids if job_id]
         )
 
-        if detector.is_faces_detected:
-            await self._handle_ws_notification()
+        for (msg_id, stream_data), job_id in zip(stream_msgs, job_ids):
+            image_face_job = image_face_jobs.get(job_id)
+            if image_face_job:
+                self._handle_error_face_job(image_face_job=image_face_job)
+                is_updated = await image_face_job_repository.update(
+                    obj=image_face_job,
+                    update_fields=["state"],
+                    expected_state=constants.ImageFaceJobState.PENDING,
+                )
+                if is_updated:
+                    JOBS_TOTAL.labels(state="dead_letter").inc()
+                    await self._handle_ws_notifications(
+                        image_face_jobs=[image_face_job]
+                    )
+
+            await self._dead_letter_stream_handler.write(
+                data={
+                    "msg_id": msg_id,
+                    "stream": stream_worker.stream_name,
+                    "data": stream_data,
+                    "deliveries": delivery_counts.get(msg_id, 0),
+                }
+            )
+            logger.warning(
+                "msg %s moved to dead letter stream after %s deliveries",
+                msg_id,
+                delivery_counts.get(msg_id, 0),
+            )
 
-    async def _get_image_face_job(self):
-        self._stream_data = await self._stream_worker.read_from_stream()
-        if not self._stream_data:
-            return
+        await stream_worker.ack_msgs(msg_ids=[msg_id for msg_id, _ in stream_msgs])
 
-        self._image_face_job_id = self._stream_data.get("id")
-        if not self._image_face_job_id:
-            self._image_face_job = None
-            return
-        try:
-            self._image_face_job = await image_face_job_repository.get(
-                obj_id=self._image_face_job_id
+    async def _process_stream_msgs(
+        self,
+        stream_worker: RedisStreamWorker,
+        stream_msgs: List[Tuple[str, Optional[Dict]]],
+        check_deliveries: bool = False,
+    ) -> None:
+        if check_deliveries:
+            delivery_counts = await stream_worker.get_delivery_counts(
+                msg_ids=[msg_id for msg_id, _ in stream_msgs]
+            )
+            dead_letter_msgs = [
+                stream_msg
+                for stream_msg in stream_msgs
+                if delivery_counts.get(stream_msg[0], 0) > SETTINGS.stream_max_deliveries
+            ]
+            if dead_letter_msgs:
+                await self._handle_dead_letter_msgs(
+                    stream_worker=stream_worker,
+                    stream_msgs=dead_letter_msgs,
+                    delivery_counts=delivery_counts,
+                )
+                stream_msgs = [
+                    stream_msg
+                    for stream_msg in stream_msgs
+                    if stream_msg not in dead_letter_msgs
+                ]
+
+        msg_job_ids = {
+            msg_id: self._get_job_id(stream_data) for msg_id, stream_data in stream_msgs
+        }
+        image_face_jobs = await self._get_image_face_jobs(
+            job_ids=list({job_id for job_id in msg_job_ids.values() if job_id})
+        )
+        # redelivered msgs of already finished jobs are only acked
+        image_face_jobs = {
+            job_id: image_face_job
+            for job_id, image_face_job in image_face_jobs.items()
+            if image_face_job.state == constants.ImageFaceJobState.PENDING
+        }
+        failures = await self._handle_image_face_jobs(image_face_jobs=image_face_jobs)
+
+        failed_job_ids = set(failures)
+        for job_id, exc in failures.items():
+            JOB_FAILURES_TOTAL.inc()
+            logger.error("face job %s failed", job_id, exc_info=exc)
+
+        finished_jobs = [
+            image_face_job
+            for job_id, image_face_job in image_face_jobs.items()
+            if job_id not in failed_job_ids
+        ]
+        # cached before jobs are visible as finished, resubmit after finish always hits
+        await self._cache_results(image_face_jobs=finished_jobs)
+        with observe_stage(stage="job_update"):
+            updated_count = await image_face_job_repository.bulk_update(
+                objs=finished_jobs,
+                update_fields=self.FINISHED_JOB_UPDATE_FIELDS,
+                expected_state=constants.ImageFaceJobState.PENDING,
+            )
+        if updated_count < len(finished_jobs):
+            # redelivered or reclaimed msgs, other consumer already stored result
+            logger.info(
+                "%s jobs of batch already left pending state",
+                len(finished_jobs) - updated_count,
+            )
+        for image_face_job in finished_jobs:
+            JOBS_TOTAL.labels(
+                state=constants.ImageFaceJobState(image_face_job.state).value
+            ).inc()
+        await self._handle_ws_notifications(image_face_jobs=finished_jobs)
+
+        # failed msgs stay pending, reclaim loop retries them up to max deliveries
+        with observe_stage(stage="ack"):
+            await stream_worker.ack_msgs(
+                msg_ids=[
+                    msg_id
+                    for msg_id, job_id in msg_job_ids.items()
+                    if job_id not in failed_job_ids
+                ]
+            )
+
+    async def _consume_own_backlog(self) -> None:
+        for stream_worker in self._stream_workers.values():
+            # every msg is tried once, ones failed again are left to reclaim loop
+            start_id = "0"
+            while stream_msgs := await stream_worker.read_pending_from_stream(
+                count=SETTINGS.stream_read_count, start_id=start_id
+            ):
+                await self._process_stream_msgs(
+                    stream_worker=stream_worker,
+                    stream_msgs=stream_msgs,
+                    check_deliveries=True,
+                )
+                start_id = stream_msgs[-1][0]
+
+    async def _consume_lane_batch(
+        self,
+        priority: constants.JobPriority,
+        stream_msgs: List[Tuple[str, Optional[Dict]]],
+    ) -> None:
+        LANE_MSGS_TOTAL.labels(lane=priority.value).inc(len(stream_msgs))
+        with observe_stage(stage="batch"):
+            await self._process_stream_msgs(
+                stream_worker=self._stream_workers[priority], stream_msgs=stream_msgs
             )
-        except RepositoryException:
-            # ignore invalid msg, change if needed
-            self._image_face_job = None
 
     async def _consume(self) -> None:
-        await self._get_image_face_job()
-        if not self.should_process:
-            return None
+        # non blocking read per lane in scheduled order, first non empty one is batch
+        for priority in self._lane_scheduler.get_order():
+            stream_msgs = await self._stream_workers[priority].read_batch_from_stream(
+                count=SETTINGS.stream_read_count
+            )
+            if stream_msgs:
+                await self._consume_lane_batch(
+                    priority=priority, stream_msgs=stream_msgs
+                )
+                return None
+
+        # all lanes idle, wait for first msg of any of them
+        priorities = {
+            stream_worker.stream_name: priority
+            for priority, stream_worker in self._stream_workers.items()
+        }
+        lane_msgs = await read_batch_from_workers(
+            workers=list(self._stream_workers.values()),
+            count=SETTINGS.stream_read_count,
+            block=SETTINGS.stream_block_ms,
+        )
+        for stream_worker, stream_msgs in lane_msgs:
+            await self._consume_lane_batch(
+                priority=priorities[stream_worker.stream_name], stream_msgs=stream_msgs
+            )
+
+    async def _reclaim(self) -> None:
+        for stream_worker in self._stream_workers.values():
+            stream_msgs = await stream_worker.claim_idle_msgs(
+                min_idle_time=SETTINGS.stream_claim_min_idle_ms,
+                count=SETTINGS.stream_read_count,
+            )
+            if stream_msgs:
+                await self._process_stream_msgs(
+                    stream_worker=stream_worker,
+                    stream_msgs=stream_msgs,
+                    check_deliveries=True,
+                )
+
+    async def _run_forever(self, handler: Callable, interval: float = 0) -> None:
+        while not self._stopped.is_set():
+            sleep_time = interval
+            try:
+                await handler()
+            except Exception:  # type: ignore
+                ERRORS_TOTAL.labels(loop=handler.__name__.lstrip("_")).inc()
+                logger.exception("consumer %s loop error", self.name)
+                # do not spin on broken redis/db connection
+                sleep_time = max(interval, 1)
 
-        await self._handle_image_face_job()
-        await self._stream_worker.ack_current_msg()
+            if sleep_time:
+                await self._sleep(seconds=sleep_time)
 
-    def _clear(self) -> None:
-        self._stream_data = {}
-        self._image_face_job = None
-        self._image_face_job_id = None
+    async def _sleep(self, seconds: float) -> None:
+        # stop does not wait for whole interval
+        try:
+            await asyncio.wait_for(self._stopped.wait(), timeout=seconds)
+        except asyncio.TimeoutError:
+            pass
 
     async def start(self) -> None:
-        while True:
+        # broken db/redis on start, retried with backoff then left to reclaim loop
+        for attempt in range(SETTINGS.stream_max_deliveries):
             try:
-                await self._consume()
-                await asyncio.sleep(1)
-            except Exception as exc:  # type: ignore
-                # TODO - handle that whatever needed
-                pass
+                await self._consume_own_backlog()
+                break
+            except Exception:  # type: ignore
+                ERRORS_TOTAL.labels(loop="consume_own_backlog").inc()
+                logger.exception("consumer %s backlog error", self.name)
+                await self._sleep(
+                    seconds=min(2**attempt, SETTINGS.stream_reclaim_interval)
+                )
+            if self._stopped.is_set():
+                return
+
+        await asyncio.gather(
+            self._run_forever(handler=self._consume),
+            self._run_forever(
+                handler=self._reclaim, interval=SETTINGS.stream_reclaim_interval
+            ),
+        )
 
-            self._clear()
+    def stop(self) -> None:
+        # loops exit after current batch, at most stream block time later
+        self._stopped.set()
 
     @property
-    def should_process(self) -> bool:
+    def name(self) -> str:
+        return next(iter(self._stream_workers.values())).name
+
+
+async def run_stream_trimmer(trimmer: RedisStreamTrimmer) -> None:
+    while True:
+        try:
+            trimmed = await trimmer.trim()
+            if trimmed:
+                logger.info("trimmed %s entries from %s", trimmed, trimmer.stream_name)
+        except Exception:  # type: ignore
+            ERRORS_TOTAL.labels(loop="stream_trimmer").inc()
+            logger.exception("stream %s trim error", trimmer.stream_name)
+
+        await asyncio.sleep(SETTINGS.stream_trim_interval)
+
+
+async def run_stream_stats_collector(worker: RedisStreamWorker) -> None:
+    while True:
         try:
-            return self._image_face_job is not None
-        except ValueError:
-            return False
+            stream_stats = await worker.get_stream_stats()
+            if stream_stats:
+                set_stream_stats(
+                    stream_name=worker.stream_name,
+                    stream_length=stream_stats["length"],
+                    groups=stream_stats["groups"],
+                )
+        except Exception:  # type: ignore
+            ERRORS_TOTAL.labels(loop="stream_stats").inc()
+            logger.exception("stream %s stats error", worker.stream_name)
+
+        await asyncio.sleep(SETTINGS.metrics_stream_stats_interval)
+
+
+async def create_consumer(
+    consumer_i: int, result_cache: DetectionResultCache
+) -> ImageFaceJobProducer:
+    conn = Redis.from_pool(CONSUMER_REDIS_POOL)
+    stream_workers = {
+        priority: await RedisStreamWorker.setup_group(
+            conn=conn,
+            stream_name=stream_name,
+            group_name=SETTINGS.stream_group_name,
+            name=f"{SETTINGS.stream_consumer_name}-{consumer_i}",
+            trim_policy=StreamTrimPolicy(max_len=SETTINGS.job_stream_max_len),
+        )
+        for priority, stream_name in get_job_stream_names().items()
+    }
+    ws_stream_handler = RedisStreamHandler(
+        conn=Redis.from_pool(CONSUMER_REDIS_POOL),
+        stream_name=SETTINGS.ws_stream_name,
+        trim_policy=get_stream_trim_policy(max_len=SETTINGS.ws_stream_max_len),
+    )
+    dead_letter_stream_handler = RedisStreamHandler(
+        conn=Redis.from_pool(CONSUMER_REDIS_POOL),
+        stream_name=SETTINGS.dead_letter_stream_name,
+    )
+
+    return ImageFaceJobProducer(
+        stream_workers=stream_workers,
+        lane_scheduler=get_lane_scheduler(),
+        ws_stream_handler=ws_stream_handler,
+        dead_letter_stream_handler=dead_letter_stream_handler,
+        result_cache=result_cache,
+    )
 
 
 async def run_consumers() -> None:
+    if SETTINGS.consumer_metrics_port:
+        # scrape server runs in own thread, detector workers do not inherit it
+        start_http_server(port=SETTINGS.consumer_metrics_port)
+
     await init()
+    dir_bucket_storage.create_buckets(
+        bucket_names=(SETTINGS.processed_images_bucket_name,)
+    )
+    detector_engine.start()
 
-    consumers = []
-    for _ in range(CONSUMERS_PER_CONTAINER):
-        worker = await RedisStreamWorker.setup_group(
+    result_cache = DetectionResultCache(
+        conn=Redis.from_pool(CONSUMER_REDIS_POOL),
+        ttl=SETTINGS.result_cache_ttl,
+        fingerprint=get_detector_fingerprint(),
+    )
+    stats_workers = [
+        RedisStreamWorker(
             conn=Redis.from_pool(CONSUMER_REDIS_POOL),
-            stream_name=SETTINGS.job_stream_name,
+            stream_name=stream_name,
             group_name=SETTINGS.stream_group_name,
         )
-        ws_stream_handler = RedisStreamHandler(
+        for stream_name in get_job_stream_names().values()
+    ]
+    consumer_scaler = ConsumerScaler(
+        consumer_factory=lambda consumer_i: create_consumer(
+            consumer_i=consumer_i, result_cache=result_cache
+        ),
+        stats_workers=stats_workers,
+        min_consumers=SETTINGS.consumer_min_concurrency,
+        max_consumers=SETTINGS.consumer_max_concurrency,
+        read_count=SETTINGS.stream_read_count,
+        cpu_high=SETTINGS.consumer_scale_cpu_high,
+        idle_checks=SETTINGS.consumer_scale_down_idle_checks,
+        detector_busy_high=SETTINGS.consumer_scale_detector_busy_high,
+        get_detector_busy=UsageSampler(
+            get_usage=lambda: detector_engine.busy_seconds,
+            capacity=detector_engine.pool_size,
+        ),
+        get_cpu_load=get_cpu_load_getter(source=SETTINGS.consumer_scale_cpu_source),
+    )
+    job_stream_trimmers = [
+        RedisStreamTrimmer(
             conn=Redis.from_pool(CONSUMER_REDIS_POOL),
-            stream_name=SETTINGS.ws_stream_name,
-        )
-        consumers.append(
-            ImageFaceJobProducer(
-                stream_worker=worker, ws_stream_handler=ws_stream_handler
-            )
+            stream_name=stream_name,
+            trim_policy=get_stream_trim_policy(max_len=None),
         )
+        for stream_name in get_job_stream_names().values()
+    ]
 
-    await asyncio.gather(*(consumer.start() for consumer in consumers))
+    try:
+        await asyncio.gather(
+            *(run_stream_trimmer(trimmer=trimmer) for trimmer in job_stream_trimmers),
+            # per lane length, pending and lag, labeled by stream name
+            *(run_stream_stats_collector(worker=worker) for worker in stats_workers),
+            consumer_scaler.run(interval=SETTINGS.consumer_scale_interval),
+        )
+    finally:
+        detector_engine.shutdown()
 
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
     asyncio.run(run_consumers())
@@ -1,80 +1,69 @@
-import io
-import uuid
-from typing import Optional, List
-
-import cv2
-import numpy as np
-from fastapi import UploadFile
+import asyncio
+from typing import Dict, List, Optional, Tuple, Union
 
+from face_consumer.engine import DetectionResult, DetectorEngine, detector_engine
 from face_utils.entites import ImageFaceJobEntity
 from face_utils.exceptions import DetectorException
-from face_utils.settings import SETTINGS
-from face_utils.storage import dir_bucket_storage
-
-
-FACE_CLASSIFIER = cv2.CascadeClassifier(
-    cv2.data.haarcascades + "haarcascade_frontalface_default.xml"
+from face_utils.images import (
+    OutputEncoding,
+    get_job_output_encoding,
+    is_job_rendered_by_detector,
 )
+from face_utils.settings import SETTINGS
 
 
 class FaceDetector:
-    DEFAULT_EXTENSION = "png"
-
-    def __init__(self, face_job: ImageFaceJobEntity):
-        self._face_job = face_job
-        self._input_img = None
-        self._faces = None
-
-    async def _get_input_img(self) -> None:
-        try:
-            origin_file = await dir_bucket_storage.retrieve_file(
-                filename=self._face_job.origin_filename,
-                bucket_name=SETTINGS.origin_images_bucket_name,
-            )
-        except ValueError as exc:
-            raise DetectorException("origin file for face job does not exists") from exc
-
-        try:
-            d = np.frombuffer(origin_file.file, dtype=np.uint8)
-            self._input_img = cv2.imdecode(d, cv2.IMREAD_COLOR)
-        except Exception as exc:
-            raise DetectorException("invalid origin file for face job") from exc
+    # jobs of consumer batch with same output encoding share worker tasks
+    def __init__(
+        self,
+        face_jobs: List[ImageFaceJobEntity],
+        engine: DetectorEngine = detector_engine,
+        batch_size: int = SETTINGS.detector_batch_size,
+    ):
+        self._face_jobs = face_jobs
+        self._engine = engine
+        self._batch_size = batch_size
+        self._results: Optional[List[Union[DetectionResult, Exception]]] = None
 
-    def _detect_faces(self) -> None:
-        input_gray_img = cv2.cvtColor(self._input_img, cv2.COLOR_BGR2GRAY)
-        self._faces = FACE_CLASSIFIER.detectMultiScale(
-            input_gray_img, scaleFactor=1.1, minNeighbors=5, minSize=(30, 30)
+    async def process(self) -> None:
+        results: List[Union[DetectionResult, Exception, None]] = [None] * len(
+            self._face_jobs
         )
-
-    def _convert_img_to_upload_file(self, img) -> UploadFile:
-        is_success, buffer = cv2.imencode(f".{self.DEFAULT_EXTENSION}", img)
-        if not is_success:
-            raise DetectorException("internal error for processed img")
-        return UploadFile(
-            file=io.BytesIO(buffer), filename=f"new_{str(uuid.uuid4())}.png"
+        job_groups: Dict[Tuple[OutputEncoding, bool], List[int]] = {}
+        for job_i, face_job in enumerate(self._face_jobs):
+            try:
+                encoding = get_job_output_encoding(image_face_job=face_job)
+            except ValueError as exc:
+                results[job_i] = DetectorException(str(exc))
+                continue
+
+            render = is_job_rendered_by_detector(image_face_job=face_job)
+            job_groups.setdefault((encoding, render), []).append(job_i)
+
+        # worker maps origin files and writes processed ones, no image bytes pass here
+        group_results = await asyncio.gather(
+            *(
+                self._engine.detect_many(
+                    origin_filenames=[
+                        self._face_jobs[job_i].origin_filename for job_i in job_idxs
+                    ],
+                    encoding=encoding,
+                    batch_size=self._batch_size,
+                    render=render,
+                )
+                for (encoding, render), job_idxs in job_groups.items()
+            )
         )
+        for job_idxs, detected_results in zip(job_groups.values(), group_results):
+            for job_i, result in zip(job_idxs, detected_results):
+                results[job_i] = result
 
-    async def process(self) -> None:
-        await self._get_input_img()
-        self._detect_faces()
-        if self.is_faces_detected:
-            for x, y, w, h in self.faces_coordinates:
-                cv2.rectangle(self._input_img, (x, y), (x + w, y + h), (255, 0, 0), 2)
+        self._results = results
 
     @property
-    def faces_coordinates(self) -> Optional[List]:
-        return [f.tolist() for f in self._faces]
-
-    @property
-    def is_faces_detected(self) -> bool:
-        return len(self._faces) > 0
-
-    @property
-    def processed_img(self) -> Optional[UploadFile]:
-        if not self.is_faces_detected:
-            return None
-
-        if self._input_img is not None:
-            return self._convert_img_to_upload_file(img=self._input_img)
+    def results(self) -> List[Union[DetectionResult, Exception]]:
+        # per job, in order of given jobs
+        if self._results is None:
+            raise ValueError("call process first")
 
-        raise ValueError("call process first")
+        return self._results
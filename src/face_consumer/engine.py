@@ -0,0 +1,498 @@
+import asyncio
+import math
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple, Union
+
+import cv2
+import numpy as np
+
+from face_consumer.backends import (
+    DetectorBackend,
+    DetectorParams,
+    get_detector_backend_cls,
+)
+from face_utils import constants
+from face_utils.exceptions import DetectorException, StorageException
+from face_utils.images import OutputEncoding, decode_img, draw_faces, encode_img
+from face_utils.metrics import observe_stage, observe_stage_durations
+from face_utils.settings import SETTINGS
+from face_utils.storage import dir_bucket_storage
+
+
+Buffer = Union[bytes, memoryview]
+
+# loaded once per worker process by _init_worker, never in the event loop process
+_WORKER_BACKEND: Optional[DetectorBackend] = None
+
+
+@dataclass
+class DetectionResult:
+    faces_coordinates: List = field(default_factory=list)
+    # encoded annotated image, dropped after write - never sent between processes
+    processed_buffer: Optional[np.ndarray] = None
+    processed_filename: Optional[str] = None
+    error: Optional[str] = None
+    # stage -> seconds spent in worker process, metrics live in parent process
+    stage_durations: Dict[str, float] = field(default_factory=dict)
+
+    @property
+    def is_faces_detected(self) -> bool:
+        return len(self.faces_coordinates) > 0
+
+
+@dataclass
+class _PreparedImage:
+    working_img: np.ndarray
+    working_scale: float
+    content: np.ndarray
+    input_img: Optional[np.ndarray] = None
+
+
+def _init_worker(
+    backend_type: constants.DetectorBackendType, params: DetectorParams
+) -> None:
+    global _WORKER_BACKEND
+
+    _WORKER_BACKEND = get_detector_backend_cls(backend_type=backend_type)(
+        params=params
+    )
+
+
+JPEG_MAGIC = b"\xff\xd8"
+REDUCED_FLAGS = {
+    False: (
+        (8, cv2.IMREAD_REDUCED_GRAYSCALE_8),
+        (4, cv2.IMREAD_REDUCED_GRAYSCALE_4),
+        (2, cv2.IMREAD_REDUCED_GRAYSCALE_2),
+        (1, cv2.IMREAD_GRAYSCALE),
+    ),
+    True: (
+        (8, cv2.IMREAD_REDUCED_COLOR_8),
+        (4, cv2.IMREAD_REDUCED_COLOR_4),
+        (2, cv2.IMREAD_REDUCED_COLOR_2),
+        (1, cv2.IMREAD_COLOR),
+    ),
+}
+
+
+def _decode_reduced_img(
+    content: np.ndarray, max_dimension: int, is_color: bool
+) -> Tuple[np.ndarray, int]:
+    # jpeg decoder scales DCT blocks, reduced decode is a fraction of full decode cost
+    reduced_flags = REDUCED_FLAGS[is_color]
+    probe_img = decode_img(content, reduced_flags[0][1])
+    origin_dimension = max(probe_img.shape[:2]) * 8
+    for factor, flags in reduced_flags:
+        if factor == 1 or origin_dimension / factor >= max_dimension:
+            return probe_img if factor == 8 else decode_img(content, flags), factor
+
+
+def _limit_dimension(img: np.ndarray, max_dimension: int) -> np.ndarray:
+    height, width = img.shape[:2]
+    if not max_dimension or max(height, width) <= max_dimension:
+        return img
+
+    ratio = max_dimension / max(height, width)
+    return cv2.resize(
+        img,
+        (max(int(width * ratio), 1), max(int(height * ratio), 1)),
+        interpolation=cv2.INTER_AREA,
+    )
+
+
+def _rescale_faces(faces: List, working_shape: tuple, origin_shape: tuple) -> List:
+    scale_y = origin_shape[0] / working_shape[0]
+    scale_x = origin_shape[1] / working_shape[1]
+
+    return [
+        [
+            int(round(x * scale_x)),
+            int(round(y * scale_y)),
+            int(round(w * scale_x)),
+            int(round(h * scale_y)),
+        ]
+        for x, y, w, h in faces
+    ]
+
+
+def _prepare_img(
+    origin_content: Buffer, params: DetectorParams, is_color: bool
+) -> _PreparedImage:
+    content = np.frombuffer(origin_content, dtype=np.uint8)
+
+    input_img = None
+    if params.max_dimension and bytes(content[:2]) == JPEG_MAGIC:
+        working_img, decode_factor = _decode_reduced_img(
+            content=content, max_dimension=params.max_dimension, is_color=is_color
+        )
+    else:
+        input_img = decode_img(content, cv2.IMREAD_COLOR)
+        working_img, decode_factor = input_img, 1
+        if not is_color:
+            working_img = cv2.cvtColor(input_img, cv2.COLOR_BGR2GRAY)
+
+    decoded_dimension = max(working_img.shape[:2])
+    working_img = _limit_dimension(img=working_img, max_dimension=params.max_dimension)
+
+    return _PreparedImage(
+        working_img=working_img,
+        working_scale=decode_factor * decoded_dimension / max(working_img.shape[:2]),
+        content=content,
+        input_img=input_img,
+    )
+
+
+def _get_origin_shape(prepared_img: _PreparedImage) -> Tuple[int, int]:
+    if prepared_img.input_img is not None:
+        return prepared_img.input_img.shape[:2]
+
+    # reduced decode, exact shape needs full decode - scale back is off by < factor px
+    height, width = prepared_img.working_img.shape[:2]
+    return (
+        int(round(height * prepared_img.working_scale)),
+        int(round(width * prepared_img.working_scale)),
+    )
+
+
+def _annotate_img(
+    prepared_img: _PreparedImage,
+    faces: List,
+    encoding: OutputEncoding,
+    render: bool = True,
+) -> DetectionResult:
+    result = DetectionResult()
+    if len(faces) == 0:
+        return result
+
+    if not render:
+        # coordinates only job, no full decode, draw and encode
+        result.faces_coordinates = _rescale_faces(
+            faces=faces,
+            working_shape=prepared_img.working_img.shape[:2],
+            origin_shape=_get_origin_shape(prepared_img=prepared_img),
+        )
+        return result
+
+    # full color decode only when there is something to annotate
+    input_img = prepared_img.input_img
+    if input_img is None:
+        input_img = decode_img(prepared_img.content, cv2.IMREAD_COLOR)
+    result.faces_coordinates = _rescale_faces(
+        faces=faces,
+        working_shape=prepared_img.working_img.shape[:2],
+        origin_shape=input_img.shape[:2],
+    )
+
+    draw_faces(img=input_img, faces=result.faces_coordinates)
+    result.processed_buffer = encode_img(img=input_img, encoding=encoding)
+
+    return result
+
+
+def detect_faces(
+    backend: DetectorBackend,
+    origin_contents: List[Buffer],
+    encoding: OutputEncoding,
+    params: DetectorParams,
+    render: bool = True,
+) -> List[DetectionResult]:
+    results: List[Optional[DetectionResult]] = [None] * len(origin_contents)
+    prepared_imgs = {}
+    decode_durations = {}
+    for content_i, origin_content in enumerate(origin_contents):
+        start = time.perf_counter()
+        try:
+            prepared_imgs[content_i] = _prepare_img(
+                origin_content=origin_content,
+                params=params,
+                is_color=backend.REQUIRES_COLOR,
+            )
+        except ValueError as exc:
+            results[content_i] = DetectionResult(error=str(exc))
+        decode_durations[content_i] = time.perf_counter() - start
+
+    if not prepared_imgs:
+        return results
+
+    start = time.perf_counter()
+    # min_size is given in origin pixels, approximate its working resolution size
+    batch_faces = backend.detect_batch(
+        imgs=[prepared_img.working_img for prepared_img in prepared_imgs.values()],
+        min_sizes=[
+            max(int(params.min_size / prepared_img.working_scale), 1)
+            for prepared_img in prepared_imgs.values()
+        ],
+    )
+    # batch runs as one inference, every image gets equal share
+    detect_duration = (time.perf_counter() - start) / len(prepared_imgs)
+
+    for (content_i, prepared_img), faces in zip(prepared_imgs.items(), batch_faces):
+        start = time.perf_counter()
+        try:
+            results[content_i] = _annotate_img(
+                prepared_img=prepared_img,
+                faces=faces,
+                encoding=encoding,
+                render=render,
+            )
+        except ValueError as exc:
+            results[content_i] = DetectionResult(error=str(exc))
+
+        results[content_i].stage_durations.update(
+            decode=decode_durations[content_i], detect=detect_duration
+        )
+        if results[content_i].processed_buffer is not None:
+            results[content_i].stage_durations["render"] = time.perf_counter() - start
+
+    return results
+
+
+def _detect_faces_task(
+    origin_filenames: List[str],
+    encoding: OutputEncoding,
+    params: DetectorParams,
+    render: bool,
+) -> List[DetectionResult]:
+    # runs inside worker process - errors are returned in results, not raised
+    results: List[Optional[DetectionResult]] = [None] * len(origin_filenames)
+    origin_contents = {}
+    for filename_i, origin_filename in enumerate(origin_filenames):
+        try:
+            origin_contents[filename_i] = dir_bucket_storage.open_mmap(
+                filename=origin_filename,
+                bucket_name=SETTINGS.origin_images_bucket_name,
+            )
+        except StorageException as exc:
+            results[filename_i] = DetectionResult(error=exc.msg)
+
+    detected_results = detect_faces(
+        backend=_WORKER_BACKEND,
+        origin_contents=list(origin_contents.values()),
+        encoding=encoding,
+        params=params,
+        render=render,
+    )
+    for filename_i, result in zip(origin_contents.keys(), detected_results):
+        if result.processed_buffer is not None:
+            start = time.perf_counter()
+            try:
+                result.processed_filename = dir_bucket_storage.write_bytes_sync(
+                    data=result.processed_buffer,
+                    file_kind=encoding.extension,
+                    bucket_name=SETTINGS.processed_images_bucket_name,
+                )
+            except OSError as exc:
+                result.error = f"processed img write error: {exc}"
+            result.processed_buffer = None
+            result.stage_durations["processed_write"] = time.perf_counter() - start
+        results[filename_i] = result
+
+    return results
+
+
+def _get_worker_processes(executor: ProcessPoolExecutor) -> List:
+    # no public api for worker processes, private attribute may change between versions
+    return list((getattr(executor, "_processes", None) or {}).values())
+
+
+class DetectorEngine:
+    def __init__(
+        self,
+        pool_size: int,
+        task_timeout: float,
+        backend_type: constants.DetectorBackendType,
+        params: DetectorParams,
+    ) -> None:
+        self._pool_size = pool_size
+        self._task_timeout = task_timeout
+        self._backend_type = backend_type
+        self._params = params
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._running_tasks = 0
+        # worker seconds of finished tasks and start times of executing ones
+        self._busy_seconds = 0.0
+        self._executing_starts: Dict[int, float] = {}
+        self._task_i = 0
+        # one submitted task per worker, timeout never counts wait in executor queue
+        self._slots = asyncio.Semaphore(pool_size)
+        # bumped on every pool recycle, tasks of killed pool are resubmitted
+        self._generation = 0
+
+    def start(self) -> None:
+        if self._executor is not None:
+            return
+
+        # fail fast on misconfiguration instead of breaking every worker process
+        get_detector_backend_cls(backend_type=self._backend_type).validate(
+            params=self._params
+        )
+        self._executor = ProcessPoolExecutor(
+            max_workers=self._pool_size,
+            initializer=_init_worker,
+            initargs=(self._backend_type, self._params),
+        )
+
+    def shutdown(self) -> None:
+        if self._executor is None:
+            return
+
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self._executor = None
+
+    def _recycle(self) -> None:
+        # timed out task keeps running in its worker, only killing process frees it
+        executor = self._executor
+        self._executor = None
+        self._generation += 1
+        if executor is not None:
+            for process in _get_worker_processes(executor=executor):
+                process.terminate()
+            executor.shutdown(wait=False, cancel_futures=True)
+
+        self.start()
+
+    async def _execute(
+        self, origin_filenames: List[str], encoding: OutputEncoding, render: bool
+    ) -> List[DetectionResult]:
+        loop = asyncio.get_running_loop()
+        while True:
+            generation = self._generation
+            executor = self._executor
+            if executor is None:
+                # None would run task on default thread pool without worker backend
+                raise DetectorException("detector engine is shut down")
+
+            try:
+                return await asyncio.wait_for(
+                    loop.run_in_executor(
+                        executor,
+                        _detect_faces_task,
+                        origin_filenames,
+                        encoding,
+                        self._params,
+                        render,
+                    ),
+                    timeout=self._task_timeout,
+                )
+            except asyncio.TimeoutError as exc:
+                if generation == self._generation:
+                    self._recycle()
+                raise DetectorException("face detection timeout") from exc
+            except BrokenProcessPool as exc:
+                if generation != self._generation:
+                    # pool was recycled for other task, this one never finished
+                    continue
+
+                self._recycle()
+                raise DetectorException("face detection worker died") from exc
+
+    async def _run_task(
+        self, origin_filenames: List[str], encoding: OutputEncoding, render: bool
+    ) -> List[DetectionResult]:
+        self.start()
+
+        self._running_tasks += 1
+        try:
+            # includes wait for free worker, compare with worker stages for queueing
+            with observe_stage(stage="detector_task"):
+                async with self._slots:
+                    task_i = self._task_i
+                    self._task_i += 1
+                    self._executing_starts[task_i] = time.perf_counter()
+                    try:
+                        results = await self._execute(
+                            origin_filenames=origin_filenames,
+                            encoding=encoding,
+                            render=render,
+                        )
+                    finally:
+                        self._busy_seconds += (
+                            time.perf_counter() - self._executing_starts.pop(task_i)
+                        )
+        finally:
+            self._running_tasks -= 1
+
+        for result in results:
+            observe_stage_durations(stage_durations=result.stage_durations)
+
+        return results
+
+    async def detect_many(
+        self,
+        origin_filenames: List[str],
+        encoding: OutputEncoding,
+        batch_size: int,
+        render: bool = True,
+    ) -> List[Union[DetectionResult, Exception]]:
+        # batches let dnn backend run one blob inference over several images,
+        # few images are spread over all workers instead of one busy worker
+        batch_size = max(
+            min(batch_size, math.ceil(len(origin_filenames) / self._pool_size)), 1
+        )
+        batches = [
+            origin_filenames[batch_start : batch_start + batch_size]
+            for batch_start in range(0, len(origin_filenames), batch_size)
+        ]
+        batch_results = await asyncio.gather(
+            *(
+                self._run_task(
+                    origin_filenames=batch, encoding=encoding, render=render
+                )
+                for batch in batches
+            ),
+            return_exceptions=True,
+        )
+
+        # failed task fails only images of own batch, image errors stay per image
+        results: List[Union[DetectionResult, Exception]] = []
+        for batch, batch_result in zip(batches, batch_results):
+            if isinstance(batch_result, BaseException):
+                results.extend([batch_result] * len(batch))
+                continue
+
+            results.extend(
+                DetectorException(result.error) if result.error else result
+                for result in batch_result
+            )
+
+        return results
+
+    @property
+    def pool_size(self) -> int:
+        return self._pool_size
+
+    @property
+    def busy_seconds(self) -> float:
+        # grows by pool_size per second while every worker executes a task
+        now = time.perf_counter()
+        return self._busy_seconds + sum(
+            now - start for start in self._executing_starts.values()
+        )
+
+    @property
+    def params(self) -> DetectorParams:
+        return self._params
+
+    @property
+    def backend_type(self) -> constants.DetectorBackendType:
+        return self._backend_type
+
+
+detector_engine = DetectorEngine(
+    pool_size=SETTINGS.detector_pool_size,
+    task_timeout=SETTINGS.detector_task_timeout,
+    backend_type=SETTINGS.detector_backend,
+    params=DetectorParams(
+        max_dimension=SETTINGS.detector_max_dimension,
+        scale_factor=SETTINGS.detector_scale_factor,
+        min_neighbors=SETTINGS.detector_min_neighbors,
+        min_size=SETTINGS.detector_min_size,
+        dnn_model_path=SETTINGS.detector_dnn_model_path,
+        dnn_config_path=SETTINGS.detector_dnn_config_path,
+        dnn_confidence=SETTINGS.detector_dnn_confidence,
+        dnn_input_size=SETTINGS.detector_dnn_input_size,
+    ),
+)
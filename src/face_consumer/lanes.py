@@ -0,0 +1,37 @@
+from typing import Dict, Hashable, List
+
+from face_utils import constants
+from face_utils.settings import SETTINGS
+
+
+class LaneScheduler:
+    # lane read order, weighted one starts by smooth weighted round robin
+
+    def __init__(self, weights: Dict[Hashable, int], strict: bool) -> None:
+        # dict order is lane priority
+        self._lanes = list(weights)
+        self._weights = {lane: max(weight, 0) for lane, weight in weights.items()}
+        self._strict = strict or not sum(self._weights.values())
+        self._current_weights = {lane: 0 for lane in self._lanes}
+
+    def get_order(self) -> List[Hashable]:
+        if self._strict:
+            return list(self._lanes)
+
+        for lane in self._lanes:
+            self._current_weights[lane] += self._weights[lane]
+        # ties go to higher priority lane, max keeps first of equal ones
+        first_lane = max(self._lanes, key=self._current_weights.__getitem__)
+        self._current_weights[first_lane] -= sum(self._weights.values())
+
+        return [first_lane] + [lane for lane in self._lanes if lane != first_lane]
+
+
+def get_lane_scheduler() -> LaneScheduler:
+    return LaneScheduler(
+        weights={
+            constants.JobPriority.INTERACTIVE: SETTINGS.job_lane_interactive_weight,
+            constants.JobPriority.BULK: SETTINGS.job_lane_bulk_weight,
+        },
+        strict=SETTINGS.job_lane_scheduling == constants.LaneScheduling.STRICT,
+    )
@@ -0,0 +1,219 @@
+import asyncio
+import logging
+import os
+import time
+from typing import Awaitable, Callable, List, Optional, Tuple
+
+from face_utils import constants
+from face_utils.metrics import CONSUMER_CONCURRENCY, ERRORS_TOTAL
+from face_utils.streams import RedisStreamWorker, get_group_backlog
+
+
+logger = logging.getLogger(__name__)
+
+CGROUP_DIR = "/sys/fs/cgroup"
+
+
+class UsageSampler:
+    # used share of capacity between calls from growing usage seconds counter, 0..1
+
+    def __init__(
+        self,
+        get_usage: Callable[[], float],
+        capacity: float,
+        clock: Optional[Callable[[], float]] = None,
+    ) -> None:
+        self._get_usage = get_usage
+        self._capacity = capacity
+        self._clock = clock or time.monotonic
+        self._last_usage = get_usage()
+        self._last_time = self._clock()
+
+    def __call__(self) -> float:
+        usage, now = self._get_usage(), self._clock()
+        elapsed = now - self._last_time
+        used = usage - self._last_usage
+        self._last_usage, self._last_time = usage, now
+        if elapsed <= 0 or self._capacity <= 0:
+            return 0.0
+
+        return min(max(used / (self._capacity * elapsed), 0.0), 1.0)
+
+
+def get_loadavg_cpu_load() -> float:
+    # 1 min load per cpu of host, >= 1 - runnable processes wait for cpu
+    try:
+        return os.getloadavg()[0] / (os.cpu_count() or 1)
+    except OSError:
+        return 0.0
+
+
+def _read_cgroup_cpu_usage(cgroup_dir: str) -> float:
+    # cgroup v2 cpu.stat, usage of all container processes in microseconds
+    with open(os.path.join(cgroup_dir, "cpu.stat")) as stat_file:
+        for line in stat_file:
+            key, value = line.split()
+            if key == "usage_usec":
+                return int(value) / 1_000_000
+
+    raise ValueError("no usage_usec in cpu.stat")
+
+
+def _read_cgroup_cpu_limit(cgroup_dir: str) -> float:
+    cpus = len(os.sched_getaffinity(0))
+    try:
+        with open(os.path.join(cgroup_dir, "cpu.max")) as max_file:
+            quota, period = max_file.read().split()
+    except OSError:
+        return cpus
+
+    # "max <period>" - no quota, container may use every cpu it is pinned to
+    if quota == "max":
+        return cpus
+    return min(int(quota) / int(period), cpus)
+
+
+def get_cpu_load_getter(
+    source: constants.CpuLoadSource, cgroup_dir: str = CGROUP_DIR
+) -> Callable[[], float]:
+    if source == constants.CpuLoadSource.CGROUP:
+        try:
+            return UsageSampler(
+                get_usage=lambda: _read_cgroup_cpu_usage(cgroup_dir=cgroup_dir),
+                capacity=_read_cgroup_cpu_limit(cgroup_dir=cgroup_dir),
+            )
+        except (OSError, ValueError):
+            # cgroup v1 or not in container
+            logger.warning(
+                "no cgroup v2 cpu stats in %s, using load average", cgroup_dir
+            )
+
+    return get_loadavg_cpu_load
+
+
+class ConsumerScaler:
+    # one consumer up or down per check, between min and max consumers of container
+
+    def __init__(
+        self,
+        consumer_factory: Callable[[int], Awaitable],
+        stats_workers: List[RedisStreamWorker],
+        min_consumers: int,
+        max_consumers: int,
+        read_count: int,
+        cpu_high: float,
+        idle_checks: int,
+        detector_busy_high: float,
+        get_detector_busy: Callable[[], float],
+        get_cpu_load: Callable[[], float],
+    ) -> None:
+        self._consumer_factory = consumer_factory
+        self._stats_workers = stats_workers
+        self._min_consumers = max(min_consumers, 1)
+        self._max_consumers = max(max_consumers, self._min_consumers)
+        self._read_count = read_count
+        self._cpu_high = cpu_high
+        self._idle_checks = idle_checks
+        self._detector_busy_high = detector_busy_high
+        self._get_detector_busy = get_detector_busy
+        self._get_cpu_load = get_cpu_load
+        self._idle_count = 0
+        self._consumers: List[Tuple[object, asyncio.Task]] = []
+
+    def get_target(
+        self,
+        current: int,
+        backlog: Optional[int],
+        cpu_load: float,
+        detector_busy: float,
+    ) -> int:
+        if cpu_load >= self._cpu_high:
+            # more consumers would only queue on busy detector workers
+            self._idle_count = 0
+            return max(current - 1, self._min_consumers)
+        if backlog is None:
+            return current
+
+        if backlog > current * self._read_count:
+            self._idle_count = 0
+            if detector_busy >= self._detector_busy_high:
+                # workers are saturated, more reads only queue tasks and add latency
+                return current
+            return min(current + 1, self._max_consumers)
+
+        if backlog == 0:
+            self._idle_count += 1
+            if self._idle_count >= self._idle_checks:
+                self._idle_count = 0
+                return max(current - 1, self._min_consumers)
+        else:
+            self._idle_count = 0
+
+        return current
+
+    async def _scale_up(self) -> None:
+        # consumer index is its stable name suffix, restarted one reclaims own backlog
+        consumer = await self._consumer_factory(len(self._consumers))
+        self._consumers.append((consumer, asyncio.create_task(consumer.start())))
+
+    async def _scale_down(self) -> None:
+        consumer, task = self._consumers.pop()
+        # finishes current batch, msgs left pending are reclaimed by others
+        consumer.stop()
+        await task
+
+    async def scale_to(self, target: int) -> None:
+        while len(self._consumers) < target:
+            await self._scale_up()
+        while len(self._consumers) > target:
+            await self._scale_down()
+
+        CONSUMER_CONCURRENCY.set(len(self._consumers))
+
+    async def _get_backlog(self) -> Optional[int]:
+        # consumers read all lanes, unknown lanes are left out of the sum
+        backlogs = [
+            get_group_backlog(
+                stream_stats=await stats_worker.get_stream_stats(),
+                group_name=stats_worker.group_name,
+            )
+            for stats_worker in self._stats_workers
+        ]
+        backlogs = [backlog for backlog in backlogs if backlog is not None]
+        if not backlogs:
+            return None
+
+        return sum(backlogs)
+
+    async def check(self) -> None:
+        target = self.get_target(
+            current=len(self._consumers),
+            backlog=await self._get_backlog(),
+            cpu_load=self._get_cpu_load(),
+            detector_busy=self._get_detector_busy(),
+        )
+        if target != len(self._consumers):
+            logger.info("scaling consumers %s -> %s", len(self._consumers), target)
+            await self.scale_to(target=target)
+
+    async def run(self, interval: float) -> None:
+        await self.scale_to(target=self._min_consumers)
+        try:
+            while True:
+                await asyncio.sleep(interval)
+                try:
+                    await self.check()
+                except Exception:  # type: ignore
+                    ERRORS_TOTAL.labels(loop="consumer_scaler").inc()
+                    logger.exception("consumer scaler error")
+        finally:
+            # shutdown, unacked msgs stay pending for own backlog read on start
+            for _, task in self._consumers:
+                task.cancel()
+            await asyncio.gather(
+                *(task for _, task in self._consumers), return_exceptions=True
+            )
+
+    @property
+    def consumers_count(self) -> int:
+        return len(self._consumers)
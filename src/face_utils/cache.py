@@ -0,0 +1,85 @@
+import hashlib
+import json
+from typing import Dict, Iterable
+
+from redis.asyncio import Redis
+
+from face_utils import constants
+from face_utils.entites import DetectionResultEntity, ImageFaceJobEntity
+from face_utils.images import get_job_output_encoding, is_job_rendered_by_detector
+from face_utils.settings import SETTINGS, Settings
+
+
+# settings changing detection output, results of other config are never reused
+DETECTOR_FINGERPRINT_FIELDS = (
+    "detector_backend",
+    "detector_max_dimension",
+    "detector_scale_factor",
+    "detector_min_neighbors",
+    "detector_min_size",
+    "detector_dnn_model_path",
+    "detector_dnn_config_path",
+    "detector_dnn_confidence",
+    "detector_dnn_input_size",
+)
+
+
+def get_detector_fingerprint(settings: Settings = SETTINGS) -> str:
+    config = settings.model_dump(include=set(DETECTOR_FINGERPRINT_FIELDS), mode="json")
+    return hashlib.sha256(
+        json.dumps(config, sort_keys=True).encode()
+    ).hexdigest()[:16]
+
+
+def get_job_result_key(image_face_job: ImageFaceJobEntity) -> str:
+    # same content rendered with other encoding is separate result
+    output_key = constants.JobOutputMode.COORDINATES.value
+    if is_job_rendered_by_detector(image_face_job=image_face_job):
+        output_key = get_job_output_encoding(image_face_job=image_face_job).key
+
+    return f"{output_key}:{image_face_job.content_hash}"
+
+
+class DetectionResultCache:
+    KEY_PREFIX = "face_result"
+
+    def __init__(self, conn: Redis, ttl: int, fingerprint: str) -> None:
+        self._conn = conn
+        self._ttl = ttl
+        self._fingerprint = fingerprint
+
+    def _get_key(self, result_key: str) -> str:
+        return f"{self.KEY_PREFIX}:{self._fingerprint}:{result_key}"
+
+    async def get_many(
+        self, result_keys: Iterable[str]
+    ) -> Dict[str, DetectionResultEntity]:
+        result_keys = list(dict.fromkeys(result_keys))
+        if not self.is_enabled or not result_keys:
+            return {}
+
+        values = await self._conn.mget(
+            [self._get_key(result_key) for result_key in result_keys]
+        )
+        return {
+            result_key: DetectionResultEntity(**json.loads(value))
+            for result_key, value in zip(result_keys, values)
+            if value is not None
+        }
+
+    async def set_many(self, results: Dict[str, DetectionResultEntity]) -> None:
+        if not self.is_enabled or not results:
+            return
+
+        async with self._conn.pipeline(transaction=False) as pipe:
+            for result_key, result in results.items():
+                pipe.set(
+                    self._get_key(result_key),
+                    json.dumps(result.as_dict),
+                    ex=self._ttl,
+                )
+            await pipe.execute()
+
+    @property
+    def is_enabled(self) -> bool:
+        return self._ttl > 0
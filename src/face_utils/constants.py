@@ -5,3 +5,48 @@ class ImageFaceJobState(str, enum.Enum):
     PENDING = "pending"
     FINISHED = "finished"
     ERROR = "error"
+
+
+class StreamTrimStrategy(str, enum.Enum):
+    MAXLEN = "maxlen"
+    MINID = "minid"
+    NONE = "none"
+
+
+class DetectorBackendType(str, enum.Enum):
+    HAAR = "haar"
+    DNN = "dnn"
+
+
+class ImageOutputFormat(str, enum.Enum):
+    PNG = "png"
+    JPEG = "jpeg"
+    WEBP = "webp"
+    # format of origin image, png for unknown ones
+    SAME = "same"
+
+
+class JobOutputMode(str, enum.Enum):
+    IMAGE = "image"
+    # rectangles only, annotated image rendered on first processed image request
+    COORDINATES = "coordinates"
+
+
+class JobPriority(str, enum.Enum):
+    # declaration order is lane priority
+    INTERACTIVE = "interactive"
+    BULK = "bulk"
+
+
+class LaneScheduling(str, enum.Enum):
+    # always drain higher priority lane first, bulk may starve
+    STRICT = "strict"
+    # lanes get reads by weights while all have backlog
+    WEIGHTED = "weighted"
+
+
+class CpuLoadSource(str, enum.Enum):
+    # container cpu usage against its quota, loadavg when no cgroup stats
+    CGROUP = "cgroup"
+    # host 1 min load average per cpu
+    LOADAVG = "loadavg"
@@ -1,4 +1,5 @@
 import uuid
+from typing import Iterable, List, Optional
 
 from face_utils.entites import Entity
 
@@ -9,8 +10,24 @@ class Repository:
     async def save(self, obj: Entity) -> None:
         raise NotImplementedError
 
+    async def bulk_save(self, objs: Iterable[Entity]) -> None:
+        raise NotImplementedError
+
     async def get(self, obj_id: uuid.UUID) -> Entity:
         raise NotImplementedError
 
-    async def update(self, obj: Entity) -> None:
+    async def get_many(self, obj_ids: Iterable[uuid.UUID]) -> List[Entity]:
+        raise NotImplementedError
+
+    async def update(
+        self, obj: Entity, update_fields: Optional[Iterable[str]] = None
+    ) -> bool:
+        raise NotImplementedError
+
+    async def bulk_update(
+        self,
+        objs: Iterable[Entity],
+        update_fields: Iterable[str],
+        expected_state: Optional[str] = None,
+    ) -> int:
         raise NotImplementedError
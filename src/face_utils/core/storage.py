@@ -1,3 +1,6 @@
+import os
+from typing import Tuple
+
 from fastapi import UploadFile
 
 
@@ -5,5 +8,29 @@ class BucketStorage:
     async def save_file(self, file: UploadFile) -> str:
         raise NotImplementedError
 
+    async def save_file_by_content(
+        self, file: UploadFile, bucket_name: str = None
+    ) -> Tuple[str, str]:
+        raise NotImplementedError
+
     async def retrieve_file(self, filename: str, bucket_name: str = None) -> UploadFile:
         raise NotImplementedError
+
+    async def stat_file(
+        self, filename: str, bucket_name: str = None
+    ) -> Tuple[str, os.stat_result]:
+        raise NotImplementedError
+
+    async def read_bytes(self, filename: str, bucket_name: str = None) -> memoryview:
+        raise NotImplementedError
+
+    def open_mmap(self, filename: str, bucket_name: str = None) -> memoryview:
+        raise NotImplementedError
+
+    async def write_bytes(
+        self, data: memoryview, file_kind: str, bucket_name: str = None
+    ) -> str:
+        raise NotImplementedError
+
+    async def remove_file(self, filename: str, bucket_name: str = None) -> None:
+        raise NotImplementedError
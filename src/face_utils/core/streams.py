@@ -1,4 +1,4 @@
-from typing import Optional, Dict
+from typing import Optional, Dict, List, Tuple
 
 
 class StreamHandler:
@@ -17,9 +17,20 @@ class StreamWorker:
     async def push_to_stream(self, data: Dict) -> None:
         raise NotImplementedError
 
+    async def push_many_to_stream(self, data_list: List[Dict]) -> None:
+        raise NotImplementedError
+
     async def read_from_stream(self) -> Optional[Dict]:
         raise NotImplementedError
 
+    async def read_batch_from_stream(
+        self, count: int, block: Optional[int] = None
+    ) -> List[Tuple[str, Dict]]:
+        raise NotImplementedError
+
+    async def ack_msgs(self, msg_ids: List[str]) -> None:
+        raise NotImplementedError
+
     @property
     def name(self) -> str:
         raise NotImplementedError
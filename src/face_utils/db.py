@@ -8,7 +8,9 @@ from face_utils.settings import (
 
 
 async def init(generate_schemas: bool = False):
-    await Tortoise.init(config=TORTOISE_CONFIG)
+    # backend and consumers may share process (benchmarks), reinit closes connections
+    if not Tortoise._inited:
+        await Tortoise.init(config=TORTOISE_CONFIG)
     if generate_schemas:
         await Tortoise.generate_schemas()
 
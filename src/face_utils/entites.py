@@ -1,7 +1,7 @@
 import datetime
 import uuid
 from dataclasses import dataclass
-from typing import Optional
+from typing import List, Optional
 
 from face_utils import constants
 from face_utils.core.entities import Entity
@@ -13,7 +13,21 @@ class ImageFaceJobEntity(Entity):
     created_at: datetime.datetime
     modified_at: datetime.datetime
     state: constants.ImageFaceJobState
-    coordinates: Optional[str] = None
+    coordinates: Optional[List[List[int]]] = None
     origin_filename: Optional[str] = None
     processed_filename: Optional[str] = None
     is_face_detected: Optional[bool] = False
+    client_tag: Optional[str] = None
+    # sha256 of origin content, key of detection result cache
+    content_hash: Optional[str] = None
+    output_format: Optional[constants.ImageOutputFormat] = None
+    output_quality: Optional[int] = None
+    output_mode: Optional[constants.JobOutputMode] = None
+    priority: Optional[constants.JobPriority] = None
+
+
+@dataclass
+class DetectionResultEntity(Entity):
+    is_face_detected: bool
+    coordinates: Optional[List[List[int]]] = None
+    processed_filename: Optional[str] = None
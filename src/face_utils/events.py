@@ -0,0 +1,24 @@
+from typing import Dict
+
+from face_utils import constants
+from face_utils.entites import ImageFaceJobEntity
+from face_utils.images import to_face_boxes
+from face_utils.settings import SETTINGS
+
+
+def serialize_job_event(image_face_job: ImageFaceJobEntity) -> Dict:
+    processed_url = None
+    if image_face_job.processed_filename:
+        processed_url = f"{SETTINGS.static_dir}/{image_face_job.processed_filename}"
+
+    return {
+        "job_id": str(image_face_job.id),
+        "state": constants.ImageFaceJobState(image_face_job.state).value,
+        "is_face_detected": bool(image_face_job.is_face_detected),
+        "coordinates": to_face_boxes(faces=image_face_job.coordinates),
+        "processed_filename": image_face_job.processed_filename,
+        "processed_url": processed_url,
+        "client_tag": image_face_job.client_tag,
+        "created_at": image_face_job.created_at.isoformat(),
+        "modified_at": image_face_job.modified_at.isoformat(),
+    }
@@ -33,3 +33,23 @@ class StorageException(AppException):
 
 class ValidationException(AppException):
     pass
+
+
+class AdmissionException(AppException):
+    def __init__(
+        self, msg: str, retry_after: int, is_critical: Optional[bool] = False
+    ) -> None:
+        super().__init__(msg=msg, is_critical=is_critical)
+        self._retry_after = retry_after
+
+    @property
+    def retry_after(self) -> int:
+        return self._retry_after
+
+
+class RateLimitException(AdmissionException):
+    pass
+
+
+class OverloadException(AdmissionException):
+    pass
@@ -0,0 +1,154 @@
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Union
+
+import cv2
+import numpy as np
+
+from face_utils import constants
+from face_utils.entites import ImageFaceJobEntity
+from face_utils.settings import SETTINGS
+
+
+OUTPUT_EXTENSIONS = {
+    constants.ImageOutputFormat.PNG: "png",
+    constants.ImageOutputFormat.JPEG: "jpg",
+    constants.ImageOutputFormat.WEBP: "webp",
+}
+ORIGIN_OUTPUT_FORMATS = {
+    "png": constants.ImageOutputFormat.PNG,
+    "jpg": constants.ImageOutputFormat.JPEG,
+    "jpeg": constants.ImageOutputFormat.JPEG,
+    "webp": constants.ImageOutputFormat.WEBP,
+}
+FACE_BOX_COLOR = (255, 0, 0)
+FACE_BOX_THICKNESS = 2
+# quality for jpeg/webp 1-100, compression level for png 0-9
+QUALITY_RANGES = {
+    constants.ImageOutputFormat.PNG: (0, 9),
+    constants.ImageOutputFormat.JPEG: (1, 100),
+    constants.ImageOutputFormat.WEBP: (1, 100),
+}
+
+
+@dataclass(frozen=True)
+class OutputEncoding:
+    output_format: constants.ImageOutputFormat
+    quality: int
+
+    @property
+    def extension(self) -> str:
+        return OUTPUT_EXTENSIONS[self.output_format]
+
+    @property
+    def imencode_params(self) -> List[int]:
+        if self.output_format == constants.ImageOutputFormat.PNG:
+            return [cv2.IMWRITE_PNG_COMPRESSION, self.quality]
+        if self.output_format == constants.ImageOutputFormat.JPEG:
+            return [cv2.IMWRITE_JPEG_QUALITY, self.quality]
+
+        return [cv2.IMWRITE_WEBP_QUALITY, self.quality]
+
+    @property
+    def key(self) -> str:
+        return f"{self.extension}-{self.quality}"
+
+
+def get_default_quality(output_format: constants.ImageOutputFormat) -> int:
+    if output_format == constants.ImageOutputFormat.PNG:
+        return SETTINGS.output_png_compression
+    if output_format == constants.ImageOutputFormat.JPEG:
+        return SETTINGS.output_jpeg_quality
+
+    return SETTINGS.output_webp_quality
+
+
+def resolve_output_encoding(
+    origin_filename: str,
+    output_format: Optional[constants.ImageOutputFormat] = None,
+    quality: Optional[int] = None,
+) -> OutputEncoding:
+    output_format = constants.ImageOutputFormat(output_format or SETTINGS.output_format)
+    if output_format == constants.ImageOutputFormat.SAME:
+        origin_extension = origin_filename.rsplit(".", 1)[-1].lower()
+        output_format = ORIGIN_OUTPUT_FORMATS.get(
+            origin_extension, constants.ImageOutputFormat.PNG
+        )
+
+    if quality is None:
+        quality = get_default_quality(output_format=output_format)
+
+    min_quality, max_quality = QUALITY_RANGES[output_format]
+    if not min_quality <= quality <= max_quality:
+        raise ValueError(
+            f"invalid quality for {output_format.value}, "
+            f"expected {min_quality}-{max_quality}"
+        )
+
+    return OutputEncoding(output_format=output_format, quality=quality)
+
+
+def is_job_rendered_by_detector(image_face_job: ImageFaceJobEntity) -> bool:
+    return image_face_job.output_mode != constants.JobOutputMode.COORDINATES
+
+
+FACE_BOX_FIELDS = ("x", "y", "width", "height")
+
+
+def get_job_faces(image_face_job: ImageFaceJobEntity) -> List:
+    return image_face_job.coordinates or []
+
+
+def to_face_boxes(faces: Optional[List]) -> Optional[List[Dict]]:
+    if faces is None:
+        return None
+
+    return [dict(zip(FACE_BOX_FIELDS, face)) for face in faces]
+
+
+def get_job_output_encoding(image_face_job: ImageFaceJobEntity) -> OutputEncoding:
+    # jobs store resolved encoding, jobs created before it fall back to settings
+    return resolve_output_encoding(
+        origin_filename=image_face_job.origin_filename,
+        output_format=image_face_job.output_format,
+        quality=image_face_job.output_quality,
+    )
+
+
+def decode_img(content: Union[np.ndarray, bytes, memoryview], flags: int) -> np.ndarray:
+    if not isinstance(content, np.ndarray):
+        content = np.frombuffer(content, dtype=np.uint8)
+
+    try:
+        img = cv2.imdecode(content, flags)
+    except cv2.error as exc:
+        raise ValueError("invalid origin file for face job") from exc
+
+    if img is None:
+        raise ValueError("invalid origin file for face job")
+
+    return img
+
+
+def draw_faces(img: np.ndarray, faces: List) -> None:
+    for x, y, w, h in faces:
+        cv2.rectangle(img, (x, y), (x + w, y + h), FACE_BOX_COLOR, FACE_BOX_THICKNESS)
+
+
+def encode_img(img: np.ndarray, encoding: OutputEncoding) -> np.ndarray:
+    # encoded buffer is written as is, no bytes copy
+    is_success, buffer = cv2.imencode(
+        f".{encoding.extension}", img, encoding.imencode_params
+    )
+    if not is_success:
+        raise ValueError("internal error for processed img")
+
+    return buffer
+
+
+def render_faces(
+    origin_content: Union[bytes, memoryview], faces: List, encoding: OutputEncoding
+) -> np.ndarray:
+    img = decode_img(origin_content, cv2.IMREAD_COLOR)
+    draw_faces(img=img, faces=faces)
+
+    return encode_img(img=img, encoding=encoding)
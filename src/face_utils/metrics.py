@@ -0,0 +1,108 @@
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+
+from prometheus_client import Counter, Gauge, Histogram
+
+
+# seconds, from sub-ms redis calls up to detector task timeout
+STAGE_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+)
+
+STAGE_DURATION = Histogram(
+    "face_stage_duration_seconds",
+    "Duration of face job pipeline stage",
+    labelnames=("stage",),
+    buckets=STAGE_BUCKETS,
+)
+JOBS_TOTAL = Counter(
+    "face_jobs_total",
+    "Face jobs moved to terminal state",
+    labelnames=("state",),
+)
+JOB_FAILURES_TOTAL = Counter(
+    "face_job_failures_total",
+    "Face jobs failed with unexpected exception, left pending for retry",
+)
+LANE_MSGS_TOTAL = Counter(
+    "face_lane_msgs_total",
+    "Job stream msgs read by consumers, by priority lane",
+    labelnames=("lane",),
+)
+ERRORS_TOTAL = Counter(
+    "face_errors_total",
+    "Exceptions swallowed by long running loops",
+    labelnames=("loop",),
+)
+ADMISSION_REJECTED_TOTAL = Counter(
+    "face_admission_rejected_total",
+    "Uploads rejected before storing, by reason",
+    labelnames=("reason",),
+)
+CONSUMER_CONCURRENCY = Gauge(
+    "face_consumer_concurrency",
+    "Running stream consumers of container",
+)
+STREAM_LENGTH = Gauge(
+    "face_stream_length",
+    "Entries in redis stream",
+    labelnames=("stream",),
+)
+STREAM_GROUP_PENDING = Gauge(
+    "face_stream_group_pending",
+    "Delivered but not acked entries of consumer group",
+    labelnames=("stream", "group"),
+)
+STREAM_GROUP_LAG = Gauge(
+    "face_stream_group_lag",
+    "Entries not yet delivered to consumer group, redis 7+",
+    labelnames=("stream", "group"),
+)
+
+
+@contextmanager
+def observe_stage(stage: str) -> Iterator[None]:
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_DURATION.labels(stage=stage).observe(time.perf_counter() - start)
+
+
+def observe_stage_durations(stage_durations: Dict[str, float]) -> None:
+    # durations measured in detector worker processes, observed in parent
+    for stage, duration in stage_durations.items():
+        STAGE_DURATION.labels(stage=stage).observe(duration)
+
+
+def set_stream_stats(
+    stream_name: str, stream_length: int, groups: Optional[List[Dict]]
+) -> None:
+    STREAM_LENGTH.labels(stream=stream_name).set(stream_length)
+    for group in groups or []:
+        group_name = group["name"]
+        if isinstance(group_name, bytes):
+            group_name = group_name.decode()
+
+        STREAM_GROUP_PENDING.labels(stream=stream_name, group=group_name).set(
+            group["pending"]
+        )
+        if group.get("lag") is not None:
+            STREAM_GROUP_LAG.labels(stream=stream_name, group=group_name).set(
+                group["lag"]
+            )
@@ -0,0 +1,88 @@
+"""
+Move files of flat bucket layout into shard dirs in place, e.g.:
+
+    $ python -m face_utils.migrate_storage --buckets origin processed --dry-run
+
+Safe to run while backend and consumers are up and to rerun after interruption,
+storage reads fall back to flat path until file is moved.
+"""
+import argparse
+import logging
+import os
+from typing import Iterable, List
+
+from face_utils.settings import SETTINGS
+from face_utils.storage import DirBucketStorage, dir_bucket_storage
+
+
+logger = logging.getLogger(__name__)
+
+
+def migrate_bucket(
+    storage: DirBucketStorage, bucket_name: str, dry_run: bool = False
+) -> int:
+    bucket_path = storage.get_legacy_file_path(filename="", bucket_name=bucket_name)
+    if not os.path.isdir(bucket_path):
+        logger.warning("bucket %s does not exists, skipping", bucket_name)
+        return 0
+
+    moved_count = 0
+    # scandir streams entries, listing of millions of names is never held in memory
+    with os.scandir(bucket_path) as entries:
+        for entry in entries:
+            if not entry.is_file(follow_symlinks=False):
+                continue
+            if entry.name.startswith(storage.TMP_FILE_PREFIX):
+                # write in progress or leftover of crashed one
+                continue
+
+            file_path = storage.get_file_path(entry.name, bucket_name=bucket_name)
+            if file_path == entry.path:
+                continue
+
+            if not dry_run:
+                os.makedirs(os.path.dirname(file_path), exist_ok=True)
+                os.replace(entry.path, file_path)
+            moved_count += 1
+
+    return moved_count
+
+
+def migrate_storage(
+    storage: DirBucketStorage, bucket_names: Iterable[str], dry_run: bool = False
+) -> None:
+    for bucket_name in bucket_names:
+        moved_count = migrate_bucket(
+            storage=storage, bucket_name=bucket_name, dry_run=dry_run
+        )
+        logger.info(
+            "bucket %s: %s %s files",
+            bucket_name,
+            "would move" if dry_run else "moved",
+            moved_count,
+        )
+
+
+def main(args: List[str] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--buckets",
+        nargs="+",
+        default=[
+            SETTINGS.origin_images_bucket_name,
+            SETTINGS.processed_images_bucket_name,
+        ],
+    )
+    parser.add_argument("--dry-run", action="store_true")
+    parsed_args = parser.parse_args(args)
+
+    migrate_storage(
+        storage=dir_bucket_storage,
+        bucket_names=parsed_args.buckets,
+        dry_run=parsed_args.dry_run,
+    )
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
@@ -13,7 +13,16 @@ class ImageFaceJobModel(Model):
     origin_filename = fields.CharField(max_length=255)
     processed_filename = fields.CharField(max_length=255, null=True)
     is_face_detected = fields.BooleanField(default=False)
-    coordinates = fields.CharField(max_length=256, null=True)
+    # list of [x, y, width, height] boxes, jsonb on postgres
+    coordinates = fields.JSONField(null=True)
+    client_tag = fields.CharField(max_length=64, null=True, index=True)
+    content_hash = fields.CharField(max_length=64, null=True, index=True)
+    output_format = fields.CharEnumField(
+        enum_type=constants.ImageOutputFormat, null=True
+    )
+    output_quality = fields.SmallIntField(null=True)
+    output_mode = fields.CharEnumField(enum_type=constants.JobOutputMode, null=True)
+    priority = fields.CharEnumField(enum_type=constants.JobPriority, null=True)
     modified_at = fields.DatetimeField(null=True, auto_now=True)
     created_at = fields.DatetimeField(null=True, auto_now_add=True)
 
@@ -1,9 +1,11 @@
 import dataclasses
+import datetime
 import uuid
-from typing import Union
+from typing import Dict, Iterable, List, Optional, Union
 
 from tortoise.exceptions import OperationalError
 
+from face_utils import constants
 from face_utils.core.repositories import Repository
 from face_utils.entites import ImageFaceJobEntity
 from face_utils.exceptions import RepositoryException
@@ -12,28 +14,96 @@ from face_utils.models import ImageFaceJobModel
 
 class ImageFaceJobRepository(Repository):
     TABLE_MODEL = ImageFaceJobModel
+    NOT_UPDATABLE_FIELDS = ("id", "created_at", "modified_at")
 
     async def save(self, obj: ImageFaceJobEntity) -> None:
         table_obj = self.TABLE_MODEL(**obj.as_dict)
         await table_obj.save()
 
-    async def update(self, obj: ImageFaceJobEntity) -> None:
+    async def bulk_save(self, objs: Iterable[ImageFaceJobEntity]) -> None:
+        table_objs = [self.TABLE_MODEL(**obj.as_dict) for obj in objs]
+        if not table_objs:
+            return
+
+        await self.TABLE_MODEL.bulk_create(table_objs)
+
+    def _get_update_values(
+        self, obj: ImageFaceJobEntity, update_fields: Optional[Iterable[str]]
+    ) -> Dict:
+        if update_fields is None:
+            update_fields = [
+                entity_attr.name
+                for entity_attr in dataclasses.fields(obj)
+                if entity_attr.name not in self.NOT_UPDATABLE_FIELDS
+            ]
+
+        # queryset update skips auto_now, set it explicitly
+        obj.modified_at = datetime.datetime.now()
+        return {
+            **{field_name: getattr(obj, field_name) for field_name in update_fields},
+            "modified_at": obj.modified_at,
+        }
+
+    async def update(
+        self,
+        obj: ImageFaceJobEntity,
+        update_fields: Optional[Iterable[str]] = None,
+        expected_state: Optional[constants.ImageFaceJobState] = None,
+        expected_null_fields: Iterable[str] = (),
+    ) -> bool:
+        query = self.TABLE_MODEL.filter(id=str(obj.id))
+        if expected_state is not None:
+            query = query.filter(state=expected_state)
+        for field_name in expected_null_fields:
+            query = query.filter(**{f"{field_name}__isnull": True})
+
         try:
-            table_obj = await self.TABLE_MODEL.get(id=str(obj.id))
-        except Exception as exc:
-            raise ValueError("invalid obj") from exc
+            updated_count = await query.update(
+                **self._get_update_values(obj=obj, update_fields=update_fields)
+            )
+        except (OperationalError, ValueError) as exc:
+            raise RepositoryException("invalid obj") from exc
 
-        for entity_attr in dataclasses.fields(obj):
-            setattr(table_obj, entity_attr.name, getattr(obj, entity_attr.name))
+        return updated_count > 0
 
-        await table_obj.save()
+    async def bulk_update(
+        self,
+        objs: Iterable[ImageFaceJobEntity],
+        update_fields: Iterable[str],
+        expected_state: Optional[constants.ImageFaceJobState] = None,
+    ) -> int:
+        update_fields = list(update_fields)
+        fields_map = self.TABLE_MODEL._meta.fields_map
+        table_objs = []
+        for obj in objs:
+            update_values = self._get_update_values(obj=obj, update_fields=update_fields)
+            table_obj = self.TABLE_MODEL(id=obj.id)
+            # bulk_update puts attrs into CASE as is, enums and json need db form
+            for field_name, value in update_values.items():
+                setattr(
+                    table_obj,
+                    field_name,
+                    fields_map[field_name].to_db_value(value, table_obj),
+                )
+            table_objs.append(table_obj)
+
+        if not table_objs:
+            return 0
+
+        query = self.TABLE_MODEL.all()
+        if expected_state is not None:
+            # rows moved to other state meanwhile are left as they are
+            query = query.filter(state=expected_state)
 
-    async def get(self, obj_id: Union[str, uuid.UUID]) -> ImageFaceJobEntity:
         try:
-            table_obj = await self.TABLE_MODEL.get(id=str(obj_id))
-        except OperationalError as exc:
-            raise RepositoryException("invalid id") from exc
+            return await query.bulk_update(
+                table_objs, fields=[*update_fields, "modified_at"]
+            )
+        except (OperationalError, ValueError) as exc:
+            raise RepositoryException("invalid objs") from exc
 
+    @staticmethod
+    def _to_entity(table_obj: ImageFaceJobModel) -> ImageFaceJobEntity:
         return ImageFaceJobEntity(
             **{
                 entity_attr.name: getattr(table_obj, entity_attr.name)
@@ -41,5 +111,59 @@ class ImageFaceJobRepository(Repository):
             }
         )
 
+    async def get(self, obj_id: Union[str, uuid.UUID]) -> ImageFaceJobEntity:
+        try:
+            table_obj = await self.TABLE_MODEL.get(id=str(obj_id))
+        except OperationalError as exc:
+            raise RepositoryException("invalid id") from exc
+
+        return self._to_entity(table_obj=table_obj)
+
+    async def get_many(
+        self, obj_ids: Iterable[Union[str, uuid.UUID]]
+    ) -> List[ImageFaceJobEntity]:
+        ids = [str(obj_id) for obj_id in obj_ids]
+        if not ids:
+            return []
+
+        try:
+            table_objs = await self.TABLE_MODEL.filter(id__in=ids)
+        except (OperationalError, ValueError) as exc:
+            raise RepositoryException("invalid id") from exc
+
+        return [self._to_entity(table_obj=table_obj) for table_obj in table_objs]
+
+    async def get_faces_stats(self, client_tag: Optional[str] = None) -> Dict:
+        # aggregated in postgres over jsonb boxes, no job rows loaded
+        tag_filter = "AND client_tag = $1" if client_tag is not None else ""
+        query = f"""
+            WITH boxes AS (
+                SELECT id, (box->>2)::int AS width, (box->>3)::int AS height
+                FROM {self.TABLE_MODEL._meta.db_table}
+                CROSS JOIN LATERAL jsonb_array_elements(coordinates) AS box
+                WHERE jsonb_typeof(coordinates) = 'array' {tag_filter}
+            ), job_faces AS (
+                SELECT count(*) AS faces FROM boxes GROUP BY id
+            )
+            SELECT
+                (SELECT count(*) FROM job_faces) AS jobs_with_faces,
+                (SELECT count(*) FROM boxes) AS faces,
+                (SELECT avg(faces) FROM job_faces)::float AS avg_faces_per_job,
+                (SELECT max(faces) FROM job_faces) AS max_faces_per_job,
+                avg(width)::float AS avg_box_width,
+                avg(height)::float AS avg_box_height,
+                avg(width * height)::float AS avg_box_area,
+                max(width * height) AS max_box_area
+            FROM boxes
+        """
+        values = [client_tag] if client_tag is not None else None
+
+        try:
+            rows = await self.TABLE_MODEL._meta.db.execute_query_dict(query, values)
+        except OperationalError as exc:
+            raise RepositoryException("invalid stats query") from exc
+
+        return rows[0]
+
 
 image_face_job_repository = ImageFaceJobRepository()
@@ -1,7 +1,12 @@
+import socket
 from functools import lru_cache
+from typing import Optional
 
+from pydantic import Field
 from pydantic_settings import BaseSettings
 
+from face_utils import constants
+
 
 class Settings(BaseSettings):
     postgres_db: str
@@ -9,15 +14,92 @@ class Settings(BaseSettings):
     postgres_port: str
     postgres_user: str
     postgres_password: str
+    # tortoise db url, e.g. sqlite:///tmp/bench.sqlite3, overrides postgres_* settings
+    database_url: Optional[str] = None
     dir_bucket_files_dir: str
     origin_images_bucket_name: str = "origin"
     processed_images_bucket_name: str = "processed"
+    storage_chunk_size: int = 1024 * 1024
+    # fsync stored file and its dir entry, durable on power loss but slower
+    storage_fsync: bool = False
+    # interactive lane, keeps pre-lanes name so queued jobs are still consumed
     job_stream_name: str = "process"
+    bulk_job_stream_name: str = "process_bulk"
+    job_lane_scheduling: constants.LaneScheduling = constants.LaneScheduling.WEIGHTED
+    # share of consumer reads per lane while both lanes have backlog
+    job_lane_interactive_weight: int = 4
+    job_lane_bulk_weight: int = 1
     stream_group_name: str = "process_group"
     ws_stream_name: str = "ws"
     redis_host: str
     redis_port: int
     static_dir: str
+    detector_pool_size: int = 2
+    detector_task_timeout: float = 30.0
+    # images per worker task, dnn backend runs them as one inference
+    detector_batch_size: int = 8
+    # longest image side used for detection, 0 - detect on full resolution
+    detector_max_dimension: int = 1280
+    detector_scale_factor: float = 1.1
+    detector_min_neighbors: int = 5
+    detector_min_size: int = 30
+    detector_backend: constants.DetectorBackendType = (
+        constants.DetectorBackendType.HAAR
+    )
+    detector_dnn_model_path: Optional[str] = None
+    detector_dnn_config_path: Optional[str] = None
+    detector_dnn_confidence: float = 0.5
+    detector_dnn_input_size: int = 300
+    output_format: constants.ImageOutputFormat = constants.ImageOutputFormat.PNG
+    output_jpeg_quality: int = 90
+    output_webp_quality: int = 90
+    # 0-9, lower is faster to encode and bigger
+    output_png_compression: int = 3
+    stream_read_count: int = 10
+    # consumers per container scale between min and max by group backlog and cpu load
+    consumer_min_concurrency: int = 1
+    consumer_max_concurrency: int = 8
+    consumer_scale_interval: float = 5.0
+    consumer_scale_down_idle_checks: int = 3
+    # cpu usage share above which consumers are stopped
+    consumer_scale_cpu_high: float = 0.9
+    consumer_scale_cpu_source: constants.CpuLoadSource = constants.CpuLoadSource.CGROUP
+    # detector workers busy time share above which consumers are not added
+    consumer_scale_detector_busy_high: float = 0.9
+    stream_block_ms: int = 5000
+    # keep stable across container restarts, consumers reclaim own backlog by name
+    stream_consumer_name: str = Field(default_factory=socket.gethostname)
+    stream_claim_min_idle_ms: int = 60000
+    stream_reclaim_interval: float = 30.0
+    stream_max_deliveries: int = 5
+    dead_letter_stream_name: str = "process_dead_letter"
+    stream_trim_strategy: constants.StreamTrimStrategy = (
+        constants.StreamTrimStrategy.MAXLEN
+    )
+    ws_stream_max_len: int = 10000
+    # hard cap on job stream XADD, may drop undelivered jobs - prefer trimmer
+    job_stream_max_len: Optional[int] = None
+    stream_min_id_age_seconds: int = 3600
+    stream_trim_interval: float = 60.0
+    ws_hub_read_count: int = 500
+    ws_hub_block_ms: int = 5000
+    ws_subscriber_buffer_size: int = 100
+    job_wait_max_seconds: int = 60
+    job_cache_max_size: int = 100000
+    job_cache_pending_ttl: float = 2.0
+    # detection results of identical origin content are reused, 0 - disabled
+    result_cache_ttl: int = 7 * 24 * 60 * 60
+    max_batch_files: int = 100
+    # 503 on upload while process group lag + pending is over it, 0 - off
+    admission_max_backlog: int = 10000
+    admission_backlog_refresh_interval: float = 1.0
+    admission_retry_after: int = 30
+    # per client token bucket in redis, jobs per second, 0 - off
+    rate_limit_per_second: float = 0
+    rate_limit_burst: int = 20
+    # prometheus scrape port of consumer container, 0 - disabled
+    consumer_metrics_port: int = 9100
+    metrics_stream_stats_interval: float = 5.0
 
     class Config:
         env_file = ".envs"
@@ -33,7 +115,8 @@ SETTINGS = get_settings()
 
 TORTOISE_CONFIG = {
     "connections": {
-        "default": {
+        "default": SETTINGS.database_url
+        or {
             "engine": "tortoise.backends.asyncpg",
             "credentials": {
                 "user": SETTINGS.postgres_user,
@@ -1,7 +1,11 @@
+import asyncio
+import hashlib
+import mmap
 import os
+import shutil
 import uuid
+from typing import BinaryIO, Callable, Iterable, Set, Tuple
 
-import aiofiles
 from fastapi import UploadFile
 
 from face_utils.core.storage import BucketStorage
@@ -11,13 +15,29 @@ from face_utils.settings import SETTINGS
 
 class DirBucketStorage(BucketStorage):
     FILENAME_SPLITTER = "."
+    TMP_FILE_PREFIX = "."
+    TMP_FILE_SUFFIX = ".tmp"
+    # <bucket>/ab/cd/abcd...ext - 65536 leaf dirs per bucket, nginx resolves same way
+    SHARD_DEPTH = 2
+    SHARD_WIDTH = 2
     STORAGE_DIR = SETTINGS.dir_bucket_files_dir
 
-    @staticmethod
-    def _create_bucket(bucket_path: str) -> None:
-        bucket_dir_exists = os.path.exists(bucket_path)
-        if not bucket_dir_exists:
-            os.makedirs(bucket_path)
+    def __init__(self, chunk_size: int, fsync: bool) -> None:
+        self._chunk_size = chunk_size
+        self._fsync = fsync
+        self._created_buckets: Set[str] = set()
+
+    def _create_bucket(self, bucket_path: str) -> None:
+        # cached, stat/mkdir syscalls only on first use of bucket/shard per process
+        if bucket_path in self._created_buckets:
+            return
+
+        os.makedirs(bucket_path, exist_ok=True)
+        self._created_buckets.add(bucket_path)
+
+    def create_buckets(self, bucket_names: Iterable[str]) -> None:
+        for bucket_name in bucket_names:
+            self._create_bucket(bucket_path=self._get_save_path(bucket_name=bucket_name))
 
     def _get_file_kind_from_filename(self, filename: str) -> str:
         try:
@@ -27,6 +47,9 @@ class DirBucketStorage(BucketStorage):
 
         return file_kind
 
+    def validate_filename(self, filename: str) -> None:
+        self._get_file_kind_from_filename(filename=filename)
+
     def _get_file_id_from_filename(self, filename: str) -> str:
         file_id, _ = filename.split(self.FILENAME_SPLITTER)
         return file_id
@@ -41,31 +64,253 @@ class DirBucketStorage(BucketStorage):
     def _get_filename(self, file_id: str, file_kind: str) -> str:
         return f"{file_id}{self.FILENAME_SPLITTER}{file_kind}"
 
+    def _get_shard_path(self, filename: str, bucket_name: str = None) -> str:
+        save_path = self._get_save_path(bucket_name=bucket_name)
+        shard_len = self.SHARD_DEPTH * self.SHARD_WIDTH
+        file_id = filename.split(self.FILENAME_SPLITTER)[0]
+        if len(file_id) < shard_len:
+            return save_path
+
+        shard_dirs = "/".join(
+            file_id[shard_start : shard_start + self.SHARD_WIDTH]
+            for shard_start in range(0, shard_len, self.SHARD_WIDTH)
+        )
+        return f"{save_path}/{shard_dirs}"
+
+    def get_file_path(self, filename: str, bucket_name: str = None) -> str:
+        return f"{self._get_shard_path(filename, bucket_name=bucket_name)}/{filename}"
+
+    def get_legacy_file_path(self, filename: str, bucket_name: str = None) -> str:
+        # flat layout from before sharding, files stay readable until migrated
+        return f"{self._get_save_path(bucket_name=bucket_name)}/{filename}"
+
+    def _get_read_file_paths(
+        self, filename: str, bucket_name: str = None
+    ) -> Tuple[str, ...]:
+        file_path = self.get_file_path(filename, bucket_name=bucket_name)
+        legacy_file_path = self.get_legacy_file_path(filename, bucket_name=bucket_name)
+        if file_path == legacy_file_path:
+            return (file_path,)
+
+        # sharded retried last, file may be moved by migration between two opens
+        return file_path, legacy_file_path, file_path
+
+    def _open_for_read(self, filename: str, bucket_name: str = None) -> BinaryIO:
+        for file_path in self._get_read_file_paths(filename, bucket_name=bucket_name):
+            try:
+                return open(file_path, "rb")
+            except FileNotFoundError:
+                continue
+
+        raise StorageException("filename does not exists")
+
+    def _stat_file(
+        self, filename: str, bucket_name: str = None
+    ) -> Tuple[str, os.stat_result]:
+        for file_path in self._get_read_file_paths(filename, bucket_name=bucket_name):
+            try:
+                return file_path, os.stat(file_path)
+            except FileNotFoundError:
+                continue
+
+        raise StorageException("filename does not exists")
+
+    async def stat_file(
+        self, filename: str, bucket_name: str = None
+    ) -> Tuple[str, os.stat_result]:
+        # resolved path and stat, lets web server stream file without reading it here
+        return await asyncio.to_thread(self._stat_file, filename, bucket_name)
+
+    def _get_tmp_file_path(self, save_path: str, filename: str) -> str:
+        # hidden in bucket dir, same filesystem so rename is atomic
+        return f"{save_path}/{self.TMP_FILE_PREFIX}{filename}{self.TMP_FILE_SUFFIX}"
+
+    def _write_tmp_file(
+        self, tmp_file_path: str, write: Callable[[BinaryIO], None]
+    ) -> None:
+        try:
+            with open(tmp_file_path, "wb") as out_file:
+                write(out_file)
+                if self._fsync:
+                    out_file.flush()
+                    os.fsync(out_file.fileno())
+        except BaseException:
+            self._remove_tmp_file(tmp_file_path=tmp_file_path)
+            raise
+
+    @staticmethod
+    def _remove_tmp_file(tmp_file_path: str) -> None:
+        # readers never see partial file, drop leftover of failed write
+        try:
+            os.unlink(tmp_file_path)
+        except FileNotFoundError:
+            pass
+
+    def _replace_tmp_file(
+        self, tmp_file_path: str, save_path: str, filename: str
+    ) -> None:
+        os.replace(tmp_file_path, f"{save_path}/{filename}")
+        if not self._fsync:
+            return
+
+        # renamed entry is durable only after its directory is synced
+        dir_fd = os.open(save_path, os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+    def _write_atomic(
+        self, save_path: str, filename: str, write: Callable[[BinaryIO], None]
+    ) -> None:
+        tmp_file_path = self._get_tmp_file_path(save_path=save_path, filename=filename)
+        self._write_tmp_file(tmp_file_path=tmp_file_path, write=write)
+        try:
+            self._replace_tmp_file(
+                tmp_file_path=tmp_file_path, save_path=save_path, filename=filename
+            )
+        except BaseException:
+            self._remove_tmp_file(tmp_file_path=tmp_file_path)
+            raise
+
+    def _write_file(self, file: BinaryIO, save_path: str, filename: str) -> None:
+        self._write_atomic(
+            save_path=save_path,
+            filename=filename,
+            write=lambda out_file: shutil.copyfileobj(file, out_file, self._chunk_size),
+        )
+
     async def save_file(self, file: UploadFile, bucket_name: str = None) -> str:
         file_id = uuid.uuid4()
-        save_path = self._get_save_path(bucket_name=bucket_name)
         file_kind = self._get_file_kind_from_filename(filename=file.filename)
         filename = self._get_filename(file_id=str(file_id), file_kind=file_kind)
+        save_path = self._get_shard_path(filename, bucket_name=bucket_name)
+        self._create_bucket(bucket_path=save_path)
 
-        if bucket_name:
-            self._create_bucket(bucket_path=save_path)
-
-        async with aiofiles.open(f"{save_path}/{filename}", "wb") as out_file:
-            while content := await file.read(1024):
-                await out_file.write(content)
+        # whole copy in one thread hop, instead of two hops per chunk
+        await file.seek(0)
+        await asyncio.to_thread(
+            self._write_file, file=file.file, save_path=save_path, filename=filename
+        )
 
         return filename
 
-    async def retrieve_file(self, filename: str, bucket_name: str = None) -> UploadFile:
-        file_path = self._get_save_path(bucket_name=bucket_name)
+    def _write_file_by_content(
+        self, file: BinaryIO, file_kind: str, bucket_name: str = None
+    ) -> Tuple[str, str]:
+        save_path = self._get_save_path(bucket_name=bucket_name)
+        tmp_file_path = self._get_tmp_file_path(
+            save_path=save_path, filename=str(uuid.uuid4())
+        )
+        content_hash = hashlib.sha256()
+
+        def write(out_file: BinaryIO) -> None:
+            # hashed while streamed, content is read once
+            while chunk := file.read(self._chunk_size):
+                content_hash.update(chunk)
+                out_file.write(chunk)
+
+        self._write_tmp_file(tmp_file_path=tmp_file_path, write=write)
 
+        filename = self._get_filename(
+            file_id=content_hash.hexdigest(), file_kind=file_kind
+        )
         try:
-            async with aiofiles.open(f"{file_path}/{filename}", "rb") as file:
-                file = await file.read(-1)
-        except FileNotFoundError as exc:
-            raise StorageException("filename does not exists") from exc
+            shard_path = self._get_shard_path(filename, bucket_name=bucket_name)
+            self._create_bucket(bucket_path=shard_path)
+            if os.path.exists(f"{shard_path}/{filename}"):
+                # same content already stored, keep existing copy
+                self._remove_tmp_file(tmp_file_path=tmp_file_path)
+            else:
+                self._replace_tmp_file(
+                    tmp_file_path=tmp_file_path, save_path=shard_path, filename=filename
+                )
+        except BaseException:
+            self._remove_tmp_file(tmp_file_path=tmp_file_path)
+            raise
+
+        return filename, content_hash.hexdigest()
+
+    async def save_file_by_content(
+        self, file: UploadFile, bucket_name: str = None
+    ) -> Tuple[str, str]:
+        # named by sha256 of content, identical uploads share one stored file
+        file_kind = self._get_file_kind_from_filename(filename=file.filename)
+        self._create_bucket(bucket_path=self._get_save_path(bucket_name=bucket_name))
+
+        await file.seek(0)
+        return await asyncio.to_thread(
+            self._write_file_by_content,
+            file=file.file,
+            file_kind=file_kind,
+            bucket_name=bucket_name,
+        )
+
+    def _read_file(self, filename: str, bucket_name: str = None) -> bytes:
+        with self._open_for_read(filename, bucket_name=bucket_name) as file:
+            return file.read()
+
+    async def retrieve_file(self, filename: str, bucket_name: str = None) -> UploadFile:
+        file = await asyncio.to_thread(self._read_file, filename, bucket_name)
 
         return UploadFile(file=file)  # type: ignore
 
+    def open_mmap(self, filename: str, bucket_name: str = None) -> memoryview:
+        # pages are loaded lazily by kernel, mapping lives as long as returned view
+        try:
+            with self._open_for_read(filename, bucket_name=bucket_name) as file:
+                file_mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError as exc:
+            raise StorageException("file is empty") from exc
+
+        return memoryview(file_mmap)
+
+    def _read_bytes(self, filename: str, bucket_name: str = None) -> memoryview:
+        with self._open_for_read(filename, bucket_name=bucket_name) as file:
+            data = bytearray(os.fstat(file.fileno()).st_size)
+            read_size = file.readinto(data)
+
+        return memoryview(data)[:read_size]
+
+    async def read_bytes(self, filename: str, bucket_name: str = None) -> memoryview:
+        return await asyncio.to_thread(self._read_bytes, filename, bucket_name)
+
+    def write_bytes_sync(
+        self, data: memoryview, file_kind: str, bucket_name: str = None
+    ) -> str:
+        filename = self._get_filename(file_id=str(uuid.uuid4()), file_kind=file_kind)
+        save_path = self._get_shard_path(filename, bucket_name=bucket_name)
+        self._create_bucket(bucket_path=save_path)
+
+        # buffered writer passes large buffer to os.write directly, no copy
+        self._write_atomic(
+            save_path=save_path,
+            filename=filename,
+            write=lambda out_file: out_file.write(memoryview(data).cast("B")),
+        )
+
+        return filename
+
+    async def write_bytes(
+        self, data: memoryview, file_kind: str, bucket_name: str = None
+    ) -> str:
+        return await asyncio.to_thread(
+            self.write_bytes_sync, data, file_kind, bucket_name
+        )
+
+    def _remove_file(self, filename: str, bucket_name: str = None) -> None:
+        for file_path in self._get_read_file_paths(filename, bucket_name=bucket_name):
+            try:
+                os.unlink(file_path)
+                return
+            except FileNotFoundError:
+                continue
+
+    async def remove_file(self, filename: str, bucket_name: str = None) -> None:
+        # missing file is not an error, removal is cleanup only
+        await asyncio.to_thread(self._remove_file, filename, bucket_name)
+
 
-dir_bucket_storage = DirBucketStorage()
+dir_bucket_storage = DirBucketStorage(
+    chunk_size=SETTINGS.storage_chunk_size, fsync=SETTINGS.storage_fsync
+)
@@ -1,21 +1,91 @@
 from __future__ import annotations
 
 import json
+import time
 import uuid
-from typing import Dict, Optional
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
 
 import redis
 from redis.asyncio import Redis
 from redis.exceptions import ResponseError
 
+from face_utils import constants
 from face_utils.core.streams import StreamWorker, StreamHandler
+from face_utils.settings import SETTINGS
+
+
+def _stream_id_key(stream_id: str) -> Tuple[int, int]:
+    ms, _, seq = stream_id.partition("-")
+    return int(ms), int(seq or 0)
+
+
+@dataclass
+class StreamTrimPolicy:
+    max_len: Optional[int] = None
+    min_id_age_seconds: Optional[int] = None
+
+    @property
+    def min_id(self) -> Optional[str]:
+        if self.min_id_age_seconds is None:
+            return None
+
+        return f"{int((time.time() - self.min_id_age_seconds) * 1000)}-0"
+
+    @property
+    def xadd_kwargs(self) -> Dict:
+        # approximate trimming lets redis drop whole macro nodes, O(1) amortized
+        if self.max_len is not None:
+            return {"maxlen": self.max_len, "approximate": True}
+        if self.min_id_age_seconds is not None:
+            return {"minid": self.min_id, "approximate": True}
+
+        return {}
+
+
+def get_stream_trim_policy(max_len: Optional[int]) -> StreamTrimPolicy:
+    if SETTINGS.stream_trim_strategy == constants.StreamTrimStrategy.MAXLEN:
+        return StreamTrimPolicy(max_len=max_len)
+    if SETTINGS.stream_trim_strategy == constants.StreamTrimStrategy.MINID:
+        return StreamTrimPolicy(min_id_age_seconds=SETTINGS.stream_min_id_age_seconds)
+
+    return StreamTrimPolicy()
+
+
+def get_group_backlog(stream_stats: Optional[Dict], group_name: str) -> Optional[int]:
+    # lag - not delivered yet, pending - delivered but not acked (in flight or lost)
+    if not stream_stats:
+        return None
+
+    for group in stream_stats["groups"]:
+        name = group["name"]
+        if isinstance(name, bytes):
+            name = name.decode()
+        if name == group_name:
+            return (group.get("lag") or 0) + group["pending"]
+
+    return None
+
+
+def get_job_stream_names() -> Dict[constants.JobPriority, str]:
+    # priority lanes of face jobs, each lane is own stream with own consumer group
+    return {
+        constants.JobPriority.INTERACTIVE: SETTINGS.job_stream_name,
+        constants.JobPriority.BULK: SETTINGS.bulk_job_stream_name,
+    }
 
 
 class RedisStreamHandler(StreamHandler):
-    def __init__(self, conn: Redis, stream_name: str) -> None:
+    def __init__(
+        self,
+        conn: Redis,
+        stream_name: str,
+        trim_policy: Optional[StreamTrimPolicy] = None,
+    ) -> None:
         self._conn = conn
         self._last_msg_id = "0"
         self._stream_name = stream_name
+        self._trim_policy = trim_policy or StreamTrimPolicy()
 
     async def iter_read(self) -> Optional[Dict]:
         data = await self._conn.xread(
@@ -27,10 +97,64 @@ class RedisStreamHandler(StreamHandler):
         msg_id, data = data[0][1][0]
         self._last_msg_id = msg_id.decode()
 
-        return {k.decode(): v.decode() for k, v in data.items()}
+        return self._decode_msg_data(msg_data=data)
+
+    @staticmethod
+    def _decode_msg_data(msg_data: Dict) -> Dict:
+        if b"data" in msg_data:
+            return json.loads(msg_data[b"data"].decode())
+
+        return {k.decode(): v.decode() for k, v in msg_data.items()}
+
+    async def read_batch(
+        self, count: int, block: Optional[int] = None
+    ) -> List[Tuple[str, Dict]]:
+        data = await self._conn.xread(
+            count=count, block=block, streams={self._stream_name: self._last_msg_id}
+        )
+        if not data:
+            return []
+
+        msgs = [
+            (msg_id.decode(), self._decode_msg_data(msg_data=msg_data))
+            for msg_id, msg_data in data[0][1]
+        ]
+        self._last_msg_id = msgs[-1][0]
+
+        return msgs
+
+    async def read_latest(self) -> Optional[Tuple[str, Dict]]:
+        data = await self._conn.xrevrange(self._stream_name, count=1)
+        if not data:
+            return None
+
+        msg_id, msg_data = data[0]
+        return msg_id.decode(), self._decode_msg_data(msg_data=msg_data)
+
+    async def seek_to_latest(self) -> None:
+        # unlike "$" a concrete id does not lose msgs added between blocking reads
+        latest = await self.read_latest()
+        self._last_msg_id = latest[0] if latest else "0-0"
 
     async def write(self, data: Dict) -> None:
-        await self._conn.xadd(self._stream_name, data)
+        await self._conn.xadd(
+            self._stream_name,
+            {"data": json.dumps(data)},
+            **self._trim_policy.xadd_kwargs,
+        )
+
+    async def write_many(self, data_list: List[Dict]) -> None:
+        if not data_list:
+            return
+
+        async with self._conn.pipeline(transaction=False) as pipe:
+            for data in data_list:
+                pipe.xadd(
+                    self._stream_name,
+                    {"data": json.dumps(data)},
+                    **self._trim_policy.xadd_kwargs,
+                )
+            await pipe.execute()
 
     async def destroy(self) -> None:
         await self._conn.aclose()
@@ -39,24 +163,58 @@ class RedisStreamHandler(StreamHandler):
 class RedisStreamWorker(StreamWorker):
     GROUP_CREATE_ID = "0-0"
 
-    def __init__(self, conn: Redis, stream_name: str, group_name: str) -> None:
+    def __init__(
+        self,
+        conn: Redis,
+        stream_name: str,
+        group_name: str,
+        name: Optional[str] = None,
+        trim_policy: Optional[StreamTrimPolicy] = None,
+    ) -> None:
         self._conn = conn
         self._current_msg = None
         self._group_name = group_name
         self._stream_name = stream_name
-        self._name = str(uuid.uuid4())
+        self._name = name or str(uuid.uuid4())
+        self._trim_policy = trim_policy or StreamTrimPolicy()
+        self._claim_start_id = self.GROUP_CREATE_ID
 
-    async def _get_stream_stats(self) -> Optional[Dict]:
+    async def get_stream_stats(self) -> Optional[Dict]:
+        # one round trip for group pending/lag and stream length
         try:
-            return await self._conn.xinfo_groups(self.stream_name)
+            async with self._conn.pipeline(transaction=False) as pipe:
+                pipe.xinfo_groups(self.stream_name)
+                pipe.xlen(self.stream_name)
+                groups, stream_length = await pipe.execute()
         except (ValueError, AttributeError, ResponseError):
             return None
 
+        return {"groups": groups, "length": stream_length}
+
+    @staticmethod
+    def _parse_msg_data(msg_data: Optional[Dict]) -> Optional[Dict]:
+        # entries deleted from stream still have pending id, but no data
+        if not msg_data or b"data" not in msg_data:
+            return None
+
+        return json.loads(msg_data[b"data"].decode())
+
     @classmethod
     async def setup_group(
-        cls, conn: Redis, stream_name: str, group_name: str
+        cls,
+        conn: Redis,
+        stream_name: str,
+        group_name: str,
+        name: Optional[str] = None,
+        trim_policy: Optional[StreamTrimPolicy] = None,
     ) -> RedisStreamWorker:
-        instance = cls(conn=conn, stream_name=stream_name, group_name=group_name)
+        instance = cls(
+            conn=conn,
+            stream_name=stream_name,
+            group_name=group_name,
+            name=name,
+            trim_policy=trim_policy,
+        )
 
         try:
             await conn.xgroup_create(
@@ -71,7 +229,24 @@ class RedisStreamWorker(StreamWorker):
         return instance
 
     async def push_to_stream(self, data: Dict) -> None:
-        await self._conn.xadd(self.stream_name, {"data": json.dumps(data)})
+        await self._conn.xadd(
+            self.stream_name,
+            {"data": json.dumps(data)},
+            **self._trim_policy.xadd_kwargs,
+        )
+
+    async def push_many_to_stream(self, data_list: List[Dict]) -> None:
+        if not data_list:
+            return
+
+        async with self._conn.pipeline(transaction=False) as pipe:
+            for data in data_list:
+                pipe.xadd(
+                    self.stream_name,
+                    {"data": json.dumps(data)},
+                    **self._trim_policy.xadd_kwargs,
+                )
+            await pipe.execute()
 
     async def ack_current_msg(self) -> None:
         await self._conn.xack(self.stream_name, self.group_name, self.current_msg_id)
@@ -91,6 +266,81 @@ class RedisStreamWorker(StreamWorker):
 
         return None
 
+    async def read_batch_from_stream(
+        self, count: int, block: Optional[int] = None, from_id: str = ">"
+    ) -> List[Tuple[str, Optional[Dict]]]:
+        readed_data = await self._conn.xreadgroup(
+            count=count,
+            block=block,
+            noack=False,
+            consumername=self.name,
+            groupname=self.group_name,
+            streams={self.stream_name: from_id},
+        )
+        if not readed_data:
+            return []
+
+        return [
+            (msg_id.decode(), self._parse_msg_data(msg_data=msg_data))
+            for msg_id, msg_data in readed_data[0][1]
+        ]
+
+    async def read_pending_from_stream(
+        self, count: int, start_id: str = "0"
+    ) -> List[Tuple[str, Optional[Dict]]]:
+        # returns msgs after start_id already delivered to this consumer but never acked
+        return await self.read_batch_from_stream(count=count, from_id=start_id)
+
+    async def claim_idle_msgs(
+        self, min_idle_time: int, count: int
+    ) -> List[Tuple[str, Optional[Dict]]]:
+        claimed_data = await self._conn.xautoclaim(
+            name=self.stream_name,
+            groupname=self.group_name,
+            consumername=self.name,
+            min_idle_time=min_idle_time,
+            start_id=self._claim_start_id,
+            count=count,
+        )
+        next_start_id, claimed_msgs = claimed_data[0], claimed_data[1]
+        self._claim_start_id = (
+            next_start_id.decode()
+            if isinstance(next_start_id, bytes)
+            else next_start_id
+        )
+
+        return [
+            (msg_id.decode(), self._parse_msg_data(msg_data=msg_data))
+            for msg_id, msg_data in claimed_msgs
+        ]
+
+    async def get_delivery_counts(self, msg_ids: List[str]) -> Dict[str, int]:
+        if not msg_ids:
+            return {}
+
+        async with self._conn.pipeline(transaction=False) as pipe:
+            for msg_id in msg_ids:
+                pipe.xpending_range(
+                    name=self.stream_name,
+                    groupname=self.group_name,
+                    min=msg_id,
+                    max=msg_id,
+                    count=1,
+                )
+            pending_data = await pipe.execute()
+
+        return {
+            msg_id: msg_pending[0]["times_delivered"]
+            for msg_id, msg_pending in zip(msg_ids, pending_data)
+            if msg_pending
+        }
+
+    async def ack_msgs(self, msg_ids: List[str]) -> None:
+        if not msg_ids:
+            return
+
+        await self._conn.xack(self.stream_name, self.group_name, *msg_ids)
+
     async def destroy(self) -> None:
         await self._conn.aclose()
 
@@ -113,3 +363,80 @@ class RedisStreamWorker(StreamWorker):
     @property
     def current_msg_id(self) -> str:
         return self.current_msg[0][1][0][0]
+
+
+async def read_batch_from_workers(
+    workers: List[RedisStreamWorker], count: int, block: Optional[int] = None
+) -> List[Tuple[RedisStreamWorker, List[Tuple[str, Optional[Dict]]]]]:
+    # one XREADGROUP over streams of workers sharing group and consumer name,
+    # blocking call returns as soon as any of streams has new msgs
+    workers_by_stream = {worker.stream_name: worker for worker in workers}
+    readed_data = await workers[0]._conn.xreadgroup(
+        count=count,
+        block=block,
+        noack=False,
+        consumername=workers[0].name,
+        groupname=workers[0].group_name,
+        streams={worker.stream_name: ">" for worker in workers},
+    )
+
+    return [
+        (
+            workers_by_stream[stream_name.decode()],
+            [
+                (msg_id.decode(), RedisStreamWorker._parse_msg_data(msg_data=msg_data))
+                for msg_id, msg_data in stream_msgs
+            ],
+        )
+        for stream_name, stream_msgs in readed_data or []
+        if stream_msgs
+    ]
+
+
+class RedisStreamTrimmer:
+    def __init__(
+        self,
+        conn: Redis,
+        stream_name: str,
+        trim_policy: Optional[StreamTrimPolicy] = None,
+    ) -> None:
+        self._conn = conn
+        self._stream_name = stream_name
+        self._trim_policy = trim_policy or StreamTrimPolicy()
+
+    async def _get_safe_min_id(self) -> Optional[str]:
+        # entries below oldest pending (or last delivered) id are acked by all groups
+        try:
+            groups = await self._conn.xinfo_groups(self._stream_name)
+        except ResponseError:
+            return None
+
+        if not groups:
+            return None
+
+        group_min_ids = []
+        for group in groups:
+            group_min_id = group["last-delivered-id"].decode()
+            if group["pending"]:
+                pending = await self._conn.xpending(
+                    self._stream_name, group["name"].decode()
+                )
+                group_min_id = pending["min"].decode()
+            group_min_ids.append(group_min_id)
+
+        return min(group_min_ids, key=_stream_id_key)
+
+    async def trim(self) -> int:
+        min_id = await self._get_safe_min_id()
+        if min_id is None:
+            return 0
+
+        policy_min_id = self._trim_policy.min_id
+        if policy_min_id is not None:
+            min_id = min(min_id, policy_min_id, key=_stream_id_key)
+
+        return await self._conn.xtrim(self._stream_name, minid=min_id, approximate=True)
+
+    @property
+    def stream_name(self) -> str:
+        return self._stream_name
@@ -0,0 +1,101 @@
+import pytest
+
+from face_backend.core import admission
+from face_backend.core.admission import (
+    AdmissionController,
+    RedisTokenBucket,
+    StreamBacklogMonitor,
+)
+from face_backend.main import handle_overload_exception, handle_rate_limit_exception
+from face_utils import constants
+from face_utils.exceptions import OverloadException, RateLimitException
+from face_utils.streams import RedisStreamWorker
+
+
+TEST_STREAM_NAME = "test_process"
+TEST_GROUP_NAME = "test_process_group"
+TEST_CLIENT_ID = "127.0.0.1"
+
+
+@pytest.fixture
+def f_now(mocker):
+    return mocker.patch.object(admission.time, "time", return_value=1000.0)
+
+
+@pytest.fixture
+async def f_backlog_monitor(fake_redis_conn):
+    stream_worker = await RedisStreamWorker.setup_group(
+        conn=fake_redis_conn,
+        stream_name=TEST_STREAM_NAME,
+        group_name=TEST_GROUP_NAME,
+        name="consumer",
+    )
+    return StreamBacklogMonitor(stream_worker=stream_worker, refresh_interval=60)
+
+
+def _create_controller(
+    backlog_monitor: StreamBacklogMonitor, rate_limiter: RedisTokenBucket
+) -> AdmissionController:
+    return AdmissionController(
+        backlog_monitors={constants.JobPriority.INTERACTIVE: backlog_monitor},
+        rate_limiter=rate_limiter,
+        max_backlog=2,
+        retry_after=5,
+    )
+
+
+async def test_token_bucket_keeps_rate_for_batch_bigger_than_burst(
+    fake_redis_conn, f_now
+):
+    rate_limiter = RedisTokenBucket(conn=fake_redis_conn, rate=1, burst=2)
+
+    # admitted on full bucket, 10 s of debt must be repaid before next token
+    assert await rate_limiter.acquire(key=TEST_CLIENT_ID, cost=10) == 0
+    assert await rate_limiter.acquire(key=TEST_CLIENT_ID, cost=1) == 9
+
+    f_now.return_value += 9
+    assert await rate_limiter.acquire(key=TEST_CLIENT_ID, cost=1) == 0
+    assert await rate_limiter.acquire(key=TEST_CLIENT_ID, cost=10) == 2
+
+    f_now.return_value += 2
+    assert await rate_limiter.acquire(key=TEST_CLIENT_ID, cost=10) == 0
+
+
+async def test_admit_rejects_client_over_rate_limit_with_429(
+    fake_redis_conn, f_now, f_backlog_monitor
+):
+    admission_controller = _create_controller(
+        backlog_monitor=f_backlog_monitor,
+        rate_limiter=RedisTokenBucket(conn=fake_redis_conn, rate=0.5, burst=2),
+    )
+    await admission_controller.admit(client_id=TEST_CLIENT_ID, cost=2)
+    # other client has own bucket
+    await admission_controller.admit(client_id="127.0.0.2", cost=2)
+
+    with pytest.raises(RateLimitException) as exc_info:
+        await admission_controller.admit(client_id=TEST_CLIENT_ID)
+    response = await handle_rate_limit_exception(request=None, exc=exc_info.value)
+
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "2"
+
+
+async def test_admit_rejects_lane_over_max_backlog_with_503(
+    fake_redis_conn, f_now, f_backlog_monitor
+):
+    admission_controller = _create_controller(
+        backlog_monitor=f_backlog_monitor,
+        rate_limiter=RedisTokenBucket(conn=fake_redis_conn, rate=0, burst=0),
+    )
+    for _ in range(2):
+        await fake_redis_conn.xadd(TEST_STREAM_NAME, {"data": "{}"})
+    # first request schedules backlog refresh, it never waits for redis
+    await admission_controller.admit(client_id=TEST_CLIENT_ID)
+    await f_backlog_monitor._refresh_task
+
+    with pytest.raises(OverloadException) as exc_info:
+        await admission_controller.admit(client_id=TEST_CLIENT_ID)
+    response = await handle_overload_exception(request=None, exc=exc_info.value)
+
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "5"
@@ -1,4 +1,5 @@
 import tempfile
+import time
 import uuid
 
 import pytest
@@ -170,10 +171,255 @@ async def test_e2e_test_for_face_job_with_image_that_contains_face(test_client):
 
     assert data_2["state"] == constants.ImageFaceJobState.FINISHED.value
     assert data_2["is_face_detected"] is True
-    assert data_2["coordinates"] == "[[110, 107, 265, 265]]"
+    assert data_2["coordinates"] == [{"x": 110, "y": 107, "width": 265, "height": 265}]
 
     response_3 = await test_client.get(
         app.url_path_for("get_face_job_processed_image", face_job_id=job_id)
     )
 
     assert response_3.status_code == 200
+
+
+async def test_get_face_job_with_wait_return_finished_job(test_client):
+    with open("/app/tests/data/no_face.png", "rb") as file:
+        response_1 = await test_client.post(
+            app.url_path_for("create_face_job"),
+            files={"file": ("test_1.png", file.read(), "image/png")},
+        )
+
+    assert response_1.status_code == 201
+
+    response_2 = await test_client.get(
+        app.url_path_for("get_face_job", face_job_id=response_1.json()["id"]),
+        params={"wait": 10},
+    )
+
+    assert response_2.status_code == 200
+    assert response_2.json()["state"] == constants.ImageFaceJobState.FINISHED.value
+
+
+async def test_create_face_jobs_valid_data_create_face_job_for_every_file(
+    test_client,
+):
+    with open("/app/tests/data/face.png", "rb") as face_file, open(
+        "/app/tests/data/no_face.png", "rb"
+    ) as no_face_file:
+        response = await test_client.post(
+            app.url_path_for("create_face_jobs"),
+            files=[
+                ("files", ("test_1.png", face_file.read(), "image/png")),
+                ("files", ("test_2.png", no_face_file.read(), "image/png")),
+            ],
+        )
+
+    assert response.status_code == 201
+
+    data = response.json()
+
+    assert len(data) == 2
+    for job_data in data:
+        assert await ImageFaceJobModel.filter(id=job_data["id"]).exists()
+
+
+async def test_create_face_jobs_with_one_file_not_image_data(test_client):
+    with open("/app/tests/data/face.png", "rb") as face_file:
+        response = await test_client.post(
+            app.url_path_for("create_face_jobs"),
+            files=[
+                ("files", ("test_1.png", face_file.read(), "image/png")),
+                ("files", ("test_2.png", b"test", "text/plain")),
+            ],
+        )
+
+    assert response.status_code == 400
+    assert "content_type" in response.text
+
+
+async def test_create_face_job_with_same_content_finish_job_from_cached_result(
+    test_client,
+):
+    with open("/app/tests/data/face.png", "rb") as file:
+        content = file.read()
+
+    response_1 = await test_client.post(
+        app.url_path_for("create_face_job"),
+        files={"file": ("test_1.png", content, "image/png")},
+    )
+    await wait_for_job_finish(test_client=test_client, job_id=response_1.json()["id"])
+
+    response_2 = await test_client.post(
+        app.url_path_for("create_face_job"),
+        files={"file": ("test_2.png", content, "image/png")},
+    )
+
+    assert response_2.status_code == 201
+
+    job_1 = await ImageFaceJobModel.get(id=response_1.json()["id"])
+    job_2 = await ImageFaceJobModel.get(id=response_2.json()["id"])
+
+    assert job_2.state == constants.ImageFaceJobState.FINISHED
+    assert job_2.origin_filename == job_1.origin_filename
+    assert job_2.processed_filename == job_1.processed_filename
+
+
+async def test_get_face_job_processed_image_with_etag_and_range(test_client):
+    with open("/app/tests/data/face.png", "rb") as file:
+        response_1 = await test_client.post(
+            app.url_path_for("create_face_job"),
+            files={"file": ("test_1.png", file.read(), "image/png")},
+        )
+
+    job_id = response_1.json()["id"]
+
+    await wait_for_job_finish(test_client=test_client, job_id=job_id)
+
+    url = app.url_path_for("get_face_job_processed_image", face_job_id=job_id)
+    response_2 = await test_client.get(url)
+
+    assert response_2.status_code == 200
+    assert response_2.headers["content-type"] == "image/png"
+    assert "immutable" in response_2.headers["cache-control"]
+
+    response_3 = await test_client.get(
+        url, headers={"if-none-match": response_2.headers["etag"]}
+    )
+
+    assert response_3.status_code == 304
+
+    response_4 = await test_client.get(url, headers={"range": "bytes=0-9"})
+
+    assert response_4.status_code == 206
+    assert response_4.content == response_2.content[:10]
+
+
+async def test_create_face_job_with_output_format_serve_processed_image_in_format(
+    test_client,
+):
+    with open("/app/tests/data/face.png", "rb") as file:
+        response_1 = await test_client.post(
+            app.url_path_for("create_face_job"),
+            files={"file": ("test_1.png", file.read(), "image/png")},
+            params={"output_format": "jpeg", "quality": 80},
+        )
+
+    assert response_1.status_code == 201
+
+    job_id = response_1.json()["id"]
+
+    await wait_for_job_finish(test_client=test_client, job_id=job_id)
+
+    response_2 = await test_client.get(
+        app.url_path_for("get_face_job_processed_image", face_job_id=job_id)
+    )
+
+    assert response_2.status_code == 200
+    assert response_2.headers["content-type"] == "image/jpeg"
+
+
+async def test_create_face_job_with_invalid_png_compression(test_client):
+    with open("/app/tests/data/face.png", "rb") as file:
+        response = await test_client.post(
+            app.url_path_for("create_face_job"),
+            files={"file": ("test_1.png", file.read(), "image/png")},
+            params={"output_format": "png", "quality": 80},
+        )
+
+    assert response.status_code == 400
+    assert "quality" in response.text
+
+
+async def test_create_face_job_with_coordinates_output_render_processed_image_lazily(
+    test_client,
+):
+    with open("/app/tests/data/face.png", "rb") as file:
+        response_1 = await test_client.post(
+            app.url_path_for("create_face_job"),
+            files={"file": ("test_1.png", file.read(), "image/png")},
+            params={"output": "coordinates"},
+        )
+
+    assert response_1.status_code == 201
+
+    job_id = response_1.json()["id"]
+
+    await wait_for_job_finish(test_client=test_client, job_id=job_id)
+
+    job = await ImageFaceJobModel.get(id=job_id)
+
+    assert job.is_face_detected is True
+    assert job.processed_filename is None
+
+    response_2 = await test_client.get(
+        app.url_path_for("get_face_job_processed_image", face_job_id=job_id)
+    )
+
+    assert response_2.status_code == 200
+
+    await job.refresh_from_db()
+
+    assert job.processed_filename is not None
+
+
+async def test_faces_stats_aggregate_boxes_of_tagged_jobs(test_client):
+    tag = str(uuid.uuid4())
+
+    with open("/app/tests/data/face.png", "rb") as file:
+        response_1 = await test_client.post(
+            app.url_path_for("create_face_job"),
+            files={"file": ("test_1.png", file.read(), "image/png")},
+            params={"tag": tag},
+        )
+
+    await wait_for_job_finish(test_client=test_client, job_id=response_1.json()["id"])
+
+    response_2 = await test_client.get(
+        app.url_path_for("faces_stats"), params={"tag": tag}
+    )
+
+    assert response_2.status_code == 200
+
+    data_2 = response_2.json()
+
+    assert data_2["jobs_with_faces"] == 1
+    assert data_2["faces"] == 1
+    assert data_2["max_box_area"] == 265 * 265
+
+
+async def test_create_face_job_with_bulk_priority(test_client):
+    with open("/app/tests/data/face.png", "rb") as file:
+        response_1 = await test_client.post(
+            app.url_path_for("create_face_job"),
+            files={"file": ("test_1.png", file.read(), "image/png")},
+            params={"priority": "bulk", "output": "coordinates"},
+        )
+
+    assert response_1.status_code == 201
+
+    job_id = response_1.json()["id"]
+
+    await wait_for_job_finish(test_client=test_client, job_id=job_id)
+
+    job = await ImageFaceJobModel.get(id=job_id)
+
+    assert job.priority == constants.JobPriority.BULK
+    assert job.is_face_detected is True
+
+
+async def test_get_face_job_wait_with_uppercase_id_returns_on_finish(test_client):
+    with open("/app/tests/data/face.png", "rb") as file:
+        response_1 = await test_client.post(
+            app.url_path_for("create_face_job"),
+            files={"file": ("test_1.png", file.read(), "image/png")},
+        )
+
+    job_id = response_1.json()["id"]
+    start = time.monotonic()
+
+    response_2 = await test_client.get(
+        app.url_path_for("get_face_job", face_job_id=job_id.upper()),
+        params={"wait": 30},
+    )
+
+    assert response_2.status_code == 200
+    assert response_2.json()["state"] == constants.ImageFaceJobState.FINISHED.value
+    assert time.monotonic() - start < 30
@@ -42,3 +42,30 @@ async def test_it_is_possible_to_receive_echo_face_job_data(
     assert job_data["id"] == ws_data["job_id"]
     assert job_data["is_face_detected"] is True
     assert job_data["processed_filename"] == ws_processed_filename
+
+
+async def test_subscribe_to_finished_job_receive_job_final_state(
+    test_client, ws_test_client
+):
+    with open("/app/tests/data/no_face.png", "rb") as file:
+        job_response = await test_client.post(
+            app.url_path_for("create_face_job"),
+            files={"file": ("test_1.png", file.read(), "image/png")},
+            params={"tag": "foo"},
+        )
+
+    assert job_response.status_code == 201
+
+    job_id = job_response.json()["id"]
+
+    await wait_for_job_finish(test_client=test_client, job_id=job_id)
+
+    with ws_test_client.websocket_connect("/faces") as websocket:
+        websocket.send_text(json.dumps({"action": "subscribe", "job_ids": [job_id]}))
+        ws_data = websocket.receive_json()
+
+    assert ws_data["job_id"] == job_id
+    assert ws_data["state"] == "finished"
+    assert ws_data["client_tag"] == "foo"
+    assert ws_data["is_face_detected"] is False
+    assert ws_data["processed_url"] is None
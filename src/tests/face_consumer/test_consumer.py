@@ -0,0 +1,231 @@
+import datetime
+import os
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from face_consumer import engine
+from face_consumer.consumer import ImageFaceJobProducer
+from face_consumer.engine import detector_engine
+from face_consumer.lanes import LaneScheduler
+from face_utils import constants
+from face_utils.cache import DetectionResultCache
+from face_utils.entites import ImageFaceJobEntity
+from face_utils.repositories import image_face_job_repository
+from face_utils.settings import SETTINGS
+from face_utils.storage import dir_bucket_storage
+from face_utils.streams import RedisStreamHandler, RedisStreamWorker
+
+
+TEST_STREAM_NAME = "test_process"
+TEST_GROUP_NAME = "test_process_group"
+TEST_DEAD_LETTER_STREAM_NAME = "test_process_dead_letter"
+
+
+@pytest.fixture
+def f_consumer_factory(fake_redis_conn):
+    async def create_consumer(name: str) -> ImageFaceJobProducer:
+        stream_worker = await RedisStreamWorker.setup_group(
+            conn=fake_redis_conn,
+            stream_name=TEST_STREAM_NAME,
+            group_name=TEST_GROUP_NAME,
+            name=name,
+        )
+        return ImageFaceJobProducer(
+            stream_workers={constants.JobPriority.INTERACTIVE: stream_worker},
+            lane_scheduler=LaneScheduler(
+                weights={constants.JobPriority.INTERACTIVE: 1}, strict=True
+            ),
+            ws_stream_handler=RedisStreamHandler(
+                conn=fake_redis_conn, stream_name="test_ws"
+            ),
+            dead_letter_stream_handler=RedisStreamHandler(
+                conn=fake_redis_conn, stream_name=TEST_DEAD_LETTER_STREAM_NAME
+            ),
+            result_cache=DetectionResultCache(
+                conn=fake_redis_conn, ttl=0, fingerprint="test"
+            ),
+        )
+
+    return create_consumer
+
+
+@pytest.fixture
+def f_job_ids():
+    return [str(uuid.uuid4()) for _ in range(3)]
+
+
+@pytest.fixture
+def f_pending_jobs(mocker, f_job_ids):
+    image_face_jobs = [
+        ImageFaceJobEntity(
+            id=uuid.UUID(job_id),
+            created_at=datetime.datetime.now(),
+            modified_at=datetime.datetime.now(),
+            state=constants.ImageFaceJobState.PENDING,
+        )
+        for job_id in f_job_ids
+    ]
+    mocker.patch.object(
+        image_face_job_repository, "get_many", return_value=image_face_jobs
+    )
+
+    return image_face_jobs
+
+
+async def _push_and_deliver(fake_redis_conn, job_ids, consumer_name: str) -> None:
+    stream_worker = await RedisStreamWorker.setup_group(
+        conn=fake_redis_conn,
+        stream_name=TEST_STREAM_NAME,
+        group_name=TEST_GROUP_NAME,
+        name=consumer_name,
+    )
+    await stream_worker.push_many_to_stream(
+        data_list=[{"id": job_id} for job_id in job_ids]
+    )
+    # read without ack, consumer "died" with msgs in flight
+    await stream_worker.read_batch_from_stream(count=len(job_ids))
+
+
+async def _get_pending_count(fake_redis_conn) -> int:
+    pending = await fake_redis_conn.xpending(TEST_STREAM_NAME, TEST_GROUP_NAME)
+    return pending["pending"]
+
+
+async def test_reclaim_takes_over_idle_msgs_of_other_consumer(
+    monkeypatch, mocker, fake_redis_conn, f_consumer_factory, f_job_ids
+):
+    monkeypatch.setattr(SETTINGS, "stream_claim_min_idle_ms", 0)
+    # finished by other consumer meanwhile, reclaimed msgs are only acked
+    mocker.patch.object(image_face_job_repository, "get_many", return_value=[])
+    await _push_and_deliver(
+        fake_redis_conn=fake_redis_conn, job_ids=f_job_ids, consumer_name="dead"
+    )
+    consumer = await f_consumer_factory(name="alive")
+
+    await consumer._reclaim()
+
+    assert await _get_pending_count(fake_redis_conn=fake_redis_conn) == 0
+    assert await fake_redis_conn.xlen(TEST_DEAD_LETTER_STREAM_NAME) == 0
+
+
+async def test_reclaim_moves_msgs_over_max_deliveries_to_dead_letter(
+    monkeypatch, mocker, fake_redis_conn, f_consumer_factory, f_job_ids
+):
+    monkeypatch.setattr(SETTINGS, "stream_claim_min_idle_ms", 0)
+    monkeypatch.setattr(SETTINGS, "stream_max_deliveries", 1)
+    mocker.patch.object(image_face_job_repository, "get_many", return_value=[])
+    await _push_and_deliver(
+        fake_redis_conn=fake_redis_conn, job_ids=f_job_ids, consumer_name="dead"
+    )
+    consumer = await f_consumer_factory(name="alive")
+
+    # claim is second delivery
+    await consumer._reclaim()
+
+    assert await _get_pending_count(fake_redis_conn=fake_redis_conn) == 0
+
+    dead_letter_msgs = await RedisStreamHandler(
+        conn=fake_redis_conn, stream_name=TEST_DEAD_LETTER_STREAM_NAME
+    ).read_batch(count=10)
+
+    assert [msg_data["data"]["id"] for _, msg_data in dead_letter_msgs] == f_job_ids
+    assert {msg_data["deliveries"] for _, msg_data in dead_letter_msgs} == {2}
+    assert {msg_data["stream"] for _, msg_data in dead_letter_msgs} == {
+        TEST_STREAM_NAME
+    }
+
+
+async def test_own_backlog_failed_msgs_are_tried_once_and_left_pending(
+    mocker, fake_redis_conn, f_consumer_factory, f_job_ids, f_pending_jobs
+):
+    await _push_and_deliver(
+        fake_redis_conn=fake_redis_conn, job_ids=f_job_ids, consumer_name="restarted"
+    )
+    consumer = await f_consumer_factory(name="restarted")
+    handle_jobs = mocker.patch.object(
+        consumer,
+        "_handle_image_face_jobs",
+        return_value={job_id: RuntimeError("detector down") for job_id in f_job_ids},
+    )
+
+    await consumer._consume_own_backlog()
+
+    assert handle_jobs.call_count == 1
+    assert set(handle_jobs.call_args.kwargs["image_face_jobs"]) == set(f_job_ids)
+    assert await _get_pending_count(fake_redis_conn=fake_redis_conn) == len(
+        f_job_ids
+    )
+
+
+class _FakeDetectorBackend:
+    REQUIRES_COLOR = False
+
+    def __init__(self) -> None:
+        self.batch_sizes = []
+
+    def detect_batch(self, imgs, min_sizes):
+        self.batch_sizes.append(len(imgs))
+        return [[[10, 10, 20, 20]] for _ in imgs]
+
+
+@pytest.fixture
+def f_detector_backend(tmp_path, monkeypatch):
+    backend = _FakeDetectorBackend()
+    monkeypatch.setattr(dir_bucket_storage, "STORAGE_DIR", str(tmp_path))
+    # worker task runs in thread of test process, one worker takes whole batch
+    monkeypatch.setattr(engine, "_WORKER_BACKEND", backend)
+    monkeypatch.setattr(detector_engine, "_pool_size", 1)
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        monkeypatch.setattr(detector_engine, "_executor", executor)
+        yield backend
+
+
+async def test_batch_jobs_share_one_detector_inference(
+    mocker, fake_redis_conn, f_consumer_factory, f_job_ids, f_detector_backend
+):
+    face_path = os.path.join(os.path.dirname(__file__), "..", "data", "face.png")
+    with open(face_path, "rb") as face_file:
+        origin_content = face_file.read()
+    origin_filenames = [
+        dir_bucket_storage.write_bytes_sync(
+            data=origin_content,
+            file_kind="png",
+            bucket_name=SETTINGS.origin_images_bucket_name,
+        )
+        for _ in f_job_ids[:-1]
+    ]
+    # last job lost its origin file, it fails alone
+    origin_filenames.append("0" * 32 + ".png")
+    image_face_jobs = [
+        ImageFaceJobEntity(
+            id=uuid.UUID(job_id),
+            created_at=datetime.datetime.now(),
+            modified_at=datetime.datetime.now(),
+            state=constants.ImageFaceJobState.PENDING,
+            origin_filename=origin_filename,
+        )
+        for job_id, origin_filename in zip(f_job_ids, origin_filenames)
+    ]
+    mocker.patch.object(
+        image_face_job_repository, "get_many", return_value=image_face_jobs
+    )
+    bulk_update = mocker.patch.object(
+        image_face_job_repository, "bulk_update", return_value=len(image_face_jobs)
+    )
+    consumer = await f_consumer_factory(name="consumer")
+    await consumer._stream_workers[
+        constants.JobPriority.INTERACTIVE
+    ].push_many_to_stream(data_list=[{"id": job_id} for job_id in f_job_ids])
+
+    await consumer._consume()
+
+    assert f_detector_backend.batch_sizes == [len(f_job_ids) - 1]
+    assert [job.state for job in bulk_update.call_args.kwargs["objs"]] == [
+        constants.ImageFaceJobState.FINISHED,
+        constants.ImageFaceJobState.FINISHED,
+        constants.ImageFaceJobState.ERROR,
+    ]
+    assert all(job.processed_filename for job in image_face_jobs[:-1])
+    assert await _get_pending_count(fake_redis_conn=fake_redis_conn) == 0
@@ -0,0 +1,100 @@
+import collections
+
+import pytest
+
+from face_consumer.consumer import ImageFaceJobProducer
+from face_consumer.lanes import LaneScheduler
+from face_utils import constants
+from face_utils.cache import DetectionResultCache
+from face_utils.settings import SETTINGS
+from face_utils.streams import RedisStreamHandler, RedisStreamWorker
+
+
+INTERACTIVE = constants.JobPriority.INTERACTIVE
+BULK = constants.JobPriority.BULK
+TEST_GROUP_NAME = "test_process_group"
+TEST_STREAM_NAMES = {INTERACTIVE: "test_process", BULK: "test_process_bulk"}
+
+
+def _get_first_lanes(lane_scheduler: LaneScheduler, count: int):
+    return [lane_scheduler.get_order()[0] for _ in range(count)]
+
+
+def test_weighted_lanes_get_reads_by_weights():
+    lane_scheduler = LaneScheduler(weights={INTERACTIVE: 4, BULK: 1}, strict=False)
+
+    first_lanes = _get_first_lanes(lane_scheduler=lane_scheduler, count=50)
+
+    assert collections.Counter(first_lanes) == {INTERACTIVE: 40, BULK: 10}
+    # smooth round robin spreads bulk reads, one in every five
+    for window_start in range(0, 50, 5):
+        assert first_lanes[window_start : window_start + 5].count(BULK) == 1
+
+
+def test_weighted_order_keeps_other_lanes_as_fallback():
+    lane_scheduler = LaneScheduler(weights={INTERACTIVE: 1, BULK: 1}, strict=False)
+
+    assert [lane_scheduler.get_order() for _ in range(2)] == [
+        [INTERACTIVE, BULK],
+        [BULK, INTERACTIVE],
+    ]
+
+
+@pytest.mark.parametrize(
+    "weights,strict",
+    [
+        ({INTERACTIVE: 4, BULK: 1}, True),
+        # no weights, nothing to share - falls back to priority order
+        ({INTERACTIVE: 0, BULK: 0}, False),
+        ({INTERACTIVE: 1, BULK: 0}, False),
+    ],
+)
+def test_lane_without_share_is_never_first(weights, strict):
+    lane_scheduler = LaneScheduler(weights=weights, strict=strict)
+
+    assert [lane_scheduler.get_order() for _ in range(5)] == [[INTERACTIVE, BULK]] * 5
+
+
+@pytest.fixture
+async def f_two_lane_consumer(fake_redis_conn):
+    stream_workers = {
+        priority: await RedisStreamWorker.setup_group(
+            conn=fake_redis_conn,
+            stream_name=stream_name,
+            group_name=TEST_GROUP_NAME,
+            name="consumer",
+        )
+        for priority, stream_name in TEST_STREAM_NAMES.items()
+    }
+    return ImageFaceJobProducer(
+        stream_workers=stream_workers,
+        lane_scheduler=LaneScheduler(weights={INTERACTIVE: 1, BULK: 1}, strict=False),
+        ws_stream_handler=RedisStreamHandler(
+            conn=fake_redis_conn, stream_name="test_ws"
+        ),
+        dead_letter_stream_handler=RedisStreamHandler(
+            conn=fake_redis_conn, stream_name="test_process_dead_letter"
+        ),
+        result_cache=DetectionResultCache(
+            conn=fake_redis_conn, ttl=0, fingerprint="test"
+        ),
+    )
+
+
+async def test_empty_lane_share_goes_to_other_lane(
+    mocker, monkeypatch, fake_redis_conn, f_two_lane_consumer
+):
+    monkeypatch.setattr(SETTINGS, "stream_read_count", 1)
+    consume_lane_batch = mocker.patch.object(
+        f_two_lane_consumer, "_consume_lane_batch", return_value=None
+    )
+    for _ in range(4):
+        await fake_redis_conn.xadd(TEST_STREAM_NAMES[INTERACTIVE], {"data": "{}"})
+
+    for _ in range(4):
+        await f_two_lane_consumer._consume()
+
+    # every other read is bulk turn, empty bulk lane falls through to interactive
+    assert [
+        call.kwargs["priority"] for call in consume_lane_batch.call_args_list
+    ] == [INTERACTIVE] * 4
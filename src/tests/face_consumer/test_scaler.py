@@ -0,0 +1,103 @@
+import pytest
+
+from face_consumer.scaler import (
+    ConsumerScaler,
+    UsageSampler,
+    get_cpu_load_getter,
+    get_loadavg_cpu_load,
+)
+from face_utils import constants
+
+
+@pytest.fixture
+def f_scaler():
+    return ConsumerScaler(
+        consumer_factory=None,
+        stats_workers=[],
+        min_consumers=1,
+        max_consumers=4,
+        read_count=10,
+        cpu_high=0.9,
+        idle_checks=2,
+        detector_busy_high=0.9,
+        get_detector_busy=lambda: 0.0,
+        get_cpu_load=lambda: 0.0,
+    )
+
+
+@pytest.mark.parametrize(
+    "current,backlog,cpu_load,detector_busy,expected",
+    [
+        # backlog over one batch per consumer, spare cpu and workers
+        (1, 11, 0.1, 0.5, 2),
+        (2, 50, 0.1, 0.0, 3),
+        # max reached
+        (4, 100, 0.1, 0.5, 4),
+        # backlog fits in running consumers batches
+        (2, 20, 0.1, 0.5, 2),
+        # detector workers saturated, more reads only queue tasks
+        (1, 100, 0.1, 0.9, 1),
+        (2, 100, 0.1, 1.0, 2),
+        # saturated cpu scales down even with backlog
+        (3, 100, 0.95, 0.5, 2),
+        (1, 100, 0.95, 0.5, 1),
+        # unknown backlog keeps current
+        (2, None, 0.1, 0.5, 2),
+        # first idle check keeps current
+        (2, 0, 0.1, 0.0, 2),
+    ],
+)
+def test_get_target(f_scaler, current, backlog, cpu_load, detector_busy, expected):
+    target = f_scaler.get_target(
+        current=current,
+        backlog=backlog,
+        cpu_load=cpu_load,
+        detector_busy=detector_busy,
+    )
+
+    assert target == expected
+
+
+def test_get_target_scales_down_after_idle_checks_in_row(f_scaler):
+    targets = [
+        f_scaler.get_target(current=3, backlog=backlog, cpu_load=0.1, detector_busy=0)
+        for backlog in [0, 5, 0, 0]
+    ]
+
+    assert targets == [3, 3, 3, 2]
+
+
+def test_usage_sampler_returns_used_share_of_capacity_capped_at_1():
+    usage, now = [0.0], [0.0]
+    sampler = UsageSampler(get_usage=lambda: usage[0], capacity=2, clock=lambda: now[0])
+
+    usage[0], now[0] = 5.0, 5.0
+    assert sampler() == 0.5
+    usage[0], now[0] = 20.0, 10.0
+    assert sampler() == 1.0
+    now[0] = 15.0
+    assert sampler() == 0.0
+
+
+def test_cgroup_cpu_load_uses_container_quota(tmp_path, mocker):
+    (tmp_path / "cpu.stat").write_text("usage_usec 1000000\nuser_usec 800000\n")
+    (tmp_path / "cpu.max").write_text("50000 100000\n")
+    mocker.patch("os.sched_getaffinity", return_value={0, 1, 2, 3})
+    clock = mocker.patch("time.monotonic", return_value=0.0)
+
+    get_cpu_load = get_cpu_load_getter(
+        source=constants.CpuLoadSource.CGROUP, cgroup_dir=str(tmp_path)
+    )
+    # 0.25 s of cpu in 1 s on half cpu quota
+    (tmp_path / "cpu.stat").write_text("usage_usec 1250000\nuser_usec 900000\n")
+    clock.return_value = 1.0
+
+    assert get_cpu_load() == 0.5
+
+
+def test_cpu_load_falls_back_to_loadavg_without_cgroup_stats(tmp_path):
+    get_cpu_load = get_cpu_load_getter(
+        source=constants.CpuLoadSource.CGROUP, cgroup_dir=str(tmp_path)
+    )
+
+    assert get_cpu_load is get_loadavg_cpu_load
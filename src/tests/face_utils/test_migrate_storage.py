@@ -0,0 +1,63 @@
+import os
+
+import pytest
+
+from face_utils.migrate_storage import migrate_bucket
+from face_utils.storage import DirBucketStorage
+
+
+TEST_BUCKET_NAME = "origin"
+FLAT_FILENAMES = ("abcdef12.png", "0123abcd.jpg")
+# write in progress, short id - flat path is its sharded path
+SKIPPED_FILENAMES = (".abcdef99.png.tmp", "ab.png")
+
+
+@pytest.fixture
+def f_storage(tmp_path, monkeypatch):
+    storage = DirBucketStorage(chunk_size=1024, fsync=False)
+    monkeypatch.setattr(storage, "STORAGE_DIR", str(tmp_path))
+    bucket_path = tmp_path / TEST_BUCKET_NAME
+    bucket_path.mkdir()
+    for filename in (*FLAT_FILENAMES, *SKIPPED_FILENAMES):
+        (bucket_path / filename).write_bytes(filename.encode())
+
+    return storage
+
+
+def _get_flat_filenames(storage: DirBucketStorage):
+    bucket_path = storage.get_legacy_file_path("", bucket_name=TEST_BUCKET_NAME)
+    return {entry.name for entry in os.scandir(bucket_path) if entry.is_file()}
+
+
+def test_migrate_bucket_moves_flat_files_to_shard_dirs(f_storage):
+    moved_count = migrate_bucket(storage=f_storage, bucket_name=TEST_BUCKET_NAME)
+
+    assert moved_count == len(FLAT_FILENAMES)
+    assert _get_flat_filenames(storage=f_storage) == set(SKIPPED_FILENAMES)
+    for filename in FLAT_FILENAMES:
+        file_path = f_storage.get_file_path(filename, bucket_name=TEST_BUCKET_NAME)
+        with open(file_path, "rb") as file:
+            assert file.read() == filename.encode()
+
+
+def test_migrate_bucket_rerun_moves_nothing(f_storage):
+    migrate_bucket(storage=f_storage, bucket_name=TEST_BUCKET_NAME)
+
+    assert migrate_bucket(storage=f_storage, bucket_name=TEST_BUCKET_NAME) == 0
+    assert _get_flat_filenames(storage=f_storage) == set(SKIPPED_FILENAMES)
+
+
+def test_migrate_bucket_dry_run_only_counts(f_storage):
+    moved_count = migrate_bucket(
+        storage=f_storage, bucket_name=TEST_BUCKET_NAME, dry_run=True
+    )
+
+    assert moved_count == len(FLAT_FILENAMES)
+    assert _get_flat_filenames(storage=f_storage) == {
+        *FLAT_FILENAMES,
+        *SKIPPED_FILENAMES,
+    }
+
+
+def test_migrate_bucket_skips_missing_bucket(f_storage):
+    assert migrate_bucket(storage=f_storage, bucket_name="missing") == 0
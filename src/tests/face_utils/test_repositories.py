@@ -0,0 +1,96 @@
+import datetime
+import uuid
+
+import pytest
+from tortoise import Tortoise
+
+from face_utils import constants
+from face_utils.entites import ImageFaceJobEntity
+from face_utils.models import ImageFaceJobModel
+from face_utils.repositories import image_face_job_repository
+
+
+@pytest.fixture
+async def sqlite_db():
+    # own in-memory db, unit tests do not need live postgres
+    await Tortoise.init(
+        db_url="sqlite://:memory:", modules={"models": ["face_utils.models"]}
+    )
+    await Tortoise.generate_schemas()
+
+    yield
+
+    await Tortoise.close_connections()
+    await Tortoise._reset_apps()
+
+
+def _build_job(state: constants.ImageFaceJobState) -> ImageFaceJobEntity:
+    return ImageFaceJobEntity(
+        id=uuid.uuid4(),
+        origin_filename="foo.png",
+        created_at=datetime.datetime.now(),
+        modified_at=datetime.datetime.now(),
+        state=state,
+    )
+
+
+async def test_bulk_update_stores_enum_and_json_fields(sqlite_db):
+    jobs = [_build_job(state=constants.ImageFaceJobState.PENDING) for _ in range(2)]
+    await image_face_job_repository.bulk_save(objs=jobs)
+    for job in jobs:
+        job.state = constants.ImageFaceJobState.FINISHED
+        job.coordinates = [[1, 2, 3, 4]]
+
+    updated_count = await image_face_job_repository.bulk_update(
+        objs=jobs, update_fields=["state", "coordinates"]
+    )
+
+    assert updated_count == 2
+    for table_obj in await ImageFaceJobModel.filter(id__in=[job.id for job in jobs]):
+        assert table_obj.state == constants.ImageFaceJobState.FINISHED
+        assert table_obj.coordinates == [[1, 2, 3, 4]]
+
+
+async def test_bulk_update_with_expected_state_keeps_terminal_jobs(sqlite_db):
+    pending_job = _build_job(state=constants.ImageFaceJobState.PENDING)
+    # finished by other consumer while this one processed redelivered msg
+    finished_job = _build_job(state=constants.ImageFaceJobState.FINISHED)
+    await image_face_job_repository.bulk_save(objs=[pending_job, finished_job])
+    for job in (pending_job, finished_job):
+        job.state = constants.ImageFaceJobState.ERROR
+
+    updated_count = await image_face_job_repository.bulk_update(
+        objs=[pending_job, finished_job],
+        update_fields=["state"],
+        expected_state=constants.ImageFaceJobState.PENDING,
+    )
+
+    assert updated_count == 1
+    assert (
+        await ImageFaceJobModel.get(id=pending_job.id)
+    ).state == constants.ImageFaceJobState.ERROR
+    assert (
+        await ImageFaceJobModel.get(id=finished_job.id)
+    ).state == constants.ImageFaceJobState.FINISHED
+
+
+async def test_update_with_expected_null_field_keeps_first_value(sqlite_db):
+    job = _build_job(state=constants.ImageFaceJobState.FINISHED)
+    await image_face_job_repository.bulk_save(objs=[job])
+    job.processed_filename = "first.png"
+    first_updated = await image_face_job_repository.update(
+        obj=job,
+        update_fields=["processed_filename"],
+        expected_null_fields=["processed_filename"],
+    )
+    # render of other backend instance finished later
+    job.processed_filename = "second.png"
+    second_updated = await image_face_job_repository.update(
+        obj=job,
+        update_fields=["processed_filename"],
+        expected_null_fields=["processed_filename"],
+    )
+
+    assert first_updated is True
+    assert second_updated is False
+    assert (await ImageFaceJobModel.get(id=job.id)).processed_filename == "first.png"
@@ -0,0 +1,36 @@
+import os
+import stat
+
+import pytest
+
+from face_utils.storage import DirBucketStorage
+
+
+TEST_BUCKET_NAME = "processed"
+
+
+@pytest.fixture
+def f_fsync_storage(tmp_path, monkeypatch):
+    storage = DirBucketStorage(chunk_size=1024, fsync=True)
+    monkeypatch.setattr(storage, "STORAGE_DIR", str(tmp_path))
+
+    return storage
+
+
+def test_fsync_write_syncs_file_and_its_directory(mocker, f_fsync_storage):
+    synced_kinds = []
+    mocker.patch(
+        "os.fsync",
+        side_effect=lambda fd: synced_kinds.append(
+            "dir" if stat.S_ISDIR(os.fstat(fd).st_mode) else "file"
+        ),
+    )
+
+    filename = f_fsync_storage.write_bytes_sync(
+        data=memoryview(b"content"), file_kind="png", bucket_name=TEST_BUCKET_NAME
+    )
+
+    assert synced_kinds == ["file", "dir"]
+    file_path = f_fsync_storage.get_file_path(filename, bucket_name=TEST_BUCKET_NAME)
+    with open(file_path, "rb") as file:
+        assert file.read() == b"content"
@@ -0,0 +1,73 @@
+from face_utils.streams import RedisStreamTrimmer, StreamTrimPolicy
+
+
+TEST_STREAM_NAME = "test_process"
+
+
+async def _create_stream(conn, entries_count: int) -> None:
+    for entry_i in range(1, entries_count + 1):
+        await conn.xadd(TEST_STREAM_NAME, {"data": "{}"}, id=f"{entry_i}-0")
+
+
+async def _read_group(conn, group_name: str, count: int, ack_count: int) -> None:
+    await conn.xgroup_create(name=TEST_STREAM_NAME, groupname=group_name, id="0-0")
+    readed_data = await conn.xreadgroup(
+        groupname=group_name,
+        consumername="consumer",
+        streams={TEST_STREAM_NAME: ">"},
+        count=count,
+    )
+    msg_ids = [msg_id for msg_id, _ in readed_data[0][1]]
+    if ack_count:
+        await conn.xack(TEST_STREAM_NAME, group_name, *msg_ids[:ack_count])
+
+
+async def _get_stream_ids(conn):
+    return [msg_id.decode() for msg_id, _ in await conn.xrange(TEST_STREAM_NAME)]
+
+
+async def test_trim_keeps_pending_and_undelivered_entries_of_all_groups(
+    fake_redis_conn,
+):
+    await _create_stream(conn=fake_redis_conn, entries_count=10)
+    # read all, 4-0 .. 10-0 delivered but not acked
+    await _read_group(
+        conn=fake_redis_conn, group_name="pending_group", count=10, ack_count=3
+    )
+    # read and acked up to 5-0, 6-0 .. 10-0 not delivered yet
+    await _read_group(
+        conn=fake_redis_conn, group_name="lagging_group", count=5, ack_count=5
+    )
+    trimmer = RedisStreamTrimmer(
+        conn=fake_redis_conn,
+        stream_name=TEST_STREAM_NAME,
+        # age policy alone would drop whole stream
+        trim_policy=StreamTrimPolicy(min_id_age_seconds=0),
+    )
+
+    # approximate XTRIM keeps whole macro node, small stream is not trimmed at all
+    assert await trimmer._get_safe_min_id() == "4-0"
+
+    await trimmer.trim()
+
+    stream_ids = await _get_stream_ids(conn=fake_redis_conn)
+    assert stream_ids[-7:] == [f"{entry_i}-0" for entry_i in range(4, 11)]
+
+
+async def test_trim_keeps_stream_of_group_without_reads(fake_redis_conn):
+    await _create_stream(conn=fake_redis_conn, entries_count=5)
+    await _read_group(
+        conn=fake_redis_conn, group_name="done_group", count=5, ack_count=5
+    )
+    await fake_redis_conn.xgroup_create(
+        name=TEST_STREAM_NAME, groupname="new_group", id="0-0"
+    )
+    trimmer = RedisStreamTrimmer(
+        conn=fake_redis_conn,
+        stream_name=TEST_STREAM_NAME,
+        trim_policy=StreamTrimPolicy(min_id_age_seconds=0),
+    )
+
+    assert await trimmer._get_safe_min_id() == "0-0"
+    assert await trimmer.trim() == 0
+    assert len(await _get_stream_ids(conn=fake_redis_conn)) == 5